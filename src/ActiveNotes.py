@@ -0,0 +1,179 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# JMMidiBassPedalController v3.0
+# File: src/ActiveNotes.py
+# By:   Josef Meile <jmeile@hotmail.com> @ 28.10.2020
+# This project is licensed under the MIT License. Please see the LICENSE.md file
+# on the main folder of this code. An online version can be found here:
+# https://github.com/jmeile/JMMidiBassPedalController/blob/master/LICENSE.md
+#
+"""Keeps track of the notes sounding on a MIDI OUT interface."""
+
+from rtmidi.midiconstants import NOTE_OFF, NOTE_ON, CONTROL_CHANGE, \
+                                 ALL_SOUND_OFF, ALL_NOTES_OFF, SYSTEM_RESET
+
+#Number of bytes of the bitmap used by each channel: one bit per note
+CHANNEL_SIZE = 128 // 8
+
+#Release velocity of the NOTE OFF messages sent for the sounding notes; it is
+#the one recommended by the MIDI specification for devices without release
+#velocity
+NOTE_OFF_VELOCITY = 0x40
+
+class ActiveNotes:
+  """
+  Bitmap with the notes that are sounding on each of the 16 MIDI channels
+  Remarks:
+  * Each channel takes 16 bytes; the bit of a note is the bit "note & 7" of the
+    byte "channel * 16 + note // 8"
+  * The notes aren't counted: if the same note was started twice, then one
+    NOTE OFF message stops it. This is how most synthesizers behave
+  """
+
+  def __init__(self):
+    """
+    Initializes the class attributes
+    """
+    self._bitmap = bytearray(16 * CHANNEL_SIZE)
+
+  def __len__(self):
+    """
+    Returns the number of sounding notes
+    """
+    return sum(bin(bits).count('1') for bits in self._bitmap if bits != 0)
+
+  def __repr__(self):
+    return repr(self.get_notes())
+
+  def is_active(self, channel, note):
+    """
+    Returns True if the entered note is sounding on the given channel
+    Parameters:
+    * channel: MIDI channel from 0 to 15
+    * note: MIDI note from 0 to 127
+    """
+    return (self._bitmap[channel * CHANNEL_SIZE + (note >> 3)] >> \
+            (note & 7)) & 1 == 1
+
+  def add(self, channel, note):
+    """
+    Marks the entered note as sounding
+    Parameters:
+    * channel: MIDI channel from 0 to 15
+    * note: MIDI note from 0 to 127
+    """
+    self._bitmap[channel * CHANNEL_SIZE + (note >> 3)] |= 1 << (note & 7)
+
+  def update(self, message):
+    """
+    Updates the bitmap with a message that is being sent
+    Parameters:
+    * message: MIDI message or SysEx chunk
+    Remarks:
+    * NOTE ON messages with a velocity bigger than zero start a note; NOTE
+      OFF messages and NOTE ON messages with zero velocity stop it. ALL SOUND
+      OFF and ALL NOTES OFF stop all the notes of their channel, and SYSTEM
+      RESET the ones of all channels. Other messages are ignored
+    """
+    status = message[0]
+    if status < NOTE_OFF:
+      #SysEx chunk
+      return
+    if status < NOTE_ON + 16:
+      if len(message) < 3:
+        return
+      note = message[1]
+      index = (status & 0x0F) * CHANNEL_SIZE + (note >> 3)
+      if (status >= NOTE_ON) and (message[2] > 0):
+        self._bitmap[index] |= 1 << (note & 7)
+      else:
+        self._bitmap[index] &= ~(1 << (note & 7)) & 0xFF
+    elif status & 0xF0 == CONTROL_CHANGE:
+      if (len(message) > 2) and \
+         ((message[1] == ALL_SOUND_OFF) or (message[1] == ALL_NOTES_OFF)):
+        start = (status & 0x0F) * CHANNEL_SIZE
+        self._bitmap[start:start + CHANNEL_SIZE] = bytes(CHANNEL_SIZE)
+    elif status == SYSTEM_RESET:
+      self.clear()
+
+  def clear(self):
+    """
+    Marks all the notes as stopped
+    """
+    self._bitmap[:] = bytes(len(self._bitmap))
+
+  def get_notes(self, keep_notes = None):
+    """
+    Gets the sounding notes
+    Parameters:
+    * keep_notes: ActiveNotes object with notes that will be skipped. If None,
+      then all the sounding notes will be returned
+    Returns:
+    * A list with tuples: (channel, note)
+    """
+    notes = []
+    keep_bitmap = None
+    if keep_notes != None:
+      keep_bitmap = keep_notes._bitmap
+    for index, bits in enumerate(self._bitmap):
+      if (bits != 0) and (keep_bitmap != None):
+        bits &= ~keep_bitmap[index]
+      if bits == 0:
+        continue
+      channel = index // CHANNEL_SIZE
+      first_note = (index % CHANNEL_SIZE) << 3
+      for bit in range(8):
+        if (bits >> bit) & 1:
+          notes.append((channel, first_note + bit))
+    return notes
+
+  def get_notes_off(self, keep_notes = None):
+    """
+    Gets the NOTE OFF messages that stop the sounding notes
+    Parameters:
+    * keep_notes: see: get_notes
+    Returns:
+    * A list with the NOTE OFF messages
+    """
+    return [[NOTE_OFF | channel, note, NOTE_OFF_VELOCITY]
+            for channel, note in self.get_notes(keep_notes)]
+
+class ActiveNoteTracker(ActiveNotes):
+  """
+  Wraps a MIDI OUT interface, ie: a rtmidi.MidiOut or a MidiOutputScheduler,
+  and updates the bitmap with each message sent to it
+  """
+
+  def __init__(self, midi_out = None):
+    """
+    Initializes the class attributes
+    Parameters:
+    * midi_out: MIDI OUT interface where the messages will be sent
+    """
+    super().__init__()
+    self.set_midi_out(midi_out)
+
+  def set_midi_out(self, midi_out):
+    """
+    Replaces the MIDI OUT interface, ie: after reconnecting a MIDI device. The
+    bitmap is kept, so that the notes started before can still be stopped
+    """
+    self._midi_out = midi_out
+    self._send = None
+    if midi_out != None:
+      self._send = midi_out.send_message
+
+  def send_message(self, message, lane = None):
+    """
+    Sends a message and updates the bitmap
+    Parameters:
+    * message: MIDI message to send
+    * lane: priority lane of the message if the interface is a
+      MidiOutputScheduler; otherwise, it must be None
+    """
+    self.update(message)
+    if lane == None:
+      self._send(message)
+    else:
+      self._send(message, lane)
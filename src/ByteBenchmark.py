@@ -0,0 +1,211 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# JMMidiBassPedalController v3.0
+# File: src/ByteBenchmark.py
+# By:   Josef Meile <jmeile@hotmail.com> @ 28.10.2020
+# This project is licensed under the MIT License. Please see the LICENSE.md file
+# on the main folder of this code. An online version can be found here:
+# https://github.com/jmeile/JMMidiBassPedalController/blob/master/LICENSE.md
+#
+"""
+Helper script to measure the 7 bit byte conversions of the ByteUtilities
+module.
+
+Random data from 16 bytes until 1 MiB will be converted to 7 bit bytes and back
+with:
+* python: the table based conversions.
+* numpy: the vectorized conversions. They will be skipped if NumPy isn't
+  installed.
+* legacy: the byte by byte conversions of the previous versions. Their time
+  grows quadratically, so, they will be only run for small inputs.
+
+Before measuring, the results of all the implementations will be compared; the
+script will fail if they differ.
+
+Run the script as follows:
+python ByteBenchmark.py -h
+
+There you will see the diferent command-line options supported by the script.
+"""
+
+from __future__ import print_function
+import argparse
+from argparse import ArgumentParser
+from argparse import RawTextHelpFormatter
+import random
+import sys
+import timeit
+import ByteUtilities
+from ByteUtilities import convert_to_7_bit_bytes, convert_from_7_bit_bytes
+
+#Sizes in bytes of the converted data
+DATA_SIZES = [16, 256, 4096, 65536, 1048576]
+
+def legacy_convert_to_7_bit_bytes(source_bytes):
+  """
+  convert_to_7_bit_bytes as it was on the previous versions
+  """
+  msb = 0xC0
+  lsb = 0x3F
+  #Control byte
+  cbt = 0x40
+  byte_array = b''
+  for byte in source_bytes:
+    full_bytes = []
+    if (byte >= 0x40):
+      rest_bits = lsb & byte
+      first_byte = cbt | rest_bits
+      full_bytes.append(first_byte)
+      control_bits = (msb & byte) >> 2
+      second_byte = cbt | control_bits
+      full_bytes.append(second_byte)
+    else:
+      full_bytes.append(byte)
+
+    byte_array += bytes(full_bytes)
+  return byte_array
+
+def legacy_convert_from_7_bit_bytes(source_bytes):
+  """
+  convert_from_7_bit_bytes as it was on the previous versions
+  """
+  lsb = 0x3F
+  #Control byte
+  cbt = 0x30
+  current_byte = 0
+  num_bytes = len(source_bytes)
+  byte_array = b''
+  while current_byte < num_bytes:
+    full_bytes = b''
+    byte = source_bytes[current_byte]
+    if (byte > 0x3F) and (current_byte + 1 < num_bytes):
+      next_byte = source_bytes[current_byte + 1]
+      if next_byte in [0x50, 0x60, 0x70]:
+        control_bits = (next_byte & cbt) << 2
+        byte = (lsb & byte) | control_bits
+        current_byte += 1
+    elif (byte > 0x3F):
+      raise Exception("Missing control byte, either: 0x50, 0x60, or 0x70")
+
+    byte_array += bytes([byte])
+    current_byte += 1
+  return byte_array
+
+class ByteBenchmarkArgumentParser(ArgumentParser):
+  """
+  ArgumentParser for the byte benchmark application
+
+  Remarks:
+  - The byte benchmark application will accept the following command line
+    options:
+    * --legacy-max-size: biggest input converted with the legacy functions.
+    * --repeat: number of times that each measurement will be repeated.
+  """
+
+  def __init__(self, description = "Measures the 7 bit byte conversions"):
+    """
+    Setups the ArgumentParser of the byte benchmark program
+
+    Parameters:
+    * description: description of what the program is doing
+    """
+    self._parser = ArgumentParser(description = description,
+      formatter_class = RawTextHelpFormatter, add_help = False)
+
+  def add_arguments(self,
+                    main_help = "Shows this help message and exits",
+                    legacy_max_size_help = "Biggest input in bytes that will "
+                    "be converted with the legacy\nfunctions. It defaults to "
+                    "65536",
+                    repeat_help = "Number of times that each measurement "
+                    "will be repeated; the\nbest time will be shown. It "
+                    "defaults to 3"):
+    """
+    Adds the command line options and commands to the argument parser
+
+    Parameters:
+    * main_help: text of the -h, --help option
+    * legacy_max_size_help: help of the "--legacy-max-size" command line option
+    * repeat_help: help of the "--repeat" command line option
+    """
+    self._parser.add_argument("-h", "--help", action = "help",
+      default = argparse.SUPPRESS, help = main_help)
+
+    self._parser.add_argument("-l", "--legacy-max-size", type = int,
+                              default = 65536, help = legacy_max_size_help)
+    self._parser.add_argument("-r", "--repeat", type = int, default = 3,
+                              help = repeat_help)
+
+  def parse_arguments(self):
+    """
+    Validates the supplied command line options. It will show an error
+    message if the vaildation failed and then it will exit
+    """
+    return self._parser.parse_args()
+
+def get_implementations(data_size, legacy_max_size):
+  """
+  Gets the conversion functions to measure for the entered size
+  Parameters:
+  * data_size: size in bytes of the data to convert
+  * legacy_max_size: biggest size converted with the legacy functions
+  Returns:
+  * A list with tuples: (name, to 7 bit function, from 7 bit function)
+  """
+  implementations = [
+    ('python', lambda data: convert_to_7_bit_bytes(data, use_numpy = False),
+     lambda data: convert_from_7_bit_bytes(data, use_numpy = False))
+  ]
+  if ByteUtilities._get_numpy() != None:
+    implementations.append(
+      ('numpy', lambda data: convert_to_7_bit_bytes(data, use_numpy = True),
+       lambda data: convert_from_7_bit_bytes(data, use_numpy = True)))
+  if data_size <= legacy_max_size:
+    implementations.append(('legacy', legacy_convert_to_7_bit_bytes,
+                            legacy_convert_from_7_bit_bytes))
+  return implementations
+
+def measure(function, data, repeat):
+  """
+  Measures a conversion function
+  Parameters:
+  * function: function to measure
+  * data: data to convert
+  * repeat: number of times that the measurement will be repeated
+  Returns:
+  * The best time of one conversion in seconds
+  """
+  timer = timeit.Timer(lambda: function(data))
+  number = timer.autorange()[0]
+  return min(timer.repeat(repeat = repeat, number = number)) / number
+
+if __name__ == "__main__":
+  parser = ByteBenchmarkArgumentParser()
+  parser.add_arguments()
+  args = parser.parse_arguments()
+
+  random.seed(0)
+  if ByteUtilities._get_numpy() == None:
+    print("NumPy isn't installed; its conversions will be skipped")
+  failed = False
+  for data_size in DATA_SIZES:
+    source_bytes = bytes(random.getrandbits(8) for index in range(data_size))
+    implementations = get_implementations(data_size, args.legacy_max_size)
+    expected_bytes = implementations[0][1](source_bytes)
+    print("%d bytes (%d converted bytes):" % (data_size, len(expected_bytes)))
+    for name, to_7_bit, from_7_bit in implementations:
+      converted_bytes = to_7_bit(source_bytes)
+      if (converted_bytes != expected_bytes) or \
+         (from_7_bit(converted_bytes) != source_bytes):
+        print("  %-8s FAILED: the results differ" % name)
+        failed = True
+        continue
+      to_time = measure(to_7_bit, source_bytes, args.repeat)
+      from_time = measure(from_7_bit, converted_bytes, args.repeat)
+      print("  %-8s to 7 bit: %10.1f us (%7.2f MiB/s), from 7 bit: %10.1f us "
+            "(%7.2f MiB/s)" % (name, to_time * 1e6,
+            data_size / 1048576.0 / to_time, from_time * 1e6,
+            data_size / 1048576.0 / from_time))
+  if failed:
+    sys.exit(1)
@@ -10,12 +10,127 @@
 #
 """Module with some byte manipulation utilities."""
 
-def convert_to_7_bit_bytes(source_bytes):
+import re
+
+#Minimum number of bytes for converting them with NumPy; for shorter inputs,
+#the overhead of creating the arrays is bigger than the gain
+NUMPY_MIN_SIZE = 16384
+
+#Manufacturer ID of the SysEx messages of the controller; it is the ID for
+#research and non commercial purposes
+SYSEX_MANUFACTURER_ID = 0x7D
+
+#Operation IDs of the SysEx messages of the controller:
+#* BANK_LIST_OPERATION: all the bank names on one message
+#* BANK_LIST_REQUEST_OPERATION: asks for the names of a range of banks
+#* BANK_LIST_PAGE_OPERATION: a page with some of the requested bank names
+BANK_LIST_OPERATION = 0x00
+BANK_LIST_REQUEST_OPERATION = 0x01
+BANK_LIST_PAGE_OPERATION = 0x02
+
+#Maximum number of bank names on each page of the bank list
+BANK_LIST_PAGE_SIZE = 8
+
+#NumPy module. It will be only imported when it is needed; False means that it
+#isn't installed
+_numpy = None
+
+def _build_7_bit_table():
+  """
+  Builds the table used to convert the bytes to 7 bit bytes
+  Returns:
+  * A tuple with 256 elements: the 7 bit representation of each byte
+  """
+  msb = 0xC0
+  lsb = 0x3F
+  #Control byte
+  cbt = 0x40
+  table = []
+  for byte in range(256):
+    if (byte >= 0x40):
+      rest_bits = lsb & byte
+      control_bits = (msb & byte) >> 2
+      table.append(bytes([cbt | rest_bits, cbt | control_bits]))
+    else:
+      table.append(bytes([byte]))
+  return tuple(table)
+
+#7 bit representation of each byte
+_TO_7_BIT_TABLE = _build_7_bit_table()
+
+#Bytes needing a control byte when converted to 7 bit bytes
+_HIGH_BYTES = bytes(range(0x40, 0x100))
+
+#Splits 7 bit bytes into tokens: either a byte followed by its control byte or
+#a single byte
+_FROM_7_BIT_PATTERN = re.compile(rb'[\x40-\xff][\x50\x60\x70]|[\x00-\xff]')
+
+def _build_8_bit_table():
+  """
+  Builds the table used to convert the 7 bit bytes back to bytes
+  Returns:
+  * A dictionary with the 8 bit byte of each token of _FROM_7_BIT_PATTERN
+  """
+  lsb = 0x3F
+  #Control byte
+  cbt = 0x30
+  table = {}
+  for byte in range(256):
+    table[bytes([byte])] = bytes([byte])
+    if (byte > 0x3F):
+      for control_byte in [0x50, 0x60, 0x70]:
+        control_bits = (control_byte & cbt) << 2
+        table[bytes([byte, control_byte])] = bytes([(lsb & byte) |
+                                                    control_bits])
+  return table
+
+#8 bit byte of each 7 bit byte token
+_FROM_7_BIT_TABLE = _build_8_bit_table()
+
+def _get_numpy():
+  """
+  Imports NumPy the first time it is needed
+  Returns:
+  * The numpy module or None if it isn't installed
+  """
+  global _numpy
+  if _numpy == None:
+    try:
+      import numpy as _numpy
+    except ImportError:
+      _numpy = False
+  if _numpy == False:
+    return None
+  return _numpy
+
+def _use_numpy(source_bytes, use_numpy):
+  """
+  Decides whether or not to convert the entered bytes with NumPy
+  Parameters:
+  * source_bytes: bytes to convert
+  * use_numpy: True to use NumPy, False to avoid it, or None to use it only if
+    it is installed and there are at least NUMPY_MIN_SIZE bytes
+  Returns:
+  * The numpy module or None if it won't be used
+  """
+  if use_numpy == False:
+    return None
+  numpy = _get_numpy()
+  if use_numpy == True:
+    if numpy == None:
+      raise Exception("NumPy isn't installed")
+  elif len(source_bytes) < NUMPY_MIN_SIZE:
+    return None
+  return numpy
+
+def convert_to_7_bit_bytes(source_bytes, use_numpy = None):
   """
   Converts the entered bytes to a 7 bit bytes representation.
 
   Parameters:
   * source_bytes: 8 bit byte array to be converted to 7 bit byte
+  * use_numpy: True to convert the bytes with NumPy, False to avoid it, or None
+    to use it only for big inputs if it is installed
   
   Returns:
   * A byte array with the 7 bit byte converted data
@@ -29,56 +144,101 @@ def convert_to_7_bit_bytes(source_bytes):
     through MIDI; this protocol is unfortunatelly limited to values until: 127
     (or 7F in hex or 0111 1111 in binary), so bigger unicode values won't fit.
     For this reason, the data needs to be convert to 7 bit bytes.
+  * Bytes lower than 0x40 are kept. Any other byte is converted to two bytes:
+    0x40 plus its six lower bits, followed by a control byte: 0x40 plus its
+    two higher bits shifted to the right by two bits, ie: 0x50, 0x60, or 0x70.
+    The 7 bit representation of each byte is taken from a table, so, the time
+    needed grows linearly with the length of the data.
   """
-  msb = 0xC0
-  lsb = 0x3F
-  #Control byte
-  cbt = 0x40
-  byte_array = b''
-  for byte in source_bytes:
-    full_bytes = []
-    if (byte >= 0x40):
-      rest_bits = lsb & byte
-      first_byte = cbt | rest_bits
-      full_bytes.append(first_byte)
-      control_bits = (msb & byte) >> 2
-      second_byte = cbt | control_bits
-      full_bytes.append(second_byte)
-    else:
-      full_bytes.append(byte)
-    
-    byte_array += bytes(full_bytes)
-  return byte_array
-  
-def convert_from_7_bit_bytes(source_bytes):
+  numpy = _use_numpy(source_bytes, use_numpy)
+  if numpy != None:
+    return _convert_to_7_bit_bytes_numpy(numpy, source_bytes)
+  return b''.join(map(_TO_7_BIT_TABLE.__getitem__, source_bytes))
+
+def _convert_to_7_bit_bytes_numpy(numpy, source_bytes):
+  """
+  Vectorized version of convert_to_7_bit_bytes
+  Parameters:
+  * numpy: numpy module
+  * source_bytes: 8 bit byte array to be converted to 7 bit byte
+  Returns:
+  * A byte array with the 7 bit byte converted data
+  """
+  data = numpy.frombuffer(bytes(source_bytes), dtype = numpy.uint8)
+  is_high = data >= 0x40
+  #Position of the first converted byte of each source byte: each previous
+  #byte needing a control byte moves it one byte to the right
+  positions = numpy.arange(len(data)) + numpy.cumsum(is_high) - is_high
+  converted = numpy.empty(len(data) + numpy.count_nonzero(is_high),
+                          dtype = numpy.uint8)
+  converted[positions] = numpy.where(is_high, 0x40 | (data & 0x3F), data)
+  converted[positions[is_high] + 1] = 0x40 | ((data[is_high] & 0xC0) >> 2)
+  return converted.tobytes()
+
+def convert_from_7_bit_bytes(source_bytes, use_numpy = None):
   """
   Converts a 7 bit byte array to a 8 bit byte array
+
+  Parameters:
+  * source_bytes: 7 bit byte array to be converted to 8 bit byte
+  * use_numpy: True to convert the bytes with NumPy, False to avoid it, or None
+    to use it only for big inputs if it is installed
   
   Remarks:
   * Once the 7 bit byte data is transmitted through MIDI, you need to convert it
     back to 8 bit bytes in order to read the unicode strings
+  * The data is split from the left to the right into tokens: each byte bigger
+    than 0x3F followed by a control byte: 0x50, 0x60, or 0x70, is a token;
+    any other byte is a token as well. The 8 bit byte of each token is then
+    taken from a table. If the last token is a single byte bigger than 0x3F,
+    then an exception will be raised since its control byte is missing.
   """
-  lsb = 0x3F
-  #Control byte
-  cbt = 0x30
-  current_byte = 0
-  num_bytes = len(source_bytes)
-  byte_array = b''
-  while current_byte < num_bytes:
-    full_bytes = b''
-    byte = source_bytes[current_byte]
-    if (byte > 0x3F) and (current_byte + 1 < num_bytes):
-      next_byte = source_bytes[current_byte + 1]
-      if next_byte in [0x50, 0x60, 0x70]:
-        control_bits = (next_byte & cbt) << 2
-        byte = (lsb & byte) | control_bits
-        current_byte += 1      
-    elif (byte > 0x3F):
-      raise Exception("Missing control byte, either: 0x50, 0x60, or 0x70")
-    
-    byte_array += bytes([byte])
-    current_byte += 1
-  return byte_array
+  if not isinstance(source_bytes, (bytes, bytearray)):
+    source_bytes = bytes(source_bytes)
+  numpy = _use_numpy(source_bytes, use_numpy)
+  if numpy != None:
+    return _convert_from_7_bit_bytes_numpy(numpy, source_bytes)
+  tokens = _FROM_7_BIT_PATTERN.findall(source_bytes)
+  if (tokens != []) and (len(tokens[-1]) == 1) and (tokens[-1][0] > 0x3F):
+    raise Exception("Missing control byte, either: 0x50, 0x60, or 0x70")
+  return b''.join(map(_FROM_7_BIT_TABLE.__getitem__, tokens))
+
+def _convert_from_7_bit_bytes_numpy(numpy, source_bytes):
+  """
+  Vectorized version of convert_from_7_bit_bytes
+  Parameters:
+  * numpy: numpy module
+  * source_bytes: 7 bit byte array to be converted to 8 bit byte
+  Returns:
+  * A byte array with the 8 bit byte converted data
+  """
+  data = numpy.frombuffer(source_bytes, dtype = numpy.uint8)
+  num_bytes = len(data)
+  if num_bytes == 0:
+    return b''
+  is_high = data > 0x3F
+  is_control = (data == 0x50) | (data == 0x60) | (data == 0x70)
+  #Bytes that can be joined with the next one
+  is_candidate = numpy.zeros(num_bytes, dtype = bool)
+  is_candidate[:-1] = is_high[:-1] & is_control[1:]
+  #Control bytes are also candidates, so, on a sequence of candidates, only the
+  #first one, the third one, and so on, are joined with the next byte; the
+  #others are their control bytes
+  indexes = numpy.arange(num_bytes)
+  is_sequence_start = is_candidate.copy()
+  is_sequence_start[1:] &= ~is_candidate[:-1]
+  sequence_starts = numpy.where(is_sequence_start, indexes, 0)
+  numpy.maximum.accumulate(sequence_starts, out = sequence_starts)
+  is_joined = is_candidate & (((indexes - sequence_starts) & 1) == 0)
+  is_control_byte = numpy.zeros(num_bytes, dtype = bool)
+  is_control_byte[1:] = is_joined[:-1]
+  if is_high[-1] and not is_control_byte[-1]:
+    raise Exception("Missing control byte, either: 0x50, 0x60, or 0x70")
+  next_bytes = numpy.zeros(num_bytes, dtype = numpy.uint8)
+  next_bytes[:-1] = data[1:]
+  converted = numpy.where(is_joined,
+                          (data & 0x3F) | ((next_bytes & 0x30) << 2), data)
+  return converted[~is_control_byte].tobytes()
   
 def convert_unicode_to_7_bit_bytes(source_str, encoding = 'UTF-8'):
   """
@@ -93,6 +253,38 @@ def convert_unicode_to_7_bit_bytes(source_str, encoding = 'UTF-8'):
   source_bytes = source_str.encode(encoding = encoding)
   return convert_to_7_bit_bytes(source_bytes)
   
+def convert_unicode_list_to_7_bit_bytes(source_strs, encoding = 'UTF-8',
+                                        use_numpy = None):
+  """
+  Converts several unicode strings, ie: the names of all the banks, to their 7
+  bit bytes representation at once.
+  
+  Parameters:
+  * source_strs: list with the strings to convert
+  * encoding: encoding used by the entered strings
+  * use_numpy: see: convert_to_7_bit_bytes
+  
+  Returns a list with the byte array of each string converted to 7 bit bytes
+  
+  Remarks:
+  * All the strings are joined and converted together, so that NumPy can be
+    used when their total length is big enough. Each byte is converted on its
+    own, so, the result is the same as converting each string separately.
+  """
+  source_bytes_lst = [source_str.encode(encoding = encoding)
+                      for source_str in source_strs]
+  converted_bytes = convert_to_7_bit_bytes(b''.join(source_bytes_lst),
+                                           use_numpy = use_numpy)
+  converted_lst = []
+  start = 0
+  for source_bytes in source_bytes_lst:
+    #Each byte needing a control byte is converted to two bytes
+    end = start + 2 * len(source_bytes) - \
+          len(source_bytes.translate(None, _HIGH_BYTES))
+    converted_lst.append(converted_bytes[start:end])
+    start = end
+  return converted_lst
+  
 def convert_unicode_from_7_bit_bytes(source_bytes, encoding = "UTF-8"):
   """
   Converts a 7 bit byte array to its unicode representation
@@ -156,4 +348,266 @@ def calculate_checksum(source_bytes):
   for byte in source_bytes:
     total_byte_sum += byte
     
-  return 128 - (total_byte_sum % 128)
\ No newline at end of file
+  return 128 - (total_byte_sum % 128)
+  
+def calculate_page_checksum(byte_sum):
+  """
+  Calculates the checksum of a page of the bank list.
+  
+  Parameters:
+  * byte_sum: sum of the page bytes, without its SysEx header: F0 7D 02
+  
+  Returns the calculated checksum
+  
+  Remarks:
+  * Unlike calculate_checksum, the result is always between 0 and 127, so,
+    it is a valid SysEx data byte:
+    checksum = (128 - (sum(data) % 128)) % 128
+  """
+  return (128 - (byte_sum % 128)) % 128
+  
+def build_bank_list_pages(encoded_names, first_bank = 0,
+                          page_size = BANK_LIST_PAGE_SIZE):
+  """
+  Builds the pages of the bank list with the entered names.
+  
+  Parameters:
+  * encoded_names: list with a tuple for each bank name: its lengths followed
+    by its bytes, as returned by convert_byte_array_to_list, and the sum of
+    those values
+  * first_bank: index of the bank of the first name
+  * page_size: maximum number of names on each page
+  
+  Returns a list with the SysEx messages of the pages. There is always at
+  least one page, even if there aren't names
+  
+  Remarks:
+  * Each page has the form:
+    F0 7D 02 (page) (pages) (bank) (length1.1) ... (bank_name1) ...
+             (checksum) F7
+    where page is the zero based index of the page, pages is the number of
+    pages, and bank is the index of the bank of its first name. The names are
+    encoded as on the bank list message: F0 7D 00. The checksum is calculated
+    with calculate_page_checksum over the page, the number of pages, the bank,
+    the lengths, and the names.
+  """
+  num_pages = max(1, (len(encoded_names) + page_size - 1) // page_size)
+  pages = []
+  for page_index in range(num_pages):
+    page_names = encoded_names[page_index * page_size:
+                               (page_index + 1) * page_size]
+    page_header = [page_index, num_pages, first_bank + page_index * page_size]
+    byte_sum = sum(page_header)
+    page = [0xF0, SYSEX_MANUFACTURER_ID, BANK_LIST_PAGE_OPERATION] + \
+           page_header
+    for name_sysex, name_byte_sum in page_names:
+      page += name_sysex
+      byte_sum += name_byte_sum
+    page += [calculate_page_checksum(byte_sum), 0xF7]
+    pages.append(page)
+  return pages
+  
+class BankListDecoder:
+  """
+  Decodes the bank list SysEx messages of the controller while their chunks
+  are being received, so that each bank name is available as soon as its
+  last byte arrives instead of when the whole message is complete.
+  
+  Remarks:
+  * The following messages are decoded:
+    - F0 7D 00 ... F7: the bank list with all the names.
+    - F0 7D 01 (bank) (banks) F7: a request for the names of the entered
+      number of banks starting with the entered zero based bank index. Both
+      values are optional; if the number of banks is zero or it is missing,
+      then all the names starting at the entered bank are requested.
+    - F0 7D 02 ... F7: a page of the bank list. See: build_bank_list_pages
+  * Other SysEx messages are skipped; only the first and the last byte of
+    their chunks are checked.
+  """
+  
+  def __init__(self, encoding = 'UTF-8', decode_names = True):
+    """
+    Initializes the class attributes
+    Parameters:
+    * encoding: encoding of the bank names
+    * decode_names: if False, then only the requests will be decoded; the bank
+      lists and their pages will be skipped
+    """
+    self._encoding = encoding
+    self._decode_names = decode_names
+    self.reset()
+  
+  def reset(self):
+    """
+    Discards the message that is being decoded
+    """
+    #SysEx header: F0 7D (operation) plus the page header or the request
+    self._header = []
+    self._operation = None
+    self._skipping = False
+    self._complete = False
+    #Last received byte; it is the checksum if the next one is F7
+    self._pending_byte = None
+    self._byte_sum = 0
+    self._name_length = 0
+    self._remaining_bytes = 0
+    self._name_bytes = bytearray()
+    self._bank_number = 0
+  
+  def get_operation(self):
+    """
+    Returns the operation ID of the current message or None if it isn't a bank
+    list message of the controller or its operation wasn't received yet
+    """
+    if self._skipping:
+      return None
+    return self._operation
+  
+  def is_complete(self):
+    """
+    Returns True if the end of the current message was received
+    """
+    return self._complete
+  
+  def get_request(self):
+    """
+    Gets the range of banks asked by a complete request
+    Returns:
+    * A tuple with the index of the first bank and the number of banks, which
+      is zero if all the banks starting at the first one were requested
+    """
+    parameters = self._header[3:5] + [0, 0]
+    return parameters[0], parameters[1]
+  
+  def get_page(self):
+    """
+    Gets the position of a page of the bank list
+    Returns:
+    * A tuple with the zero based index of the page and the number of pages.
+      A bank list message with all the names is returned as: (0, 1)
+    """
+    if self._operation == BANK_LIST_PAGE_OPERATION:
+      return self._header[3], self._header[4]
+    return 0, 1
+  
+  def feed(self, chunk):
+    """
+    Decodes a chunk of a SysEx message
+    Parameters:
+    * chunk: sequence with the bytes of the chunk. A chunk starting with 0xF0
+      begins a new message
+    Returns:
+    * A list with a tuple for each bank name completed by this chunk: the zero
+      based bank index and its name
+    Remarks:
+    * An exception will be raised if a bank list is malformed or its checksum
+      is wrong. The rest of that message will be skipped
+    """
+    if len(chunk) == 0:
+      return []
+    if chunk[0] == 0xF0:
+      self.reset()
+    elif self._complete or (self._header == []):
+      #Chunk of a message whose beginning wasn't received
+      self.reset()
+      self._skipping = True
+    if self._skipping:
+      self._complete = (chunk[-1] == 0xF7)
+      return []
+    
+    bank_names = []
+    try:
+      for byte in chunk:
+        if byte == 0xF7:
+          self._end_message()
+          break
+        if len(self._header) < 3 or \
+           (self._operation == BANK_LIST_REQUEST_OPERATION) or \
+           ((self._operation == BANK_LIST_PAGE_OPERATION) and \
+            (len(self._header) < 6)):
+          self._add_header_byte(byte)
+          if self._skipping:
+            self._complete = (chunk[-1] == 0xF7)
+            break
+        else:
+          if self._pending_byte != None:
+            self._add_name_byte(self._pending_byte, bank_names)
+          self._pending_byte = byte
+    except Exception:
+      self._skipping = True
+      self._complete = (chunk[-1] == 0xF7)
+      raise
+    return bank_names
+  
+  def _add_header_byte(self, byte):
+    """
+    Adds a byte of the header of the message
+    Parameters:
+    * byte: received byte
+    Remarks:
+    * If the message isn't a bank list message of the controller, then the
+      rest of it will be skipped
+    """
+    header_index = len(self._header)
+    self._header.append(byte)
+    if (header_index == 1) and (byte != SYSEX_MANUFACTURER_ID):
+      self._skipping = True
+    elif header_index == 2:
+      self._operation = byte
+      if byte == BANK_LIST_REQUEST_OPERATION:
+        return
+      if (byte not in [BANK_LIST_OPERATION, BANK_LIST_PAGE_OPERATION]) or \
+         not self._decode_names:
+        self._skipping = True
+    elif header_index > 2:
+      if self._operation == BANK_LIST_PAGE_OPERATION:
+        self._byte_sum += byte
+        if header_index == 5:
+          self._bank_number = byte
+  
+  def _add_name_byte(self, byte, bank_names):
+    """
+    Adds a byte of the lengths or the names of the banks
+    Parameters:
+    * byte: received byte
+    * bank_names: list where the completed names will be appended
+    """
+    self._byte_sum += byte
+    if self._remaining_bytes > 0:
+      self._name_bytes.append(byte)
+      self._remaining_bytes -= 1
+      if self._remaining_bytes == 0:
+        bank_name = convert_unicode_from_7_bit_bytes(self._name_bytes,
+                                                     encoding = self._encoding)
+        bank_names.append((self._bank_number, bank_name))
+        self._bank_number += 1
+        del self._name_bytes[:]
+    elif byte == 0x00:
+      #The length continues on the next byte
+      self._name_length += 0x7F
+    else:
+      self._remaining_bytes = self._name_length + byte
+      self._name_length = 0
+  
+  def _end_message(self):
+    """
+    Checks the end of the message
+    """
+    self._complete = True
+    if self._operation in [None, BANK_LIST_REQUEST_OPERATION]:
+      return
+    if self._pending_byte == None:
+      raise Exception("Malformed SysEx: missing checksum")
+    if self._remaining_bytes > 0:
+      raise Exception("Malformed SysEx: misssing data from bank: %d, "
+                      "expected: %d bytes, got %d bytes" % \
+                      (self._bank_number, len(self._name_bytes) + \
+                       self._remaining_bytes, len(self._name_bytes)))
+    checksum = self._pending_byte
+    if self._operation == BANK_LIST_PAGE_OPERATION:
+      calculated_checksum = calculate_page_checksum(self._byte_sum)
+    else:
+      calculated_checksum = 128 - (self._byte_sum % 128)
+    if checksum != calculated_checksum:
+      raise Exception("Malformed SysEx: invalid checksum, got: %d, "
+                      "expected: %d" % (checksum, calculated_checksum))
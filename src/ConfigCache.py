@@ -0,0 +1,201 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# JMMidiBassPedalController v3.0
+# File: src/ConfigCache.py
+# By:   Josef Meile <jmeile@hotmail.com> @ 28.10.2020
+# This project is licensed under the MIT License. Please see the LICENSE.md file
+# on the main folder of this code. An online version can be found here:
+# https://github.com/jmeile/JMMidiBassPedalController/blob/master/LICENSE.md
+#
+"""Stores the compiled configurations on disk."""
+
+from __future__ import print_function
+import hashlib
+import io
+import os
+import pickle
+import traceback
+from CustomLogger import CustomLogger
+import logging
+from autologging import logged
+
+#Increase this if the format of the cache files changes
+CACHE_VERSION = 2
+
+#Default folder of the cache files: the "cache" folder next to this script, so
+#that it doesn't depend on the current working directory
+DEFAULT_CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                 'cache')
+
+#Creates a logger for this module.
+logger = logging.getLogger(CustomLogger.get_module_name())
+
+#Setups the logger with default settings
+logger.setup()
+
+class _CachePickler(pickle.Pickler):
+  """
+  Pickler for the compiled configurations. The memoryviews of the message
+  pool can't be pickled, so, they are stored as bytes. The pool has to be
+  created again after loading the configuration
+  """
+  def reducer_override(self, obj):
+    if isinstance(obj, memoryview):
+      return bytes, (obj.tobytes(),)
+    return NotImplemented
+
+def get_file_hash(file_name):
+  """
+  Calculates the SHA-256 hash of a file
+  Parameters:
+  * file_name: path of the file
+  Returns:
+  * A string with the hexadecimal hash or None if the file couldn't be read
+  """
+  try:
+    with open(file_name, 'rb') as file_object:
+      return hashlib.sha256(file_object.read()).hexdigest()
+  except OSError:
+    return None
+
+@logged(logger)
+class ConfigCache:
+  """
+  Cache of compiled configurations. Each entry is keyed by the hash of the XML
+  configuration, the XSD schema, and the source code compiling them; besides,
+  it stores the hashes of the other files used by the configuration, ie: the
+  panic file. If any of those files changes, then the entry won't be used
+  Remarks:
+  * The name of each cache file starts with the hash of the path of its
+    configuration, so that the entries replaced after changing the
+    configuration get removed when saving the new one
+  """
+
+  def __init__(self, cache_dir = DEFAULT_CACHE_DIR, code_files = None):
+    """
+    Initializes the class attributes
+    Parameters:
+    * cache_dir: folder where the cache files will be stored
+    * code_files: list with the source files that compile the configuration.
+      If they change, then the cache entries will be invalidated
+    """
+    self._cache_dir = cache_dir
+    self._code_files = code_files
+    if self._code_files == None:
+      self._code_files = []
+
+  def _get_cache_prefix(self, config_file):
+    """
+    Gets the beginning of the names of the cache files for the entered
+    configuration
+    Parameters:
+    * config_file: XML configuration file
+    Returns:
+    * The hexadecimal hash of the absolute path of the file followed by "-"
+    """
+    path_hash = hashlib.sha256(os.path.abspath(config_file).encode('utf-8'))
+    return path_hash.hexdigest()[:16] + '-'
+
+  def _get_cache_file(self, config_file, xsd_file):
+    """
+    Gets the path of the cache file for the entered configuration
+    Parameters:
+    * config_file: XML configuration file
+    * xsd_file: XSD schema used to validate the configuration
+    Returns:
+    * The path of the cache file or None if any of the files couldn't be read
+    """
+    key = hashlib.sha256(str(CACHE_VERSION).encode())
+    for file_name in [config_file, xsd_file] + self._code_files:
+      file_hash = get_file_hash(file_name)
+      if file_hash == None:
+        return None
+      key.update(file_hash.encode())
+    return os.path.join(self._cache_dir, self._get_cache_prefix(config_file) +
+                        key.hexdigest() + '.pickle')
+
+  def load(self, config_file, xsd_file):
+    """
+    Loads the compiled configuration from the cache
+    Parameters:
+    * config_file: XML configuration file
+    * xsd_file: XSD schema used to validate the configuration
+    Returns:
+    * The compiled configuration or None if it isn't in the cache, if any of
+      its files changed, or if the cache file couldn't be read
+    """
+    cache_file = self._get_cache_file(config_file, xsd_file)
+    if (cache_file == None) or not os.path.isfile(cache_file):
+      self.__log.debug("Compiled configuration isn't cached")
+      return None
+    try:
+      with open(cache_file, 'rb') as file_object:
+        cache_entry = pickle.load(file_object)
+    except Exception:
+      self.__log.info("Error while reading cache file: %s\n%s", cache_file,
+                      traceback.format_exc())
+      return None
+    for file_name, file_hash in cache_entry['dependencies'].items():
+      if get_file_hash(file_name) != file_hash:
+        self.__log.info("File changed since caching: %s", file_name)
+        return None
+    self.__log.debug("Compiled configuration was loaded from: %s", cache_file)
+    return cache_entry['compiled_config']
+
+  def save(self, config_file, xsd_file, compiled_config, dependencies = None):
+    """
+    Saves the compiled configuration in the cache
+    Parameters:
+    * config_file: XML configuration file
+    * xsd_file: XSD schema used to validate the configuration
+    * compiled_config: object with the compiled configuration
+    * dependencies: list with other files used to compile the configuration
+    Remarks:
+    * If the cache file can't be written, then only a message will be logged
+    """
+    cache_file = self._get_cache_file(config_file, xsd_file)
+    if cache_file == None:
+      return
+    cache_entry = {'dependencies': {}, 'compiled_config': compiled_config}
+    if dependencies != None:
+      for file_name in dependencies:
+        cache_entry['dependencies'][file_name] = get_file_hash(file_name)
+    temp_file = cache_file + '.tmp'
+    try:
+      buffer = io.BytesIO()
+      _CachePickler(buffer, pickle.HIGHEST_PROTOCOL).dump(cache_entry)
+      os.makedirs(self._cache_dir, exist_ok = True)
+      with open(temp_file, 'wb') as file_object:
+        file_object.write(buffer.getvalue())
+      #Renaming is atomic, so, other processes will never read a half written
+      #cache file
+      os.replace(temp_file, cache_file)
+      self.__log.debug("Compiled configuration was saved to: %s", cache_file)
+    except Exception:
+      self.__log.info("Error while writing cache file: %s\n%s", cache_file,
+                      traceback.format_exc())
+      return
+    self._remove_replaced_files(config_file, cache_file)
+
+  def _remove_replaced_files(self, config_file, cache_file):
+    """
+    Removes the cache files of previous versions of the configuration
+    Parameters:
+    * config_file: XML configuration file
+    * cache_file: cache file that was just saved; it will be kept
+    """
+    prefix = self._get_cache_prefix(config_file)
+    cache_name = os.path.basename(cache_file)
+    try:
+      file_names = os.listdir(self._cache_dir)
+    except OSError:
+      return
+    for file_name in file_names:
+      if file_name.startswith(prefix) and (file_name != cache_name) and \
+         file_name.endswith('.pickle'):
+        try:
+          os.remove(os.path.join(self._cache_dir, file_name))
+          self.__log.debug("Replaced cache file was removed: %s", file_name)
+        except OSError:
+          pass
@@ -0,0 +1,278 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# JMMidiBassPedalController v3.0
+# File: src/ConfigWatcher.py
+# By:   Josef Meile <jmeile@hotmail.com> @ 28.10.2020
+# This project is licensed under the MIT License. Please see the LICENSE.md file
+# on the main folder of this code. An online version can be found here:
+# https://github.com/jmeile/JMMidiBassPedalController/blob/master/LICENSE.md
+#
+"""Watches the configuration files and notifies when they change."""
+
+from __future__ import print_function
+import os
+import sys
+import select
+import struct
+import threading
+import time
+import traceback
+from CustomLogger import CustomLogger
+import logging
+from autologging import logged
+
+#inotify flags; see: man 7 inotify
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_Q_OVERFLOW = 0x00004000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+
+#Changes that will be notified. Editors often save by writing a temporary file
+#and renaming it, so, the folders are watched instead of the files
+WATCH_MASK = IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | \
+             IN_MOVED_TO | IN_CREATE | IN_DELETE
+
+#Header of each inotify event: watch descriptor, mask, cookie, and name length
+EVENT_HEADER = struct.Struct('iIII')
+
+#Creates a logger for this module.
+logger = logging.getLogger(CustomLogger.get_module_name())
+
+#Setups the logger with default settings
+logger.setup()
+
+def _init_inotify():
+  """
+  Creates an inotify instance through the C library
+  Returns:
+  * A tuple with the C library and the inotify file descriptor, or None if
+    inotify isn't available, ie: when not running on Linux
+  """
+  if not sys.platform.startswith('linux'):
+    return None
+  try:
+    import ctypes
+    import ctypes.util
+    libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6',
+                       use_errno = True)
+    inotify_fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+    if inotify_fd < 0:
+      return None
+    return libc, inotify_fd
+  except Exception:
+    return None
+
+@logged(logger)
+class ConfigWatcher:
+  """
+  Watches a list of files on a background thread and calls a function after
+  they change. On Linux, inotify will be used; on other systems, or if inotify
+  isn't available, then the modification times of the files will be polled.
+
+  Several changes in a short time, ie: when an editor saves a file in several
+  steps, will only cause one notification: the function will be called after
+  no changes were detected during the debounce time
+  """
+
+  def __init__(self, files, on_change, debounce_time = 0.5,
+               poll_interval = 1.0):
+    """
+    Initializes the class attributes
+    Parameters:
+    * files: list with the paths of the files to watch
+    * on_change: function without parameters that will be called from the
+      watcher thread after the files changed. It must return fast; if it
+      returns False, then it will be called again after the debounce time, ie:
+      when the change can't be handled at the moment
+    * debounce_time: seconds without changes before calling on_change
+    * poll_interval: seconds between checks of the modification times when
+      inotify isn't available
+    """
+    self._files = []
+    self._on_change = on_change
+    self._debounce_time = debounce_time
+    self._poll_interval = poll_interval
+    self._lock = threading.Lock()
+    self._stop_event = threading.Event()
+    self._thread = None
+    self._libc = None
+    self._inotify_fd = None
+    self._watches = {}
+    self._watch_folders = {}
+    self._file_stats = {}
+    self.set_files(files)
+
+  def set_files(self, files):
+    """
+    Replaces the list of watched files, ie: after reloading a configuration
+    that references other files
+    Parameters:
+    * files: list with the paths of the files to watch
+    """
+    with self._lock:
+      self._files = [os.path.abspath(file_name) for file_name in files
+                     if file_name]
+      self._file_stats = dict((file_name, self._get_file_stat(file_name))
+                              for file_name in self._files)
+      if self._inotify_fd != None:
+        self._add_watches()
+
+  def _get_file_stat(self, file_name):
+    """
+    Gets the values that will be compared by the polling watcher
+    Parameters:
+    * file_name: path of the file
+    Returns:
+    * A tuple with the modification time, size, and inode of the file, or None
+      if it doesn't exist
+    """
+    try:
+      stat = os.stat(file_name)
+      return (stat.st_mtime_ns, stat.st_size, stat.st_ino)
+    except OSError:
+      return None
+
+  def _add_watches(self):
+    """
+    Adds an inotify watch for each folder of the watched files. The keys of
+    _watches are the watch descriptors and the values the names of the watched
+    files inside the folder; _watch_folders maps the descriptors to their
+    folders
+    Remarks:
+    * The watches of the folders without watched files are removed first, so
+      that the kernel doesn't keep them until the watcher is stopped
+    """
+    watched_names = {}
+    for file_name in self._files:
+      folder, name = os.path.split(file_name)
+      watched_names.setdefault(folder, set()).add(name)
+    for watch_descriptor, folder in self._watch_folders.items():
+      if folder not in watched_names:
+        self._libc.inotify_rm_watch(self._inotify_fd, watch_descriptor)
+    self._watches = {}
+    self._watch_folders = {}
+    for folder, names in watched_names.items():
+      watch_descriptor = self._libc.inotify_add_watch(self._inotify_fd,
+                           folder.encode(sys.getfilesystemencoding()),
+                           WATCH_MASK)
+      if watch_descriptor < 0:
+        self.__log.info("Folder can't be watched: %s", folder)
+        continue
+      #inotify returns the same descriptor if the folder was already watched
+      self._watches[watch_descriptor] = names
+      self._watch_folders[watch_descriptor] = folder
+
+  def start(self):
+    """
+    Starts watching the files on a daemon thread
+    """
+    inotify = _init_inotify()
+    if inotify != None:
+      self._libc, self._inotify_fd = inotify
+      with self._lock:
+        self._add_watches()
+      target = self._watch_inotify
+      self.__log.info("Watching configuration files with inotify")
+    else:
+      target = self._watch_polling
+      self.__log.info("Watching configuration files by polling them")
+    self._stop_event.clear()
+    self._thread = threading.Thread(target = target, name = 'ConfigWatcher',
+                                    daemon = True)
+    self._thread.start()
+
+  def stop(self):
+    """
+    Stops watching the files and waits for the watcher thread to end
+    """
+    self._stop_event.set()
+    if self._thread != None:
+      self._thread.join()
+      self._thread = None
+    if self._inotify_fd != None:
+      os.close(self._inotify_fd)
+      self._inotify_fd = None
+
+  def _read_inotify_events(self):
+    """
+    Reads the pending inotify events
+    Returns:
+    * True if any of the watched files changed
+    """
+    try:
+      data = os.read(self._inotify_fd, 65536)
+    except BlockingIOError:
+      return False
+    changed = False
+    offset = 0
+    with self._lock:
+      while offset < len(data):
+        watch_descriptor, mask, cookie, name_length = \
+          EVENT_HEADER.unpack_from(data, offset)
+        offset += EVENT_HEADER.size
+        name = data[offset:offset + name_length].rstrip(b'\0').decode(
+                 sys.getfilesystemencoding(), 'replace')
+        offset += name_length
+        if mask & IN_Q_OVERFLOW:
+          changed = True
+        elif name in self._watches.get(watch_descriptor, ()):
+          changed = True
+    return changed
+
+  def _watch_inotify(self):
+    """
+    Waits for inotify events until the watcher is stopped
+    """
+    #The select timeout also limits how long stop will wait
+    max_wait = min(self._debounce_time, 0.5)
+    last_change = None
+    while not self._stop_event.is_set():
+      try:
+        readable, _, _ = select.select([self._inotify_fd], [], [], max_wait)
+        if readable and self._read_inotify_events():
+          last_change = time.monotonic()
+        last_change = self._notify_if_settled(last_change)
+      except Exception:
+        self.__log.info("Error while watching the configuration:\n%s",
+                        traceback.format_exc())
+        self._stop_event.wait(self._poll_interval)
+
+  def _watch_polling(self):
+    """
+    Compares the modification times of the files until the watcher is stopped
+    """
+    interval = min(self._poll_interval, self._debounce_time)
+    last_change = None
+    while not self._stop_event.wait(interval):
+      with self._lock:
+        for file_name in self._files:
+          file_stat = self._get_file_stat(file_name)
+          if file_stat != self._file_stats.get(file_name):
+            self._file_stats[file_name] = file_stat
+            last_change = time.monotonic()
+      last_change = self._notify_if_settled(last_change)
+
+  def _notify_if_settled(self, last_change):
+    """
+    Calls on_change if the debounce time passed since the last change
+    Parameters:
+    * last_change: monotonic time of the last change or None if there aren't
+      changes to notify
+    Returns:
+    * The time of the last change that still has to be notified or None
+    """
+    if (last_change == None) or \
+       (time.monotonic() - last_change < self._debounce_time):
+      return last_change
+    self.__log.info("The configuration files changed")
+    if self._on_change() == False:
+      #Tries again after the debounce time
+      return time.monotonic()
+    return None
@@ -0,0 +1,221 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# JMMidiBassPedalController v3.0
+# File: src/ControlServer.py
+# By:   Josef Meile <jmeile@hotmail.com> @ 28.10.2020
+# This project is licensed under the MIT License. Please see the LICENSE.md file
+# on the main folder of this code. An online version can be found here:
+# https://github.com/jmeile/JMMidiBassPedalController/blob/master/LICENSE.md
+#
+"""
+Local control socket of the controller. It accepts text commands, one per
+line, ie:
+  bank 3
+  next
+  panic
+  stats
+and answers each one with a line starting with "OK" or "ERROR". You can send
+them, for example, with:
+  echo "panic" | nc -U /tmp/FootController.sock
+"""
+
+from __future__ import print_function
+import os
+import socket
+import stat
+import threading
+import traceback
+from CustomLogger import CustomLogger, PrettyFormat
+import logging
+from autologging import logged
+
+#Maximum length of a command line in bytes
+MAX_COMMAND_LENGTH = 1024
+
+#Seconds that a client may stay idle before its connection gets closed
+CLIENT_TIMEOUT = 60.0
+
+#Creates a logger for this module.
+logger = logging.getLogger(CustomLogger.get_module_name())
+
+#Setups the logger with default settings
+logger.setup()
+
+#Register the logger with this class
+@logged(logger)
+class ControlServer:
+  """
+  Listens on a UNIX domain socket and passes the received commands to a
+  handler
+  Remarks:
+  * Only local processes with access to the socket file can send commands.
+    The file will be only readable and writable by the current user
+  * UNIX domain sockets aren't supported by older Windows versions; on those
+    systems, the server won't be started
+  """
+
+  def __init__(self, socket_path, command_handler):
+    """
+    Initializes the ControlServer class
+    Parameters:
+    * socket_path: path of the socket file
+    * command_handler: function receiving a command line without the line
+      break and returning the answer without the line break
+    """
+    self.__log.debug("Initializing ControlServer")
+    self._socket_path = socket_path
+    self._command_handler = command_handler
+    self._server_socket = None
+    self._server_thread = None
+    #Socket of the client being served; stop closes it, so that the server
+    #thread doesn't have to wait until the client sends something
+    self._client_socket = None
+    self._client_lock = threading.Lock()
+    self._stopped = threading.Event()
+    self.__log.debug("ControlServer was initialized:\n%s",
+                     PrettyFormat(self.__dict__))
+
+  def start(self):
+    """
+    Creates the socket and starts the thread accepting the connections
+    Returns:
+    * True if the server was started; otherwise False
+    Remarks:
+    * A socket file left by a previous run will be replaced, but any other
+      file at the socket path will be kept and the server won't be started
+    """
+    if not hasattr(socket, 'AF_UNIX'):
+      self.__log.info("The control socket isn't supported on this system")
+      return False
+    if os.path.lexists(self._socket_path):
+      if not stat.S_ISSOCK(os.lstat(self._socket_path).st_mode):
+        self.__log.info("The control socket wasn't opened: '%s' already "
+                        "exists and it isn't a socket", self._socket_path)
+        return False
+      #A socket file left by a previous run that didn't end properly
+      os.unlink(self._socket_path)
+    server_socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    previous_umask = os.umask(0o177)
+    try:
+      server_socket.bind(self._socket_path)
+    finally:
+      os.umask(previous_umask)
+    server_socket.listen()
+    self._server_socket = server_socket
+    self._stopped.clear()
+    self._server_thread = threading.Thread(target = self._accept_connections,
+                                           name = 'ControlServer',
+                                           daemon = True)
+    self._server_thread.start()
+    self.__log.info("Control socket: '%s' was opened", self._socket_path)
+    return True
+
+  def stop(self):
+    """
+    Closes the socket and removes its file
+    """
+    if self._server_socket == None:
+      return
+    self._stopped.set()
+    try:
+      #Wakes up the accept call of the server thread
+      self._server_socket.shutdown(socket.SHUT_RDWR)
+    except OSError:
+      pass
+    self._server_socket.close()
+    with self._client_lock:
+      if self._client_socket != None:
+        try:
+          #Wakes up the server thread if it is waiting for a command
+          self._client_socket.shutdown(socket.SHUT_RDWR)
+        except OSError:
+          pass
+    self._server_thread.join()
+    self._server_socket = None
+    self._server_thread = None
+    if os.path.lexists(self._socket_path) and \
+       stat.S_ISSOCK(os.lstat(self._socket_path).st_mode):
+      os.unlink(self._socket_path)
+    self.__log.info("Control socket: '%s' was closed", self._socket_path)
+
+  def _accept_connections(self):
+    """
+    Main loop of the server thread. The clients are served one after the
+    other, so, the commands never run concurrently
+    """
+    while not self._stopped.is_set():
+      try:
+        client_socket, address = self._server_socket.accept()
+      except OSError:
+        if not self._stopped.is_set():
+          self.__log.info("Error while accepting a control connection:\n%s",
+                          traceback.format_exc())
+        break
+      with self._client_lock:
+        if self._stopped.is_set():
+          client_socket.close()
+          break
+        self._client_socket = client_socket
+      try:
+        self._serve_client(client_socket)
+      except Exception:
+        if not self._stopped.is_set():
+          self.__log.info("Error while serving a control connection:\n%s",
+                          traceback.format_exc())
+      finally:
+        with self._client_lock:
+          self._client_socket = None
+        client_socket.close()
+
+  def _serve_client(self, client_socket):
+    """
+    Reads the commands of a client and sends back the answers until the
+    client closes the connection
+    Parameters:
+    * client_socket: socket of the client
+    """
+    client_socket.settimeout(CLIENT_TIMEOUT)
+    client_file = client_socket.makefile('rwb')
+    try:
+      while not self._stopped.is_set():
+        try:
+          line = client_file.readline(MAX_COMMAND_LENGTH + 1)
+        except socket.timeout:
+          break
+        if line == b'':
+          break
+        if len(line) > MAX_COMMAND_LENGTH:
+          #The rest of the line mustn't be run as another command
+          try:
+            while not line.endswith(b'\n'):
+              line = client_file.readline(MAX_COMMAND_LENGTH + 1)
+              if line == b'':
+                break
+          except socket.timeout:
+            break
+          if line == b'':
+            break
+          answer = "ERROR The command is too long"
+        else:
+          answer = self._run_command(line.decode('utf-8', 'replace').strip())
+        client_file.write(answer.encode('utf-8') + b'\n')
+        client_file.flush()
+    finally:
+      client_file.close()
+
+  def _run_command(self, command):
+    """
+    Passes a command to the handler
+    Parameters:
+    * command: received command line
+    Returns:
+    * The answer of the handler or an error message if it failed
+    """
+    self.__log.info("Control command received: %s", command)
+    try:
+      return self._command_handler(command)
+    except Exception:
+      self.__log.info("Error while running the control command: %s\n%s",
+                      command, traceback.format_exc())
+      return "ERROR The command failed"
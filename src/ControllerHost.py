@@ -0,0 +1,248 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# JMMidiBassPedalController v3.0
+# File: src/ControllerHost.py
+# By:   Josef Meile <jmeile@hotmail.com> @ 28.10.2020
+# This project is licensed under the MIT License. Please see the LICENSE.md file
+# on the main folder of this code. An online version can be found here:
+# https://github.com/jmeile/JMMidiBassPedalController/blob/master/LICENSE.md
+#
+"""
+Runs several controllers, each one with its own configuration file, on the
+same process
+"""
+
+from __future__ import print_function
+import os
+import signal
+import threading
+import traceback
+from MidiConnector import MidiConnector
+from CustomLogger import CustomLogger, PrettyFormat
+import logging
+from autologging import logged
+
+#Statuses that end all the controllers, so that the main program can run the
+#corresponding command
+SYSTEM_STATUSES = ["Reboot", "Shutdown"]
+
+#Seconds between the checks of the controller threads. The main thread must
+#wake up from time to time; otherwise, it won't get the keyboard interrupts
+JOIN_INTERVAL = 1.0
+
+#Creates a logger for this module.
+logger = logging.getLogger(CustomLogger.get_module_name())
+
+#Setups the logger with default settings
+logger.setup()
+
+#Register the logger with this class
+@logged(logger)
+class ControllerHost:
+  """
+  Hosts one MidiConnector per configuration file. Each controller runs on its
+  own thread and has its own MidiProcessor, so, its banks, channels, ports,
+  and state are isolated from the others; however, the python interpreter,
+  the parsed xsd schema, the rtmidi clients, and the logging pipeline are
+  shared
+  Remarks:
+  * The "Quit" and "Reload" commands only affect the controller receiving
+    them; the "Reboot" and "Shutdown" commands end all the controllers
+  """
+
+  def __init__(self, args, config_files,
+               xsd_schema = 'conf/MidiBassPedalController.xsd'):
+    """
+    Initializes the ControllerHost class
+    Parameters:
+    * args: command-line arguments
+    * config_files: list with the paths to the xml configuration files
+    * xsd_schema: path to the xsd schema
+    """
+    self.__log.debug("Initializing ControllerHost")
+    self._args = args
+    self._connectors = [MidiConnector(args, xsd_schema, config_file)
+                        for config_file in config_files]
+    self._threads = []
+    self._system_status = None
+    self._lock = threading.Lock()
+    self.__log.debug("ControllerHost was initialized:\n%s",
+                     PrettyFormat(self.__dict__))
+
+  def start(self):
+    """
+    Starts all the controllers and waits until they end
+    Returns:
+    * A status string; either: "Quit", "Reboot", or "Shutdown". "Reload" is
+      never returned since each controller is reloaded on its own thread
+    """
+    self.__log.info("Starting %d controllers", len(self._connectors))
+    self._threads = []
+    for controller_index in range(len(self._connectors)):
+      thread = threading.Thread(target = self._run_controller,
+                                args = (controller_index,),
+                                name = 'Controller%d' % (controller_index + 1),
+                                daemon = True)
+      self._threads.append(thread)
+      thread.start()
+
+    previous_handler = None
+    if hasattr(signal, 'SIGUSR1'):
+      #On demand, the event rates and the latency statistics can be logged by
+      #running: kill -USR1 <process id>
+      previous_handler = signal.signal(signal.SIGUSR1,
+        lambda signal_number, frame: self.log_event_stats(True))
+    try:
+      for thread in self._threads:
+        while thread.is_alive():
+          thread.join(JOIN_INTERVAL)
+    except KeyboardInterrupt:
+      self.__log.info("Keyboard interrupt detected")
+      self.quit("Quit")
+      for thread in self._threads:
+        thread.join()
+    if previous_handler != None:
+      signal.signal(signal.SIGUSR1, previous_handler)
+
+    status = self._system_status
+    if status == None:
+      status = "Quit"
+    self.log_event_stats()
+    self.__log.info("All the controllers have been ended")
+    return status
+
+  def quit(self, status = "Quit"):
+    """
+    Ends all the controllers
+    Parameters:
+    * status: status that the controllers will return
+    """
+    for connector in self._connectors:
+      connector.quit(status)
+
+  def _run_controller(self, controller_index):
+    """
+    Runs a controller until it quits. If it gets reloaded, then it will be
+    started again
+    Parameters:
+    * controller_index: index of the controller to run
+    """
+    connector = self._connectors[controller_index]
+    controller_name = self._get_controller_name(controller_index)
+    status = None
+    while status == None:
+      self.__log.info("Starting controller: %s", controller_name)
+      try:
+        status = connector.start()
+      except SystemExit:
+        #MidiConnector exits if the configuration or the ports are wrong; only
+        #this controller will be ended
+        status = "Quit"
+      except Exception:
+        self.__log.info("Controller: %s failed:\n%s", controller_name,
+                        traceback.format_exc())
+        status = "Quit"
+      if status == None:
+        #The MIDI ports weren't found before the port timeout or the waiting
+        #was interrupted by quit; like in the main loop, the controller ends
+        status = "Quit"
+      elif status == "Reload":
+        self.__log.info("Controller reload received: %s", controller_name)
+        status = None
+      elif status in SYSTEM_STATUSES:
+        self.__log.info("Controller %s received: %s; ending all the "
+                        "controllers", controller_name, status)
+        with self._lock:
+          if self._system_status == None:
+            self._system_status = status
+        self.quit("Quit")
+    self.__log.info("Controller ended: %s", controller_name)
+
+  def handle_control_command(self, command):
+    """
+    Command handler of the ControlServer. The commands are sent to all the
+    controllers, unless they start with: "controller <number>", ie:
+    "controller 2 bank 3" only selects the bank 3 of the second controller
+    Parameters:
+    * command: received command line. See: MidiConnector.handle_control_command
+    Returns:
+    * "OK" or "ERROR <reason>". The stats command returns: "OK <statistics>",
+      where the statistics are a JSON object with the statistics of each
+      controller and the combined event rate
+    """
+    tokens = command.split()
+    if (len(tokens) > 0) and (tokens[0].lower() == 'controller'):
+      if (len(tokens) < 3) or not tokens[1].isdigit() or \
+         not (1 <= int(tokens[1]) <= len(self._connectors)):
+        return "ERROR The controller must be a number between 1 and %d " \
+               "followed by a command" % len(self._connectors)
+      connector = self._connectors[int(tokens[1]) - 1]
+      return connector.handle_control_command(' '.join(tokens[2:]))
+    if [token.lower() for token in tokens] == ['stats']:
+      import json
+      combined_stats = self.get_event_stats()[1]
+      return "OK " + json.dumps({
+        'controllers': [connector.get_stats() for connector in
+                        self._connectors],
+        'combined': combined_stats
+      })
+    errors = []
+    for controller_index in range(len(self._connectors)):
+      answer = self._connectors[controller_index]. \
+                 handle_control_command(command)
+      if answer != "OK":
+        errors.append("controller %d: %s" % (controller_index + 1,
+                                              answer[len("ERROR "):]))
+    if errors != []:
+      return "ERROR " + "; ".join(errors)
+    return "OK"
+
+  def _get_controller_name(self, controller_index):
+    """
+    Returns the name of the entered controller used on the log messages, ie:
+    the file name of its configuration
+    """
+    config_file = self._connectors[controller_index].get_config_file()
+    return "%d (%s)" % (controller_index + 1, os.path.basename(config_file))
+
+  def get_event_stats(self):
+    """
+    Gets the event statistics of the running controllers
+    Returns:
+    * A tuple with:
+      - a list with the statistics of each controller, see:
+        MidiConnector.get_event_stats. Controllers that were never started
+        will have None
+      - a dictionary with the combined 'events' and 'rate' of all the
+        controllers
+    """
+    controller_stats = [connector.get_event_stats() for connector in
+                        self._connectors]
+    combined_stats = {'events': 0, 'rate': 0.0}
+    for stats in controller_stats:
+      if stats != None:
+        combined_stats['events'] += stats['events']
+        combined_stats['rate'] += stats['rate']
+    return controller_stats, combined_stats
+
+  def log_event_stats(self, log_latencies = False):
+    """
+    Logs the event rates of each controller and the combined one
+    Parameters:
+    * log_latencies: whether or not to log the latency statistics of each
+      controller as well
+    """
+    controller_stats, combined_stats = self.get_event_stats()
+    for controller_index in range(len(controller_stats)):
+      stats = controller_stats[controller_index]
+      controller_name = self._get_controller_name(controller_index)
+      if stats == None:
+        self.__log.info("Controller %s hasn't been started", controller_name)
+        continue
+      self.__log.info("Controller %s: %d events, %.1f events/s",
+                      controller_name, stats['events'], stats['rate'])
+      if log_latencies:
+        self._connectors[controller_index].log_latency_stats()
+    self.__log.info("All controllers: %d events, %.1f events/s",
+                    combined_stats['events'], combined_stats['rate'])
@@ -0,0 +1,220 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# JMMidiBassPedalController v3.0
+# File: src/ControllerHostTest.py
+# By:   Josef Meile <jmeile@hotmail.com> @ 28.10.2020
+# This project is licensed under the MIT License. Please see the LICENSE.md file
+# on the main folder of this code. An online version can be found here:
+# https://github.com/jmeile/JMMidiBassPedalController/blob/master/LICENSE.md
+#
+"""
+Helper script to check that the ControllerHost ends while its controllers are
+still waiting for their MIDI ports.
+
+Two copies of the sample configuration with MIDI ports that don't exist are
+hosted with a port timeout. On the first check, the host gets quitted before
+the timeout passes; on the second one, the timeout passes. On both cases, the
+host must return "Quit" in time and each controller must have been started
+only once.
+
+The script exits with status 1 if any check failed; otherwise, with status 0.
+
+Run the script as follows:
+python ControllerHostTest.py -h
+
+There you will see the diferent command-line options supported by the script.
+"""
+
+from __future__ import print_function
+import argparse
+from argparse import ArgumentParser
+from argparse import RawTextHelpFormatter
+import logging
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from CustomLogger import CustomLogger
+
+#Name of the MIDI ports of the test configurations; they mustn't exist
+MISSING_PORT = "ControllerHostTest missing port"
+
+#Seconds that the host may take to end after quitting it or after the port
+#timeout passed
+END_TIMEOUT = 5.0
+
+class ControllerHostTestArgumentParser(ArgumentParser):
+  """
+  ArgumentParser for the controller host test application
+
+  Remarks:
+  - The controller host test application will accept the following command
+    line options:
+    * --config: configuration file used as template.
+    * --port-timeout: port timeout of the controllers in seconds.
+  """
+
+  def __init__(self, description = "Checks that the hosted controllers end "
+               "while waiting for their MIDI ports"):
+    """
+    Setups the ArgumentParser of the controller host test program
+
+    Parameters:
+    * description: description of what the program is doing
+    """
+    self._parser = ArgumentParser(description = description,
+      formatter_class = RawTextHelpFormatter, add_help = False)
+
+  def add_arguments(self,
+                    main_help = "Shows this help message and exits",
+                    config_help = "Configuration file used as template. It "
+                    "defaults to:\nconf/sample-config.xml",
+                    port_timeout_help = "Port timeout of the controllers in "
+                    "seconds. It defaults to 2"):
+    """
+    Adds the command line options and commands to the argument parser
+
+    Parameters:
+    * main_help: text of the -h, --help option
+    * config_help: help of the "--config" command line option
+    * port_timeout_help: help of the "--port-timeout" command line option
+    """
+    self._parser.add_argument("-h", "--help", action = "help",
+      default = argparse.SUPPRESS, help = main_help)
+
+    self._parser.add_argument("-c", "--config",
+                              default = "conf/sample-config.xml",
+                              help = config_help)
+    self._parser.add_argument("-t", "--port-timeout", type = int, default = 2,
+                              help = port_timeout_help)
+
+  def parse_arguments(self):
+    """
+    Validates the supplied command line options. It will show an error
+    message if the vaildation failed and then it will exit
+    """
+    return self._parser.parse_args()
+
+def create_configs(template_file, folder, count = 2):
+  """
+  Creates copies of a configuration with MIDI ports that don't exist
+  Parameters:
+  * template_file: configuration file to copy
+  * folder: folder where the copies will be created
+  * count: number of copies
+  Returns:
+  * A list with the paths to the copies
+  """
+  with open(template_file, 'r', encoding = 'utf-8') as xml_file:
+    xml_text = xml_file.read()
+  xml_text = xml_text.replace('InPort="MIDI In*" OutPort="MIDI Out*"',
+                              'InPort="%s" OutPort="%s"' % (MISSING_PORT,
+                              MISSING_PORT))
+  config_files = []
+  for config_index in range(count):
+    config_file = os.path.join(folder, 'config%d.xml' % (config_index + 1))
+    with open(config_file, 'w', encoding = 'utf-8') as xml_file:
+      xml_file.write(xml_text)
+    config_files.append(config_file)
+  return config_files
+
+def run_host(config_files, port_timeout, quit_delay = None):
+  """
+  Runs a ControllerHost until it ends
+  Parameters:
+  * config_files: configuration files of the controllers
+  * port_timeout: port timeout of the controllers in seconds
+  * quit_delay: seconds after which the host will be quitted. If None, then
+    it won't be quitted
+  Returns:
+  * A tuple with: the status returned by the host, the number of times that
+    the controllers were started, and the seconds that the host took to end
+    after it was quitted or after the timeout passed
+  Remarks:
+  * The host must run on the main thread since it setups a signal handler.
+    If it doesn't end in time, then the script will exit with status 1
+  """
+  from ControllerHost import ControllerHost
+  args = argparse.Namespace(config = config_files, list = False,
+                            verbose = False, quiet = True, watch = False,
+                            port_timeout = port_timeout,
+                            control_socket = None)
+  host = ControllerHost(args, config_files)
+  start_count = [0]
+  for connector in host._connectors:
+    def counted_start(start = connector.start):
+      start_count[0] += 1
+      return start()
+    connector.start = counted_start
+
+  end_delay = port_timeout
+  quit_timer = None
+  if quit_delay != None:
+    quit_timer = threading.Timer(quit_delay, host.quit, args = ("Quit",))
+    quit_timer.start()
+    end_delay = quit_delay
+
+  def on_timeout():
+    print("FAILED: the host didn't end %.1f s after %s; controller starts: %d" \
+          % (END_TIMEOUT, "quitting it" if quit_delay != None else \
+          "the port timeout", start_count[0]))
+    sys.stdout.flush()
+    os._exit(1)
+
+  watchdog = threading.Timer(end_delay + END_TIMEOUT, on_timeout)
+  watchdog.daemon = True
+  watchdog.start()
+  start_time = time.monotonic()
+  status = host.start()
+  end_time = time.monotonic() - start_time - end_delay
+  watchdog.cancel()
+  if quit_timer != None:
+    quit_timer.cancel()
+  return status, start_count[0], max(end_time, 0)
+
+def check_host(name, config_files, port_timeout, quit_delay = None):
+  """
+  Runs a ControllerHost and checks that it ended as expected
+  Parameters:
+  * name: name of the check
+  * config_files, port_timeout, quit_delay: see: run_host
+  Returns:
+  * True if the check passed; otherwise False
+  """
+  status, start_count, end_time = run_host(config_files, port_timeout,
+                                           quit_delay)
+  print("%s: status: %s, controller starts: %d, end time: %.1f s" % \
+        (name, status, start_count, end_time))
+  if status != "Quit":
+    print("FAILED: the host returned %s instead of \"Quit\"" % status)
+    return False
+  if start_count != len(config_files):
+    print("FAILED: the controllers were started %d times instead of %d" % \
+          (start_count, len(config_files)))
+    return False
+  return True
+
+if __name__ == "__main__":
+  parser = ControllerHostTestArgumentParser()
+  parser.add_arguments()
+  args = parser.parse_arguments()
+
+  CustomLogger.init_logging(file_log_level = logging.NOTSET)
+  template_file = os.path.abspath(args.config)
+  #The xsd schema and the panic file are relative to the source folder
+  os.chdir(os.path.dirname(os.path.abspath(__file__)))
+  folder = tempfile.mkdtemp(prefix = 'ControllerHostTest')
+  try:
+    config_files = create_configs(template_file, folder)
+    passed = check_host("Quit while waiting", config_files,
+                        args.port_timeout, args.port_timeout / 2.0)
+    passed = check_host("Port timeout", config_files,
+                        args.port_timeout) and passed
+  finally:
+    shutil.rmtree(folder, ignore_errors = True)
+  if not passed:
+    sys.exit(1)
+  print("OK")
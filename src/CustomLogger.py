@@ -12,11 +12,11 @@
 
 from __future__ import print_function
 import logging
-import inspect
 from logging import handlers
-from pprint import pformat
 import os
 import sys
+import queue
+import atexit
 
 class CustomLogger(logging.getLoggerClass()):
   """
@@ -37,6 +37,12 @@ class CustomLogger(logging.getLoggerClass()):
   """
   _logging_init = True
 
+  """
+  Listener thread writing the log records to the file when asynchronous
+  logging is enabled; otherwise, it will be None
+  """
+  _log_listener = None
+
   def __init__(self, name, level = logging.DEBUG):
     """
     Overwrites the default constructor from logging.Logger. The only difference
@@ -85,7 +91,7 @@ class CustomLogger(logging.getLoggerClass()):
            "\n%(message)s",
     timestamp_format = "%d.%m.%Y %H:%M:%S", file_log_name = "debug.log",
     file_log_encoding = 'utf-8', max_log_files = 5,
-    max_log_size = 20 * 1048576):
+    max_log_size = 20 * 1048576, async_logging = False):
     """
     Initializes the file logger.
     Parameters:
@@ -109,6 +115,10 @@ class CustomLogger(logging.getLoggerClass()):
       6 files will be keept: debug.log, debug.log.1 until debug.log.5.
     * max_log_size: Maximum size in bytes of each log file. It defaults to:
       20 * 1048576, which is 20 MiB
+    * async_logging: if True, then the logging calls will only put the
+      records on a queue and a background thread will format them, write them
+      to the file, and rotate it. This way, the MIDI threads won't wait for
+      the disk. It defaults to False
     Remarks:
     * I'm not a fan of static attributes or methods; however, on this case,
       I couldn't avoid this. Unfurtunatelly needed because you can't share
@@ -131,7 +141,46 @@ class CustomLogger(logging.getLoggerClass()):
           encoding = file_log_encoding)
         log_handler.setFormatter(formatter)
         log_handler.setLevel(file_log_level)
+        if async_logging:
+          #The QueueHandler only merges the message with its arguments, so
+          #that mutable arguments get rendered with their current values; the
+          #rest of the formatting is done by the listener thread
+          log_queue = queue.SimpleQueue()
+          CustomLogger._log_listener = handlers.QueueListener(log_queue,
+            log_handler, respect_handler_level = True)
+          CustomLogger._log_listener.start()
+          #Makes sure that the pending records get written if the program
+          #ends without calling shutdown_logging
+          atexit.register(CustomLogger.shutdown_logging)
+          log_handler = handlers.QueueHandler(log_queue)
+          #Without a formatter, basicConfig would add its default format
+          log_handler.setFormatter(logging.Formatter("%(message)s"))
+          log_handler.setLevel(file_log_level)
         logging.basicConfig(handlers = [log_handler])
+
+  @staticmethod
+  def flush_logging():
+    """
+    Waits until all the queued log records have been written to the file. It
+    does nothing if asynchronous logging isn't enabled
+    """
+    log_listener = CustomLogger._log_listener
+    if log_listener != None:
+      #Stopping the listener processes the remaining records and joins its
+      #thread; afterwards, it can be started again
+      log_listener.stop()
+      log_listener.start()
+
+  @staticmethod
+  def shutdown_logging():
+    """
+    Writes the queued log records to the file and stops the listener thread.
+    It does nothing if asynchronous logging isn't enabled
+    """
+    log_listener = CustomLogger._log_listener
+    if log_listener != None:
+      CustomLogger._log_listener = None
+      log_listener.stop()
   
   @staticmethod
   def get_module_name():
@@ -140,11 +189,70 @@ class CustomLogger(logging.getLoggerClass()):
     needed in order to know where the messages get logged; this is useful
     if using it in several modules at once
     """
-    caller_module_name = inspect.stack()[1][1].split('.')[0]
-    last_path_separator = caller_module_name.rfind(os.sep)
-    if last_path_separator >= 0:
-      caller_module_name = caller_module_name[last_path_separator + 1:]
-    return caller_module_name
+    #Only the caller's frame is needed. inspect.stack would read the source
+    #code of every frame on the stack, which is slow when importing modules
+    caller_file_name = sys._getframe(1).f_code.co_filename
+    return os.path.splitext(os.path.basename(caller_file_name))[0]
+
+def _ignore_log_message(*args, **kwargs):
+  """
+  Replaces the debug method of the loggers on quiet mode. It doesn't do
+  anything at all
+  """
+  pass
+
+class QuietLogger():
+  """
+  Wraps a logger, so that its debug messages are ignored without checking any
+  log level or formatting any string; the other methods are taken from the
+  wrapped logger. It is meant to replace the loggers of the classes processing
+  the MIDI messages on production, where each debug call costs time on every
+  event
+  """
+  def __init__(self, logger):
+    """
+    Initializes the class attributes
+    Parameters:
+    * logger: wrapped logger
+    """
+    self.logger = logger
+    #The methods are stored as instance attributes, so that calling them
+    #doesn't need to create bound methods
+    self.debug = _ignore_log_message
+    self.info = logger.info
+    self.warning = logger.warning
+    self.error = logger.error
+    self.critical = logger.critical
+    self.exception = logger.exception
+    self.log = logger.log
+
+  def isEnabledFor(self, level):
+    """
+    Overrides the isEnabledFor method of the wrapped logger. The debug level
+    is always disabled
+    """
+    return (level > logging.DEBUG) and self.logger.isEnabledFor(level)
+
+  @staticmethod
+  def set_quiet_mode(cls, quiet = True):
+    """
+    Enables or disables the quiet mode for the loggers added by autologging to
+    the entered class and its super classes
+    Parameters:
+    * cls: class decorated with autologging's logged decorator
+    * quiet: if True, then the loggers will be replaced by QuietLoggers;
+      otherwise, the original loggers will be restored
+    """
+    for klass in cls.__mro__:
+      attribute_name = '_%s__log' % klass.__name__.lstrip('_')
+      logger = klass.__dict__.get(attribute_name)
+      if logger == None:
+        continue
+      if isinstance(logger, QuietLogger):
+        if not quiet:
+          setattr(klass, attribute_name, logger.logger)
+      elif quiet:
+        setattr(klass, attribute_name, QuietLogger(logger))
 
 class PrettyFormat():
   """
@@ -161,6 +269,8 @@ class PrettyFormat():
   def __init__(self, obj):
     self.obj = obj
   def __repr__(self):
+    #pprint is only imported when something gets rendered for the first time
+    from pprint import pformat
     return pformat(self.obj)
 
 #Sets CustomLogger as the main Logger class
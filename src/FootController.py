@@ -38,7 +38,15 @@ if __name__ == "__main__":
   if args.verbose:
     file_log_level = logging.DEBUG
 
-  CustomLogger.init_logging(file_log_level = file_log_level)
+  #By default, the log file is written by a background thread, so that the
+  #MIDI threads don't have to wait for the disk
+  async_logging = True
+
+  #Write the log file directly from the logging threads as follows:
+  #async_logging = False
+
+  CustomLogger.init_logging(file_log_level = file_log_level,
+                            async_logging = async_logging)
 
   #By default, only info message will be printed to the console
   console_log_level = logging.INFO
@@ -108,7 +116,22 @@ if __name__ == "__main__":
     reboot_command += ' "MidiBassPedal restart"'
     return reboot_command
 
-  midi = MidiConnector(args)
+  if len(args.config) > 1:
+    #Each configuration will be run as an independent controller. They are
+    #reloaded by the ControllerHost, so, it never returns "Reload"
+    from ControllerHost import ControllerHost
+    midi = ControllerHost(args, args.config)
+  else:
+    midi = MidiConnector(args)
+
+  control_server = None
+  if args.control_socket != None:
+    #The server is kept while reloading, so that it accepts commands as soon
+    #as the controller runs again
+    from ControlServer import ControlServer
+    control_server = ControlServer(args.control_socket,
+                                   midi.handle_control_command)
+    control_server.start()
   status = None
   logger.info("Initializing main loop")
   while status == None:
@@ -117,6 +140,7 @@ if __name__ == "__main__":
     if status == "Reload":
       logger.info("Controller reload received")
       #Here nothing need to be done. The loop will restart MIDI
+      CustomLogger.flush_logging()
       status = None
     elif status == "Reboot":
       logger.info("Controller reboot received")
@@ -129,5 +153,14 @@ if __name__ == "__main__":
       break
       
     if command != None:
+      if control_server != None:
+        control_server.stop()
+        control_server = None
       logger.debug("Running command: %s", command)
-      os.system(command)
\ No newline at end of file
+      #The log must be completely written before rebooting or shutting down
+      CustomLogger.shutdown_logging()
+      os.system(command)
+
+  if control_server != None:
+    control_server.stop()
+  CustomLogger.shutdown_logging()
\ No newline at end of file
@@ -0,0 +1,113 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# JMMidiBassPedalController v3.0
+# File: src/LatencyHistogram.py
+# By:   Josef Meile <jmeile@hotmail.com> @ 28.10.2020
+# This project is licensed under the MIT License. Please see the LICENSE.md file
+# on the main folder of this code. An online version can be found here:
+# https://github.com/jmeile/JMMidiBassPedalController/blob/master/LICENSE.md
+#
+"""Fixed size histogram to record latencies in nanoseconds."""
+
+from array import array
+
+#Number of bits used to divide each power of two in sub buckets. With three
+#bits, each power of two has eight buckets, so, the error is at most 12.5%
+SUB_BUCKET_BITS = 3
+
+#Values equal or bigger than 2^MAX_VALUE_BITS nanoseconds (about 18 minutes)
+#will be recorded on the last bucket
+MAX_VALUE_BITS = 40
+
+class LatencyHistogram:
+  """
+  Histogram with logarithmic buckets similar to the ones of HdrHistogram:
+  values smaller than 16 have their own bucket; bigger values are grouped by
+  their power of two, which is at the same time divided in eight linear sub
+  buckets.
+
+  All the memory is allocated when creating the histogram, so, recording a
+  value doesn't create containers nor keeps new objects. Since it doesn't use
+  locks, only one thread should record values; other threads may read the
+  statistics at any time, but they may be off by the events being recorded at
+  that moment
+  """
+
+  def __init__(self):
+    """
+    Initializes the class attributes
+    """
+    self._num_buckets = ((MAX_VALUE_BITS - SUB_BUCKET_BITS) << SUB_BUCKET_BITS) \
+                        + (2 << SUB_BUCKET_BITS)
+    self._last_bucket = self._num_buckets - 1
+    self._counts = array('q', bytes(8 * self._num_buckets))
+    self.max_value = 0
+
+  def record(self, value):
+    """
+    Records a value
+    Parameters:
+    * value: latency in nanoseconds
+    """
+    if value < 16:
+      index = value
+    else:
+      exponent = value.bit_length() - (SUB_BUCKET_BITS + 1)
+      index = (exponent << SUB_BUCKET_BITS) + (value >> exponent)
+      if index > self._last_bucket:
+        index = self._last_bucket
+    self._counts[index] += 1
+    if value > self.max_value:
+      self.max_value = value
+
+  def _get_upper_bound(self, index):
+    """
+    Gets the biggest value that can be recorded on the specified bucket
+    Parameters:
+    * index: bucket index
+    Returns:
+    * The upper bound of the bucket in nanoseconds
+    """
+    if index < 16:
+      return index
+    exponent = (index >> SUB_BUCKET_BITS) - 1
+    mantissa = (index & ((1 << SUB_BUCKET_BITS) - 1)) + (1 << SUB_BUCKET_BITS)
+    return ((mantissa + 1) << exponent) - 1
+
+  def get_count(self):
+    """
+    Returns the number of recorded values
+    """
+    return sum(self._counts)
+
+  def get_percentile(self, percentile):
+    """
+    Gets the value below which the specified percentage of values fall
+    Parameters:
+    * percentile: percentage between 0 and 100
+    Returns:
+    * The upper bound of the bucket where the percentile is. It won't be bigger
+      than the maximum recorded value. If there aren't recorded values, then
+      zero will be returned
+    """
+    counts = self._counts.tolist()
+    target = sum(counts) * percentile / 100.0
+    accumulated = 0
+    for index in range(len(counts)):
+      accumulated += counts[index]
+      if (counts[index] != 0) and (accumulated >= target):
+        return min(self._get_upper_bound(index), self.max_value)
+    return 0
+
+  def get_stats(self):
+    """
+    Returns a dictionary with the number of recorded values, the p50, the p99,
+    and the maximum value in nanoseconds
+    """
+    return {
+      'count': self.get_count(),
+      'p50': self.get_percentile(50),
+      'p99': self.get_percentile(99),
+      'max': self.max_value
+    }
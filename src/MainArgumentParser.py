@@ -27,9 +27,14 @@ class MainArgumentParser(ArgumentParser):
   Remarks:
   * The main application will accept the following command line options:
     --config: specifies the XML configuration file to use. It can be a relative
-      or absolute path.
+      or absolute path. Several files can be given; on that case, a controller
+      will be run for each one of them.
     --list: the available MIDI IN and OUT ports will be printed.
     --verbose: prints and logs vebose messages.
+    --quiet: ignores the debug messages while processing the MIDI messages.
+    --watch: reloads the configuration after its files change.
+    --port-timeout: waits for the MIDI ports and reconnects them.
+    --control-socket: accepts commands on a UNIX domain socket.
   """
   
   def __init__(self,
@@ -47,10 +52,27 @@ class MainArgumentParser(ArgumentParser):
   def add_arguments(self,
                     main_help = "Shows this help message and exits",
                     config_help = "XML Configuration file to use. If not given, "
-                    "then conf/sample-config.xml will be assumed",
+                    "then conf/sample-config.xml will be assumed.\nSeveral "
+                    "files can be given; each one will be run as an\n"
+                    "independent controller on the same process",
                     list_help = "It will show a list of the available MIDI "
                     "ports, then it will exit",
-                    verbose_help = "Prints and logs verbose messages"):
+                    verbose_help = "Prints and logs verbose messages",
+                    quiet_help = "Ignores the debug messages while processing "
+                    "the MIDI messages.\nUse it on production to save time on "
+                    "each MIDI event",
+                    watch_help = "Reloads the configuration after the XML "
+                    "file, the XSD schema,\nor the panic file change",
+                    port_timeout_help = "Waits up to the given seconds for "
+                    "the MIDI ports at startup.\nIf the devices get "
+                    "disconnected, then their ports will be opened\nagain "
+                    "when they come back within that time. Use 0 to wait\n"
+                    "forever. If not given, then the program will exit when "
+                    "the ports\naren't found",
+                    control_socket_help = "Path of a UNIX domain socket "
+                    "accepting the commands: bank <number>,\nprevious, next, "
+                    "last, list, panic, reload, quit, and stats.\nThey run "
+                    "as the BankSelect messages from 119 until 125"):
     """
     Adds the command line options and commands to the argument parser
     
@@ -59,16 +81,30 @@ class MainArgumentParser(ArgumentParser):
     * config_help: help of the "--config" command line option
     * list_help: help of the "--list" command line option
     * verbose_help: help of the "--verbose" command line option
+    * quiet_help: help of the "--quiet" command line option
+    * watch_help: help of the "--watch" command line option
+    * port_timeout_help: help of the "--port-timeout" command line option
+    * control_socket_help: help of the "--control-socket" command line option
     """
     self._parser.add_argument("-h", "--help", action = "help",
       default = argparse.SUPPRESS, help = main_help)
 
     group = self._parser.add_mutually_exclusive_group()
-    group.add_argument("-c", "--config", default = "conf/sample-config.xml",
+    group.add_argument("-c", "--config", nargs = '+',
+                       default = ["conf/sample-config.xml"],
                        help = config_help)
     group.add_argument("-l", "--list", action = "store_true", help = list_help)
-    self._parser.add_argument("-v", "--verbose", action = "store_true",
-                              help = verbose_help)
+    log_group = self._parser.add_mutually_exclusive_group()
+    log_group.add_argument("-v", "--verbose", action = "store_true",
+                           help = verbose_help)
+    log_group.add_argument("-q", "--quiet", action = "store_true",
+                           help = quiet_help)
+    self._parser.add_argument("-w", "--watch", action = "store_true",
+                              help = watch_help)
+    self._parser.add_argument("-t", "--port-timeout", type = int,
+                              help = port_timeout_help)
+    self._parser.add_argument("-s", "--control-socket",
+                              help = control_socket_help)
 
   def parse_arguments(self):
     """
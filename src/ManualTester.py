@@ -17,14 +17,17 @@ import logging
 from autologging import logged
 import time
 from rtmidi.midiconstants import CONTROL_CHANGE, NOTE_OFF, NOTE_ON, \
-                                 SYSTEM_EXCLUSIVE
+                                 SYSTEM_EXCLUSIVE, END_OF_EXCLUSIVE
 from rtmidi.midiutil import open_midioutput, open_midiinput
 from MidiUtilities import get_velocity_symbol, calculate_base_note_octave, \
                           parse_note, is_valid_midi_message, is_valid_sysex, \
                           NOTE_MIDI_TO_SYMBOL, NOTE_SYMBOL_TO_MIDI, \
                           FIRST_OCTAVE, LAST_OCTAVE
 from MidiInputHandler import MidiInputHandler
-from ByteUtilities import convert_unicode_from_7_bit_bytes
+from SysExReassembler import SYSEX_COMPLETE
+from ByteUtilities import BankListDecoder, SYSEX_MANUFACTURER_ID, \
+                          BANK_LIST_OPERATION, BANK_LIST_REQUEST_OPERATION, \
+                          BANK_LIST_PAGE_OPERATION
 import codecs
 
 #By default, file logging is enabled
@@ -73,6 +76,8 @@ class MyMidiInputHandler(MidiInputHandler):
     self._note_velocity = note_velocity
     self._encoding = encoding
     self._got_answer = False
+    self._bank_list_decoder = BankListDecoder(encoding)
+    self._bank_list_started = False
   
   def _send_midi_message(self, message):
     """
@@ -147,62 +152,36 @@ class MyMidiInputHandler(MidiInputHandler):
   def _on_system_exclusive(self, message):
     """
     Callback method for SYSTEM EXCLUSIVE messages
+    Remarks:
+    * The names of the bank lists and their pages are shown as soon as they
+      are decoded; the rest of the message doesn't need to be received
     """
-    if not self._receive_sysex(message):
+    result = self._receive_sysex(message)
+    bank_list_decoder = self._bank_list_decoder
+    if message[0] == SYSTEM_EXCLUSIVE:
+      self._bank_list_started = False
+    bank_names = bank_list_decoder.feed(message)
+    operation = bank_list_decoder.get_operation()
+    is_bank_list = operation in [BANK_LIST_OPERATION, BANK_LIST_PAGE_OPERATION]
+    if is_bank_list and not self._bank_list_started:
+      self.__log.info("Bank list:")
+      self._bank_list_started = True
+    for bank_number, bank_name in bank_names:
+      self.__log.info(str(bank_number) + " - " + bank_name)
+
+    if result == SYSEX_COMPLETE:
       #This means that the end of the SysEx message (0xF7) was detected,
-      #so, no further bytes will be received. Here the SysEx buffer will
-      #be sent and afterwards cleared
-      
-      if message[0:3] == [0xF0, 0x7D, 0x00]:
-        self.__log.info("Bank list:")
-        bank_number = 0
-        byte_number = 3
-        total_byte_sum = 0
-        num_bytes = len(message)
-        data_length = 0
-        while byte_number < num_bytes - 2:
-          byte = message[byte_number]
-          total_byte_sum += byte
-          if byte == 0x00:
-            data_length += 0x7F
-            byte_number += 1
-          else:
-            data_length += byte
-            byte_number += 1
-            data_count = 1
-            byte_lst = []
-            while (byte_number < num_bytes - 2) and (data_count <= data_length):
-              byte = message[byte_number]
-              byte_lst += [byte]
-              total_byte_sum += byte
-              data_count += 1
-              byte_number += 1
-              
-            if data_count <= data_length:
-              raise Exception("Malformed SysEx: misssing data from bank: %d, "
-                              "expected: %d bytes, got %d bytes" % \
-                              (bank_number, data_length, data_count - 1))
-            
-            bank_name = convert_unicode_from_7_bit_bytes(bytes(byte_lst),
-                          encoding = self._encoding)
-            self.__log.info(str(bank_number) + " - " + bank_name)
-            bank_number += 1
-            data_length = 0
-            
-        checksum = message[byte_number]
-        calculated_checksum = 128 - (total_byte_sum % 128)
-        if checksum != calculated_checksum:
-          raise Exception("Malformed SysEx: invalid checksum, got: %d, "
-                          "expected: %d" % (calculated_checksum, checksum))
+      #so, no further bytes will be received
+      if not is_bank_list:
+        self._print_message(list(self._sysex.get_message()), "Answer")
+        self._got_answer = True
       else:
-        self._print_message(message, "Answer")
-
-      #Clears SysEx buffer
-      self._sysex_buffer = []
-      #Resets SysEx count to zero
-      self._sysex_chunk = 0
-      
-      self._got_answer = True
+        page_index, num_pages = bank_list_decoder.get_page()
+        if operation == BANK_LIST_PAGE_OPERATION:
+          self.__log.info("Page %d of %d was received", page_index + 1,
+                          num_pages)
+        if page_index + 1 >= num_pages:
+          self._got_answer = True
 
   def _process_note(self, user_option):
     """
@@ -355,10 +334,50 @@ class MyMidiInputHandler(MidiInputHandler):
     self._midi_out.send_message(message)
     return True
 
+  def _process_bank_list_request(self):
+    """
+    Reads the range of banks whose names will be requested to the controller
+    and sends the request.
+    Returns:
+    * Whether or not to wait for an answer from the controller.
+    """
+    first_bank = self._read_number("\nFirst bank [1-119] (Control-C to "
+                                   "exit): ", 1, 119)
+    num_banks = self._read_number("\nNumber of banks [0-119], 0 = all the "
+                                  "remaining banks (Control-C to exit): ", 0,
+                                  119)
+    message = [SYSTEM_EXCLUSIVE, SYSEX_MANUFACTURER_ID,
+               BANK_LIST_REQUEST_OPERATION, first_bank - 1, num_banks,
+               END_OF_EXCLUSIVE]
+    self._print_message(message, "Sending")
+    self._midi_out.send_message(message)
+    return True
+
+  def _read_number(self, prompt, min_value, max_value):
+    """
+    Reads a number from the standard input until it is valid
+    Parameters:
+    * prompt: text to show
+    * min_value: smallest allowed value
+    * max_value: biggest allowed value
+    Returns:
+    * The entered number
+    """
+    while True:
+      value = input(prompt)
+      try:
+        value = int(value)
+        if (min_value <= value) and (value <= max_value):
+          return value
+      except:
+        pass
+      self.__log.info("\nWrong value. Please enter numbers between %d and %d",
+                      min_value, max_value)
+
   def read_user_input(self):
     """Asks the user what kind of message to send"""
     user_option = ''
-    options = ['1', '2', '3', '4', '5']
+    options = ['1', '2', '3', '4', '5', '6']
     while user_option not in options:
       print('')
       self.__log.info('[1] Send a NOTE ON message')
@@ -366,6 +385,7 @@ class MyMidiInputHandler(MidiInputHandler):
       self.__log.info('[3] Send a BANK SELECT message')
       self.__log.info('[4] Send a CONTROL CHANGE message')
       self.__log.info('[5] Send a raw MIDI or SysEx message')
+      self.__log.info('[6] Request a range of bank names')
       user_option = input("Enter your option (Control-C to exit): ")
       if user_option not in options:
         self.__log.info("\nWrong option. Only %s are allowed" % repr(options))
@@ -375,6 +395,8 @@ class MyMidiInputHandler(MidiInputHandler):
       wait_answer, message = self._process_note(user_option)
     elif user_option in ['3', '4']:
       wait_answer = self._process_control_change(user_option)
+    elif user_option == '6':
+      wait_answer = self._process_bank_list_request()
     else:
       wait_answer = self._process_midi_or_sysex()
     
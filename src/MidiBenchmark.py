@@ -0,0 +1,533 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# JMMidiBassPedalController v3.0
+# File: src/MidiBenchmark.py
+# By:   Josef Meile <jmeile@hotmail.com> @ 28.10.2020
+# This project is licensed under the MIT License. Please see the LICENSE.md file
+# on the main folder of this code. An online version can be found here:
+# https://github.com/jmeile/JMMidiBassPedalController/blob/master/LICENSE.md
+#
+"""
+Helper script to measure how many MIDI events per second the MidiProcessor is
+able to handle.
+
+No MIDI port is needed: the events are sent directly to the MidiProcessor
+callback and the resulting messages are discarded by a fake MIDI OUT
+interface.
+
+The following scenarios will be replayed against each configuration:
+* pedal_mashing: overlapping NOTE ON and NOTE OFF messages of all the pedals
+  from the initial bank.
+* bank_switching_stop, bank_switching_continue, bank_switching_quick: a pedal
+  gets pushed, then the next bank gets selected, and finally the pedal gets
+  released. The OnBankChange attribute will be set to: StopPlayback,
+  ContinuePlayback, and QuickChange respectively.
+* clock_flood: MIDI clock messages.
+* echo: NOTE, CONTROL CHANGE, and PITCH BEND messages comming through a
+  channel different than the controller channel.
+* large_sysex: a SysEx message of 4096 bytes splitted in chunks of 256 bytes.
+
+With the --quiet option, each scenario will be run a second time with the
+quiet mode enabled, so that the time spent per event on the debug messages
+gets shown.
+
+With the --allocations option, the script will also measure with tracemalloc
+the memory allocated on each event by the processing; on the steady state, it
+should be zero.
+
+With the --json option, the results will be also written as JSON, so that they
+can be compared between different versions or machines.
+
+Run the script as follows:
+python MidiBenchmark.py -h
+
+There you will see the diferent command-line options supported by the script.
+"""
+
+from __future__ import print_function
+import argparse
+from argparse import ArgumentParser
+from argparse import RawTextHelpFormatter
+import copy
+import glob
+import json
+import os
+import platform
+import sys
+import time
+import tracemalloc
+import logging
+import xmlschema
+from rtmidi.midiconstants import (CONTROL_CHANGE, NOTE_OFF, NOTE_ON,
+                                  PITCH_BEND, SYSTEM_EXCLUSIVE,
+                                  END_OF_EXCLUSIVE, TIMING_CLOCK)
+from MidiProcessor import MidiProcessor
+
+#Value of the BankSelectController to select the next bank
+NEXT_BANK = 121
+
+#Size of the SysEx message of the large_sysex scenario and of its chunks
+SYSEX_SIZE = 4096
+SYSEX_CHUNK_SIZE = 256
+
+class FakeMidiIn:
+  """
+  Replaces rtmidi.MidiIn. It only stores the callback set by the
+  MidiInputHandler, so that it can be fired without a MIDI port
+  """
+  def __init__(self):
+    self.callback = None
+
+  def set_callback(self, callback):
+    self.callback = callback
+
+  def ignore_types(self, sysex = True, timing = True, active_sense = True):
+    pass
+
+class FakeMidiOut:
+  """
+  Replaces rtmidi.MidiOut. It only counts the sent messages
+  """
+  def __init__(self):
+    self.sent_messages = 0
+
+  def send_message(self, message):
+    self.sent_messages += 1
+
+class NullMidiOut:
+  """
+  Replaces rtmidi.MidiOut without doing anything at all. It is used when
+  measuring allocations, so that counting the messages doesn't allocate
+  memory
+  """
+  def send_message(self, message):
+    pass
+
+class MidiBenchmarkArgumentParser(ArgumentParser):
+  """
+  ArgumentParser for the benchmark application
+
+  Remarks:
+  - The benchmark application will accept the following command line options:
+    * --config: XML configuration file to use.
+    * --scenario: scenario to run.
+    * --events: number of MIDI events to send.
+    * --allocations: measures the allocated memory per event.
+    * --quiet: compares the results with the quiet mode.
+    * --json: writes the results to a JSON file.
+  """
+
+  def __init__(self, description = "Measures the number of MIDI events per "
+               "second processed by the foot controller"):
+    """
+    Setups the ArgumentParser of the benchmark program
+
+    Parameters:
+    * description: description of what the program is doing
+    """
+    self._parser = ArgumentParser(description = description,
+      formatter_class = RawTextHelpFormatter, add_help = False)
+
+  def add_arguments(self,
+                    main_help = "Shows this help message and exits",
+                    config_help = "XML file to use. It can be given several "
+                    "times. If not given, then all\nthe XML files on the conf "
+                    "folder will be used\n",
+                    scenario_help = "Scenario to run. It can be given several "
+                    "times. If not given, then\nall the scenarios will be run",
+                    events_help = "Number of MIDI events to send on each "
+                    "scenario. It defaults to\n100000",
+                    allocations_help = "Measures the allocated memory per "
+                    "event with tracemalloc",
+                    quiet_help = "Runs the benchmark again with the quiet "
+                    "mode enabled and shows\nthe time per event saved by it",
+                    json_help = "Writes the results as JSON to the given "
+                    "file. Use '-' to write\nthem to the console"):
+    """
+    Adds the command line options and commands to the argument parser
+
+    Parameters:
+    * main_help: text of the -h, --help option
+    * config_help: help of the "--config" command line option
+    * scenario_help: help of the "--scenario" command line option
+    * events_help: help of the "--events" command line option
+    * allocations_help: help of the "--allocations" command line option
+    * quiet_help: help of the "--quiet" command line option
+    * json_help: help of the "--json" command line option
+    """
+    self._parser.add_argument("-h", "--help", action = "help",
+      default = argparse.SUPPRESS, help = main_help)
+
+    self._parser.add_argument("-c", "--config", action = "append",
+                              help = config_help)
+    self._parser.add_argument("-s", "--scenario", action = "append",
+                              choices = list(SCENARIOS.keys()),
+                              help = scenario_help)
+    self._parser.add_argument("-e", "--events", type = int, default = 100000,
+                              help = events_help)
+    self._parser.add_argument("-a", "--allocations", action = "store_true",
+                              help = allocations_help)
+    self._parser.add_argument("-q", "--quiet", action = "store_true",
+                              help = quiet_help)
+    self._parser.add_argument("-j", "--json", help = json_help)
+
+  def parse_arguments(self):
+    """
+    Validates the supplied command line options. It will show an error
+    message if the vaildation failed and then it will exit
+    """
+    return self._parser.parse_args()
+
+def create_processor(xml_dict):
+  """
+  Creates a MidiProcessor with fake MIDI interfaces for the entered
+  configuration
+  Parameters:
+  * xml_dict: dictionary with the parsed configuration file. It will be
+    modified by the MidiProcessor
+  Returns:
+  * A tuple with the MidiProcessor and the fake MIDI IN and OUT interfaces
+  """
+  midi_in = FakeMidiIn()
+  midi_out = FakeMidiOut()
+  midi_processor = MidiProcessor(xml_dict, midi_in, midi_out,
+                                 ignore_sysex = False, ignore_timing = False,
+                                 ignore_active_sense = False)
+  midi_processor.parse_xml()
+  return midi_processor, midi_in, midi_out
+
+def _get_pedal_notes(midi_processor):
+  """
+  Gets the notes of the pedals from the current bank, which neither change
+  banks nor quit the controller
+  Parameters:
+  * midi_processor: MidiProcessor used to get the pedals
+  Returns:
+  * A list with the pedal notes
+  """
+  bank = midi_processor._xml_dict['Bank'][midi_processor._current_bank]
+  pedal_notes = []
+  for note, pedal in bank['@PedalList'].items():
+    if pedal.get('@BankSelect') == None:
+      pedal_notes.append(note)
+  return pedal_notes
+
+def create_pedal_events(midi_processor):
+  """
+  Creates the NOTE ON and NOTE OFF events of all the pedals from the initial
+  bank
+  Parameters:
+  * midi_processor: MidiProcessor used to get the pedals
+  Returns:
+  * A list with MIDI events. Each event is a tuple with the message and the
+    delta time
+  """
+  in_channel = midi_processor._xml_dict['@InChannel']
+  events = []
+  for note in _get_pedal_notes(midi_processor):
+    events.append(([NOTE_ON | in_channel, note, 100], 0.0))
+    events.append(([NOTE_OFF | in_channel, note, 0], 0.0))
+  return events
+
+def create_pedal_mashing_events(midi_processor):
+  """
+  Creates overlapping NOTE ON and NOTE OFF events of all the pedals from the
+  initial bank: each pedal is pushed before the previous one gets released.
+  Some pedals are released with NOTE ON messages with zero velocity
+  Parameters:
+  * midi_processor: MidiProcessor used to get the pedals
+  Returns:
+  * A list with MIDI events
+  """
+  in_channel = midi_processor._xml_dict['@InChannel']
+  pedal_notes = _get_pedal_notes(midi_processor)
+  events = []
+  previous_note = None
+  for index in range(len(pedal_notes)):
+    note = pedal_notes[index]
+    velocity = (index * 37) % 127 + 1
+    events.append(([NOTE_ON | in_channel, note, velocity], 0.0))
+    if previous_note != None:
+      if index % 2 == 0:
+        events.append(([NOTE_ON | in_channel, previous_note, 0], 0.0))
+      else:
+        events.append(([NOTE_OFF | in_channel, previous_note, 64], 0.0))
+    previous_note = note
+  if previous_note != None:
+    events.append(([NOTE_OFF | in_channel, previous_note, 0], 0.0))
+  return events
+
+def create_bank_switching_events(midi_processor):
+  """
+  Creates events where a pedal gets pushed, then the next bank gets selected,
+  and finally the pedal gets released
+  Parameters:
+  * midi_processor: MidiProcessor used to get the pedals
+  Returns:
+  * A list with MIDI events
+  """
+  xml_dict = midi_processor._xml_dict
+  in_channel = xml_dict['@InChannel']
+  bank_select_controller = xml_dict['@BankSelectController']
+  events = []
+  for note in _get_pedal_notes(midi_processor):
+    events.append(([NOTE_ON | in_channel, note, 100], 0.0))
+    events.append(([CONTROL_CHANGE | in_channel, bank_select_controller,
+                    NEXT_BANK], 0.0))
+    events.append(([NOTE_OFF | in_channel, note, 0], 0.0))
+  return events
+
+def create_clock_flood_events(midi_processor):
+  """
+  Creates the MIDI clock messages of one bar in 4/4
+  Parameters:
+  * midi_processor: not used
+  Returns:
+  * A list with MIDI events
+  """
+  return [([TIMING_CLOCK], 0.0) for clock in range(96)]
+
+def create_echo_events(midi_processor):
+  """
+  Creates NOTE, CONTROL CHANGE, and PITCH BEND events comming through a
+  channel different than the controller channel, so that they will be echoed
+  Parameters:
+  * midi_processor: MidiProcessor used to get the controller channel
+  Returns:
+  * A list with MIDI events
+  """
+  channel = (midi_processor._xml_dict['@InChannel'] + 1) % 16
+  events = []
+  for note in range(36, 97):
+    events.append(([NOTE_ON | channel, note, 100], 0.0))
+    events.append(([CONTROL_CHANGE | channel, 7, note], 0.0))
+    events.append(([PITCH_BEND | channel, 0, note], 0.0))
+    events.append(([NOTE_OFF | channel, note, 0], 0.0))
+  return events
+
+def create_large_sysex_events(midi_processor):
+  """
+  Creates the chunks of a large SysEx message
+  Parameters:
+  * midi_processor: not used
+  Returns:
+  * A list with MIDI events
+  """
+  sysex_message = [SYSTEM_EXCLUSIVE, 0x7D] + \
+                  [index % 128 for index in range(SYSEX_SIZE - 3)] + \
+                  [END_OF_EXCLUSIVE]
+  events = []
+  for index in range(0, SYSEX_SIZE, SYSEX_CHUNK_SIZE):
+    events.append((sysex_message[index:index + SYSEX_CHUNK_SIZE], 0.0))
+  return events
+
+"""
+Available scenarios. Each one has the function creating its events and the
+attributes of the configuration that will be overriden
+"""
+SCENARIOS = {
+  'pedal_mashing': (create_pedal_mashing_events, {}),
+  'bank_switching_stop': (create_bank_switching_events,
+                          {'@OnBankChange': 'StopPlayback'}),
+  'bank_switching_continue': (create_bank_switching_events,
+                              {'@OnBankChange': 'ContinuePlayback'}),
+  'bank_switching_quick': (create_bank_switching_events,
+                           {'@OnBankChange': 'QuickChange'}),
+  'clock_flood': (create_clock_flood_events, {}),
+  'echo': (create_echo_events, {}),
+  'large_sysex': (create_large_sysex_events, {}),
+}
+
+def run_benchmark(midi_in, events, num_events):
+  """
+  Sends the entered events to the MIDI callback
+  Parameters:
+  * midi_in: fake MIDI IN interface
+  * events: list of events to send. They will be repeated until reaching
+    num_events
+  * num_events: number of events to send
+  Returns:
+  * A tuple with the elapsed time in nanoseconds and the number of sent
+    events
+  """
+  callback = midi_in.callback
+  num_repetitions = max(1, num_events // len(events))
+  start_time = time.perf_counter_ns()
+  for repetition in range(num_repetitions):
+    for event in events:
+      callback(event)
+  return time.perf_counter_ns() - start_time, num_repetitions * len(events)
+
+def _measure_peak_memory(callback, events):
+  """
+  Sends the entered events to the callback and sums the peak of the traced
+  memory reached during each event
+  Parameters:
+  * callback: function that will receive the events
+  * events: list of events to send
+  Returns:
+  * The sum of the peak memory in bytes
+  """
+  total_peak = 0
+  for event in events:
+    memory_before = tracemalloc.get_traced_memory()[0]
+    tracemalloc.reset_peak()
+    callback(event)
+    total_peak += tracemalloc.get_traced_memory()[1] - memory_before
+  return total_peak
+
+def measure_allocations(midi_processor, midi_in, events):
+  """
+  Measures the memory allocated by the MidiProcessor on each event
+  Parameters:
+  * midi_processor: MidiProcessor to measure
+  * midi_in: fake MIDI IN interface
+  * events: list of events to send. They will be sent once before measuring,
+    so that only the steady state gets measured
+  Returns:
+  * The mean of bytes allocated per event
+  Remarks:
+  * Logging and the latency statistics are disabled during the measurement;
+    otherwise, the created log records and the temporary integers of the
+    timestamps would be counted as well
+  * The memory used by the measurement itself is substracted by running the
+    same measurement with a callback that doesn't do anything
+  """
+  dispatch_table = midi_processor._dispatch_table
+  #Same as the MIDI callback, but without measuring the latency
+  callback = lambda event: dispatch_table[event[0][0]](event[0])
+  midi_out = midi_processor._midi_out
+  midi_processor._midi_out = NullMidiOut()
+  previous_disable = logging.root.manager.disable
+  logging.disable(logging.CRITICAL)
+  try:
+    for event in events:
+      callback(event)
+    tracemalloc.start()
+    overhead = _measure_peak_memory(lambda event: None, events)
+    total_peak = _measure_peak_memory(callback, events)
+    tracemalloc.stop()
+  finally:
+    logging.disable(previous_disable)
+    midi_processor._midi_out = midi_out
+  return max(0, total_peak - overhead) / len(events)
+
+def run_scenario(xml_dict, scenario, num_events, allocations = False,
+                 quiet = False):
+  """
+  Runs a benchmark scenario
+  Parameters:
+  * xml_dict: dictionary with the parsed configuration file. It won't be
+    modified
+  * scenario: name of the scenario to run. See: SCENARIOS
+  * num_events: number of events to send
+  * allocations: whether or not to measure the allocated memory per event
+  * quiet: whether or not to run the scenario again with the quiet mode
+    enabled
+  Returns:
+  * A dictionary with the results
+  """
+  create_events, overrides = SCENARIOS[scenario]
+  xml_dict = copy.deepcopy(xml_dict)
+  xml_dict.update(overrides)
+  midi_processor, midi_in, midi_out = create_processor(xml_dict)
+  events = create_events(midi_processor)
+  result = {'scenario': scenario}
+  if len(events) == 0:
+    #ie: there aren't pedals on the initial bank
+    result['skipped'] = True
+    return result
+
+  elapsed_time, sent_events = run_benchmark(midi_in, events, num_events)
+  result['events'] = sent_events
+  result['sent_messages'] = midi_out.sent_messages
+  result['events_per_sec'] = sent_events * 1e9 / elapsed_time
+  result['ns_per_event'] = elapsed_time / sent_events
+  result['latency'] = midi_processor.get_latency_stats()
+  if allocations:
+    result['allocated_bytes_per_event'] = \
+      measure_allocations(midi_processor, midi_in, events)
+  if quiet:
+    MidiProcessor.set_quiet_mode(True)
+    try:
+      quiet_time, sent_events = run_benchmark(midi_in, events, num_events)
+    finally:
+      MidiProcessor.set_quiet_mode(False)
+    result['quiet_ns_per_event'] = quiet_time / sent_events
+  return result
+
+def print_result(result):
+  """
+  Prints the results of a scenario
+  Parameters:
+  * result: dictionary returned by run_scenario
+  """
+  if result.get('skipped'):
+    print("  %s: skipped, no events" % result['scenario'])
+    return
+  print("  %s: %d events, %d sent messages, %.0f events/sec, %.0f ns/event" % \
+        (result['scenario'], result['events'], result['sent_messages'],
+         result['events_per_sec'], result['ns_per_event']))
+  for event_class, stats in result['latency'].items():
+    print("    %s latency: p50: %d ns, p99: %d ns, max: %d ns" % \
+          (event_class, stats['p50'], stats['p99'], stats['max']))
+  if 'allocated_bytes_per_event' in result:
+    print("    Allocated bytes/event: %.1f" % \
+          result['allocated_bytes_per_event'])
+  if 'quiet_ns_per_event' in result:
+    print("    Quiet mode: %.0f ns/event, logging overhead removed: %.0f "
+          "ns/event" % (result['quiet_ns_per_event'],
+          result['ns_per_event'] - result['quiet_ns_per_event']))
+
+def silence_console():
+  """
+  Stops printing the log messages to the console; otherwise, the messages of
+  the bank changes would flood it. The log levels of the loggers aren't
+  changed, so that the cost of the log calls is still measured
+  """
+  for logger in list(logging.root.manager.loggerDict.values()):
+    for handler in getattr(logger, 'handlers', []):
+      if isinstance(handler, logging.StreamHandler):
+        handler.setLevel(logging.CRITICAL + 1)
+
+schema_name = 'conf/MidiBassPedalController.xsd'
+if __name__ == "__main__":
+  parser = MidiBenchmarkArgumentParser()
+  parser.add_arguments()
+  args = parser.parse_arguments()
+
+  config_files = args.config
+  if config_files == None:
+    config_files = sorted(glob.glob(os.path.join('conf', '*.xml')))
+  scenarios = args.scenario
+  if scenarios == None:
+    scenarios = list(SCENARIOS.keys())
+
+  silence_console()
+  xsd_schema = xmlschema.XMLSchema11(schema_name)
+  results = []
+  for config_file in config_files:
+    print("Config: %s" % config_file)
+    xml_dict = xsd_schema.to_dict(config_file)
+    for scenario in scenarios:
+      result = run_scenario(xml_dict, scenario, args.events,
+                            args.allocations, args.quiet)
+      result['config'] = config_file
+      print_result(result)
+      results.append(result)
+
+  if args.json != None:
+    report = {
+      'python': platform.python_version(),
+      'platform': platform.platform(),
+      'machine': platform.machine(),
+      'events': args.events,
+      'results': results
+    }
+    if args.json == '-':
+      json.dump(report, sys.stdout, indent = 2)
+      print()
+    else:
+      with open(args.json, 'w') as json_file:
+        json.dump(report, json_file, indent = 2)
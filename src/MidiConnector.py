@@ -15,18 +15,48 @@ Connects to the MIDI ports
 from __future__ import print_function
 import traceback
 import sys
-import fnmatch
-from rtmidi import MidiIn, MidiOut
-from rtmidi.midiutil import open_midiport
-from MidiProcessor import MidiProcessor
+import inspect
+import signal
+import threading
+import time
+from MidiPortManager import get_port_manager
 from CustomLogger import CustomLogger, PrettyFormat
 import logging
 from autologging import logged
-import xmlschema
 import platform
 
+#The modules needed to compile the configuration and to process the MIDI
+#messages, ie: MidiProcessor, ConfigCache, and xmlschema, are imported where
+#they are used, so that listing the MIDI ports doesn't load them
+
 VIRTUAL_PREFFIX = "Virtual:"
 
+#Seconds between the checks of the available MIDI ports while waiting for
+#them or while monitoring the opened ones. A device that gets connected again
+#will be reopened after at most this time
+PORT_POLL_INTERVAL = 1.0
+
+#Commands of the control socket and the values of the BankSelect messages
+#running them. See: handle_control_command
+CONTROL_COMMANDS = {
+  'list': 119,
+  'previous': 120,
+  'next': 121,
+  'last': 122,
+  'panic': 123,
+  'quit': 124,
+  'reload': 125
+}
+
+#Attributes of the configuration that are only read when the MidiProcessor is
+#created; if they change, then reloading the configuration creates it again
+HANDLER_ATTRIBUTES = ['EventQueueSize', 'EventQueueOverflow', 'MaxSysExSize',
+                      'SysExStreaming', 'OutputByteRate', 'OutputBurstSize',
+                      'OutputMaxDelay']
+
+#Names of the interface types used on the log messages
+INTERFACE_NAMES = {'input': "MIDI IN", 'output': "MIDI OUT"}
+
 #Creates a logger for this module.
 logger = logging.getLogger(CustomLogger.get_module_name())
 
@@ -40,25 +70,44 @@ class MidiConnector:
   Opens the MIDI ports and process the incomming connections
   """
   
-  def __init__(self, args, xsd_schema = 'conf/MidiBassPedalController.xsd'):
+  def __init__(self, args, xsd_schema = 'conf/MidiBassPedalController.xsd',
+               config_file = None):
     """
     Initializes the MidiConnector class
     Parameters:
     * args: command-line arguments
     * xsd_schema: path to the xsd schema
+    * config_file: path to the xml configuration file. If None, then the
+      first file given by the --config option will be used
     """
     self.__log.debug("Initializing MidiConnector")
     self._args = args
     self._xsd_schema = xsd_schema
-    self._midi_in = None
-    self._midi_out = None
+    if config_file == None:
+      config_file = args.config
+      if type(config_file) == list:
+        config_file = config_file[0]
+    self._config_file = config_file
     self._in_ports = []
-    self._in_port = 0
-    self._use_virtual_in = False 
     self._out_ports = []
-    self._out_port = 0
-    self._use_virtual_out = False
+    #Ports of the configuration for each interface type. See: _parse_ports
+    self._midi_ports = {'input': [], 'output': []}
     self._xml_dict = {}
+    self._compiled_config = None
+    self._reload_time = None
+    self._reload_thread = None
+    self._midi_processor = None
+    self._config_watcher = None
+    self._port_monitor = None
+    self._stop_port_monitor = threading.Event()
+    self._config_cache = None
+    self._event_stats = None
+    #Set by quit to stop waiting for the MIDI ports
+    self._quit_requested = threading.Event()
+    #The port manager is shared by all the connectors; the port listener is
+    #only registered while start runs, so that it doesn't keep this connector
+    #alive afterwards
+    self._port_manager = get_port_manager()
     self.__log.debug("MidiConnector was initialized:\n%s", 
                      PrettyFormat(self.__dict__))
 
@@ -71,16 +120,30 @@ class MidiConnector:
     Returns:
     * A status string; either: "Quit", "Reload", "Reboot", or "Shutdown"
     """
+    self._port_manager.add_port_listener(self._log_port_changes)
+    try:
+      return self._run()
+    finally:
+      self._port_manager.remove_port_listener(self._log_port_changes)
+
+  def _run(self):
+    """
+    Lists the MIDI ports or runs the controller. See: start
+    """
     self.__log.info("Starting MidiConnector")
     status = None
     self._get_all_ports()
     exit = False
-    if len(self._in_ports) == 0:
+    wait_for_ports = (self._args.port_timeout != None) and not self._args.list
+    if wait_for_ports:
+      #The ports will be searched after parsing the configuration
+      pass
+    elif len(self._in_ports) == 0:
       self.__log.info("No MIDI IN ports were found. Please connect your MIDI "
                       "device and run the script again")
       exit = True
 
-    if len(self._out_ports) == 0:
+    if (len(self._out_ports) == 0) and not wait_for_ports:
       self.__log.info("No MIDI OUT ports were found. Please connect your MIDI "
           "device and run the script again")
       exit = True
@@ -91,63 +154,381 @@ class MidiConnector:
         self._list_ports()
       else:
         self._parse_xml_config()
+        if wait_for_ports and not self._wait_for_ports():
+          self._free_midi()
+          return status
         self._parse_ports()
         self._open_ports()
+        from MidiProcessor import MidiProcessor
+        MidiProcessor.set_quiet_mode(self._args.quiet)
         midi_processor = MidiProcessor(
           self._xml_dict,
-          self._midi_in,
-          self._midi_out,
+          self._get_midi_interfaces('input'),
+          self._get_midi_interfaces('output'),
           ignore_sysex = False,
           ignore_timing = False,
           ignore_active_sense = False,
+          inject_events = (self._args.control_socket != None)
         )
-        midi_processor.parse_xml()
-        status = midi_processor.read_midi()
-        self.__log.info("Exiting")
-        self._close_ports()
-        self._free_midi()
+        previous_handler = None
+        #The MidiProcessor is always closed, even if it or the ports failed,
+        #so that the sounding notes get stopped and the messages waiting on
+        #the output schedulers get sent
+        try:
+          self._compile_config(midi_processor, self._compiled_config)
+          #The compiled xml dict is needed to reuse its banks when reloading
+          self._xml_dict = midi_processor.get_compiled_config()['xml_dict']
+          self._midi_processor = midi_processor
+          if self._quit_requested.is_set():
+            #quit was called before the MidiProcessor was created
+            midi_processor.quit("Quit")
+          midi_processor.set_reload_handler(self._start_reload)
+          #Signal handlers can only be set on the main thread; otherwise, the
+          #ControllerHost takes care of them
+          if hasattr(signal, 'SIGUSR1') and \
+             (threading.current_thread() == threading.main_thread()):
+            #On demand, the latency statistics can be logged by running:
+            #kill -USR1 <process id>
+            previous_handler = signal.signal(signal.SIGUSR1,
+              lambda signal_number, frame: midi_processor.log_latency_stats())
+          if self._args.watch:
+            from ConfigWatcher import ConfigWatcher
+            self._config_watcher = ConfigWatcher(self._get_config_files(),
+                                                 self._on_config_changed)
+            self._config_watcher.start()
+          if wait_for_ports:
+            self._start_port_monitor()
+          midi_processor.set_reload_time(self._reload_time)
+          status = midi_processor.read_midi()
+          self._reload_time = None
+          if status == "Reload":
+            self._reload_time = midi_processor.get_quit_time()
+        finally:
+          if self._port_monitor != None:
+            self._stop_port_monitor.set()
+            self._port_monitor.join()
+            self._port_monitor = None
+          if self._config_watcher != None:
+            self._config_watcher.stop()
+            self._config_watcher = None
+          if previous_handler != None:
+            signal.signal(signal.SIGUSR1, previous_handler)
+          try:
+            midi_processor.close()
+          except Exception:
+            self.__log.info("Error while closing the MidiProcessor:\n%s",
+                            traceback.format_exc())
+          self._event_stats = midi_processor.get_event_stats()
+          self._midi_processor = None
+          if self._reload_thread != None:
+            #Otherwise, a late reload could replace the configuration while
+            #it is being parsed again
+            self._reload_thread.join()
+            self._reload_thread = None
+          self.__log.info("Exiting")
+          self._close_ports()
+          self._free_midi()
     self.__log.debug("MidiConnector has been ended")
     return status
 
+  def quit(self, status = "Quit"):
+    """
+    Ends the controller from another thread
+    Parameters:
+    * status: status that start will return. See: MidiProcessor.quit
+    Remarks:
+    * If the controller is still waiting for the MIDI ports, then it will stop
+      waiting and start will return None
+    """
+    self._quit_requested.set()
+    midi_processor = self._midi_processor
+    if midi_processor != None:
+      midi_processor.quit(status)
+
+  def get_config_file(self):
+    """
+    Returns the path to the xml configuration file of this controller
+    """
+    return self._config_file
+
+  def get_event_stats(self):
+    """
+    Gets the number of processed MIDI events and their rate
+    Returns:
+    * A dictionary with the statistics, see: MidiInputHandler.get_event_stats.
+      If the controller isn't running, then the statistics from the last time
+      that it ran will be returned or None if it never ran
+    """
+    midi_processor = self._midi_processor
+    if midi_processor == None:
+      return self._event_stats
+    return midi_processor.get_event_stats()
+
+  def get_stats(self):
+    """
+    Gets the statistics of the running MidiProcessor
+    Returns:
+    * A dictionary with: the current 'bank' starting from one and the
+      'events', 'queue', 'latencies', 'ports', and 'outputs' statistics, see
+      the get_*_stats methods of the MidiInputHandler, or None if the
+      controller isn't running
+    """
+    midi_processor = self._midi_processor
+    if midi_processor == None:
+      return None
+    return {
+      'bank': midi_processor.get_current_bank() + 1,
+      'events': midi_processor.get_event_stats(),
+      'queue': midi_processor.get_queue_stats(),
+      'latencies': midi_processor.get_latency_stats(),
+      'ports': midi_processor.get_port_stats(),
+      'outputs': midi_processor.get_output_stats()
+    }
+
+  def handle_control_command(self, command):
+    """
+    Command handler of the ControlServer. The commands are run by the
+    MidiProcessor as if their BankSelect messages were received, see:
+    CONTROL_COMMANDS; "bank <number>" selects a bank and "stats" returns the
+    statistics
+    Parameters:
+    * command: received command line
+    Returns:
+    * "OK" or "ERROR <reason>". The stats command returns: "OK <statistics>",
+      where the statistics are a JSON object; see: get_stats
+    """
+    tokens = command.lower().split()
+    if tokens == []:
+      return "ERROR Empty command"
+    midi_processor = self._midi_processor
+    if midi_processor == None:
+      return "ERROR The controller isn't running"
+    if tokens == ['stats']:
+      import json
+      return "OK " + json.dumps(self.get_stats())
+    if (tokens[0] == 'bank') and (len(tokens) == 2):
+      num_banks = len(self._xml_dict['Bank'])
+      if not tokens[1].isdigit() or not (1 <= int(tokens[1]) <= num_banks):
+        return "ERROR The bank must be a number between 1 and %d" % num_banks
+      select_value = int(tokens[1]) - 1
+    elif (len(tokens) == 1) and (tokens[0] in CONTROL_COMMANDS):
+      select_value = CONTROL_COMMANDS[tokens[0]]
+    else:
+      return "ERROR Unknown command: %s" % command
+    if not midi_processor.send_control_command(select_value):
+      return "ERROR The command was discarded"
+    return "OK"
+
+  def log_latency_stats(self):
+    """
+    Logs the latency statistics of the running MidiProcessor. It does nothing
+    if the controller isn't running
+    """
+    midi_processor = self._midi_processor
+    if midi_processor != None:
+      midi_processor.log_latency_stats()
+
   def _parse_xml_config(self):
     """
-    Parses the specified xml configuration file
+    Parses the specified xml configuration file. If there is an error, then
+    the program will exit
     """
+    xml_dict, compiled_config = self._read_xml_config()
+    if xml_dict == None:
+      self.__log.debug("Unexpected error occured, aborting...")
+      self._free_midi()
+      sys.exit()
+
+    self._xml_dict = xml_dict
+    self._compiled_config = compiled_config
+
+  def _get_config_cache(self):
+    """
+    Returns the ConfigCache. It will be created the first time that it is
+    requested
+    """
+    if self._config_cache == None:
+      from ConfigCache import ConfigCache
+      import MidiProcessor, MidiMessagePool, ByteUtilities, MidiUtilities, \
+             StringUtilities
+      #The source code compiling the configuration is part of the cache key,
+      #so that configurations compiled by other versions aren't used
+      self._config_cache = ConfigCache(code_files = [
+                             inspect.getfile(module) for module in
+                             [MidiProcessor, MidiMessagePool, ByteUtilities,
+                              MidiUtilities, StringUtilities]])
+    return self._config_cache
+
+  def _read_xml_config(self):
+    """
+    Reads the specified xml configuration file
+    Returns:
+    * A tuple with the xml dict and the compiled configuration. If the
+      compiled configuration is on the cache, then it will be used and neither
+      the xsd schema nor the xml file will be parsed; otherwise, the compiled
+      configuration will be None. If there was an error, then both values will
+      be None
+    """
+    compiled_config = self._get_config_cache().load(self._config_file,
+                                                    self._xsd_schema)
+    if compiled_config != None:
+      self.__log.info("Using cached XML config: %s", self._config_file)
+      return compiled_config['xml_dict'], compiled_config
+
     self.__log.info("Parsing XML config: %s", self._xsd_schema)
-    exit = False
-    self.__log.debug("Calling XMLSchema11 api")
+    self.__log.debug("Getting XMLSchema11 object")
     try:
-      xsd_schema = xmlschema.XMLSchema11(self._xsd_schema)
+      #The schema is only built the first time; afterwards, ie: on reload, it
+      #will be reused
+      from SchemaRegistry import get_xml_schema
+      xsd_schema = get_xml_schema(self._xsd_schema)
     except:
-      exit = True
       error = traceback.format_exc()
       self.__log.info("Error while parsing xsd file:\n%s\n\n%s", 
                       self._xsd_schema, error)
+      return None, None
 
-    if not exit:
-      self.__log.debug("Converting XML schema to dict")
-      try:
-        xml_dict = xsd_schema.to_dict(self._args.config)
-        #A last manual validation must be done here: the InitialBank value must
-        #be less or equal than the total number of banks
-        if xml_dict['@InitialBank'] > len(xml_dict['Bank']):
-          raise Exception("InitialBank is higher than the possible number of "
-                          "banks / maximum: " + str(len(xml_dict['Bank'])) + \
-                          ", given value: " + str(xml_dict['@InitialBank']))
-        self.__log.debug("Got: \n%s", PrettyFormat(xml_dict))
-      except:
-        exit = True
-        error = traceback.format_exc()
-        message = "Error while parsing xml file:\n%s\n\n%s" % (
-                    self._args.config, error
-                  )
-        self.__log.info(message)
-    if exit:
-      self.__log.debug("Unexpected error occured, aborting...")
-      self._free_midi()
-      sys.exit()
-      
-    self._xml_dict = xml_dict
+    self.__log.debug("Converting XML schema to dict")
+    try:
+      xml_dict = xsd_schema.to_dict(self._config_file)
+      #A last manual validation must be done here: the InitialBank value must
+      #be less or equal than the total number of banks
+      if xml_dict['@InitialBank'] > len(xml_dict['Bank']):
+        raise Exception("InitialBank is higher than the possible number of "
+                        "banks / maximum: " + str(len(xml_dict['Bank'])) + \
+                        ", given value: " + str(xml_dict['@InitialBank']))
+      self.__log.debug("Got: \n%s", PrettyFormat(xml_dict))
+    except:
+      error = traceback.format_exc()
+      message = "Error while parsing xml file:\n%s\n\n%s" % (
+                  self._config_file, error
+                )
+      self.__log.info(message)
+      return None, None
+    return xml_dict, None
+
+  def _compile_config(self, midi_processor, compiled_config,
+                      previous_xml_dict = None):
+    """
+    Compiles the configuration of the entered MidiProcessor
+    Parameters:
+    * midi_processor: MidiProcessor created with the xml dict to compile
+    * compiled_config: compiled configuration loaded from the cache. If None,
+      then the xml dict will be parsed and the result will be cached
+    * previous_xml_dict: compiled xml dict of the current configuration. Its
+      banks will be reused if they didn't change
+    """
+    if compiled_config != None:
+      midi_processor.load_compiled_config(compiled_config)
+    else:
+      midi_processor.parse_xml(previous_xml_dict)
+      compiled_config = midi_processor.get_compiled_config()
+      self._get_config_cache().save(self._config_file, self._xsd_schema,
+                                    compiled_config,
+                                    compiled_config['dependencies'])
+
+  def _get_config_files(self):
+    """
+    Returns a list with the files used by the current configuration: the XML
+    file, the XSD schema, and the panic file if any
+    """
+    config_files = [self._config_file, self._xsd_schema]
+    panic_node = self._xml_dict.get("Panic")
+    if (type(panic_node) == dict) and panic_node.get('@File'):
+      config_files.append(panic_node['@File'])
+    return config_files
+
+  def _on_config_changed(self):
+    """
+    Called by the ConfigWatcher after the configuration files changed
+    Returns:
+    * False if the configuration is already being reloaded, so that the
+      watcher tries again later
+    """
+    return self._start_reload(time.perf_counter_ns())
+
+  def _start_reload(self, reload_time):
+    """
+    Reload handler of the MidiProcessor. It will compile the configuration on
+    a background thread, so that the MIDI messages can still be processed
+    with the current configuration
+    Parameters:
+    * reload_time: time when the reload command was received
+    Returns:
+    * False if the configuration is already being reloaded; otherwise True
+    """
+    if (self._reload_thread != None) and self._reload_thread.is_alive():
+      self.__log.info("The configuration is already being reloaded")
+      return False
+    self._reload_thread = threading.Thread(target = self._reload_config,
+                                           args = (reload_time,),
+                                           name = 'ConfigReloader',
+                                           daemon = True)
+    self._reload_thread.start()
+    return True
+
+  def _reload_config(self, reload_time):
+    """
+    Compiles the configuration again and replaces the one used by the
+    MidiProcessor without closing the MIDI ports
+    Parameters:
+    * reload_time: time when the reload command was received
+    Remarks:
+    * If the configuration has errors, then the current one will be kept
+    * If the MIDI ports changed, then the MidiProcessor will be ended with the
+      "Reload" status, so that the ports get opened again. The same happens if
+      the attributes only read when creating the MidiProcessor changed. See:
+      HANDLER_ATTRIBUTES
+    """
+    midi_processor = self._midi_processor
+    if midi_processor == None:
+      self.__log.info("The controller isn't running; the configuration won't "
+                      "be reloaded")
+      return
+    try:
+      self._replace_config(midi_processor, reload_time)
+    except Exception:
+      self.__log.info("Error while reloading the configuration; the current "
+                      "one will be kept:\n%s", traceback.format_exc())
+
+  def _replace_config(self, midi_processor, reload_time):
+    """
+    Compiles the configuration again and replaces the one used by the
+    MidiProcessor. See: _reload_config
+    Parameters:
+    * midi_processor: MidiProcessor that is running
+    * reload_time: time when the reload command was received
+    """
+    xml_dict, compiled_config = self._read_xml_config()
+    if xml_dict == None:
+      self.__log.info("The configuration has errors; the current one will be "
+                      "kept")
+      return
+
+    if (self._get_port_args('input', xml_dict) != \
+        self._get_port_args('input')) or \
+       (self._get_port_args('output', xml_dict) != \
+        self._get_port_args('output')):
+      self.__log.info("The MIDI ports changed; they will be opened again")
+      midi_processor.quit("Reload")
+      return
+
+    if self._get_handler_args(xml_dict) != self._get_handler_args():
+      self.__log.info("The event queue, SysEx, or output rate settings "
+                      "changed; the controller will be started again")
+      midi_processor.quit("Reload")
+      return
+
+    #This MidiProcessor is only used to compile the configuration; it doesn't
+    #have MIDI interfaces
+    from MidiProcessor import MidiProcessor
+    compiler = MidiProcessor(xml_dict, None, None)
+    self._compile_config(compiler, compiled_config, self._xml_dict)
+    compiled_config = compiler.get_compiled_config()
+    midi_processor.swap_compiled_config(compiled_config, reload_time)
+    self._xml_dict = compiled_config['xml_dict']
+    if self._config_watcher != None:
+      self._config_watcher.set_files(self._get_config_files())
 
   def _open_port(self, interface_type, midi_port, is_virtual = False):
     """
@@ -161,19 +542,16 @@ class MidiConnector:
     """
     if not is_virtual:
       self.__log.debug("Opening MIDI port: %s", PrettyFormat(midi_port))
-      port_name = None
       client_name = None
     else:
       self.__log.debug("Opening Virtual MIDI port")
-      port_name = midi_port
-      midi_port = None
       client_name = VIRTUAL_PREFFIX[:-1]
     try:
-      midi_interface = open_midiport(port = midi_port, type_ = interface_type,
-                                     use_virtual = is_virtual,
-                                     interactive = False,
-                                     client_name = client_name,
-                                     port_name = port_name)[0]
+      #The port is opened with the rtmidi client that was used to list the
+      #ports, so that no new sequencer client is created
+      midi_interface = self._port_manager.open_port(interface_type,
+                                                    midi_port, is_virtual,
+                                                    client_name)
     except:
       error = traceback.format_exc()
       self.__log.info(error)
@@ -185,21 +563,40 @@ class MidiConnector:
     """
     Opens the entered MIDI ports
     """
-    self._midi_in = self._open_port("input", self._in_port,
-                                    self._use_virtual_in)
-    if self._use_virtual_in:
-      port_name = self._in_port
-    else:
-      port_name = self._in_ports[self._in_port] 
-    self.__log.info("MIDI IN Port: '%s' was opened", port_name)
+    for interface_type in INTERFACE_NAMES:
+      interface_name = INTERFACE_NAMES[interface_type]
+      for midi_port in self._midi_ports[interface_type]:
+        midi_port['interface'] = self._open_port(interface_type,
+                                                 midi_port['port'],
+                                                 midi_port['is_virtual'])
+        if midi_port['is_virtual']:
+          midi_port['name'] = midi_port['port']
+        else:
+          midi_port['name'] = self._get_port_list(interface_type) \
+                                [midi_port['port']]
+        self.__log.info("%s Port: '%s' was opened", interface_name,
+                        midi_port['name'])
 
-    self._midi_out = self._open_port("output", self._out_port,
-                                     self._use_virtual_out)
-    if self._use_virtual_out:
-      port_name = self._out_port
-    else:
-      port_name = self._out_ports[self._out_port] 
-    self.__log.info("MIDI OUT Port: '%s' was opened", port_name)
+  def _get_midi_interfaces(self, interface_type):
+    """
+    Gets the opened MIDI interfaces of the entered type
+    Parameters:
+    * interface_type: either 'input' or 'output'
+    Returns:
+    * A list with the MidiIn or MidiOut objects in the same order as the
+      ports of the configuration. The first one is the one given by the
+      InPort or OutPort attribute
+    """
+    return [midi_port['interface'] for midi_port in
+            self._midi_ports[interface_type]]
+
+  def _get_port_list(self, interface_type):
+    """
+    Returns the list with the available ports of the entered interface type
+    """
+    if interface_type == 'input':
+      return self._in_ports
+    return self._out_ports
 
   def _close_port(self, midi_interface):
     """
@@ -209,7 +606,7 @@ class MidiConnector:
     """
     self.__log.debug("Closing MIDI port")
     try:
-      midi_interface.close_port()
+      self._port_manager.close_port(midi_interface)
     except:
       error = traceback.format_exc()
       self.__log.info(error)
@@ -218,34 +615,37 @@ class MidiConnector:
     """
     Closes all opened MIDI ports
     """
-    self._close_port(self._midi_in)
-    if self._use_virtual_in:
-      port_name = self._in_port
-    else:
-      port_name = self._in_ports[self._in_port]
-    self.__log.info("MIDI IN Port: '%s' was closed", port_name)
-    self._close_port(self._midi_out)
-    if self._use_virtual_out:
-      port_name = self._out_port
-    else:
-      port_name = self._out_ports[self._out_port]
-    self.__log.info("MIDI OUT Port: '%s' was closed", port_name)
+    #The port names are taken from the time when the ports were opened; the
+    #port lists could have changed since then
+    for interface_type in INTERFACE_NAMES:
+      for midi_port in self._midi_ports[interface_type]:
+        if midi_port['interface'] == None:
+          continue
+        self._close_port(midi_port['interface'])
+        self.__log.info("%s Port: '%s' was closed",
+                        INTERFACE_NAMES[interface_type], midi_port['name'])
 
-  def _parse_port(self, port_list, arg_name):
+  def _find_port(self, port_list, arg_name, port_value, log_errors = True):
     """
-    Gets the specified port from command line
+    Searches the specified port on the entered port list
     Parameters:
     * port_list: List of available MIDI ports
-    * arg_name: name of the argument to get. It can be: InPort or OutPort
+    * arg_name: name of the argument used to log messages, ie: InPort or
+      OutPort
+    * port_value: port number or name given on the configuration. If None,
+      then the last port will be used
+    * log_errors: whether or not to log a message if the port wasn't found
     Returns:
     * A tupple containing:
       - either a port index or a virtual port string name
       - either if using a virtual or a real port
+      If the port wasn't found, then None will be returned
     """
     self.__log.debug("Getting: %s from:\n%s", arg_name, PrettyFormat(port_list))
     use_virtual = False
     num_ports = len(port_list)
-    port_value = self._xml_dict.get('@'+arg_name, num_ports)
+    if port_value == None:
+      port_value = num_ports
     self.__log.debug("Port value: %s", port_value)
     if (type(port_value) == str) and port_value.isdigit():
       port_value = int(port_value)
@@ -266,19 +666,11 @@ class MidiConnector:
         self.__log.debug("Searching port")
         #On this case, a string with part of the name was given, so, it
         #will be searched in the available ports
-        port_index = 0
-        port_found = False
-        for port_name in port_list:
-          filtered = fnmatch.filter([port_name], port_value)
-          if filtered != []:
-            port_found = True
-            break
-          port_index += 1
-        if not port_found:
-          self.__log.info("The %s: %s wasn't found.", arg_name, port_value)
-          self._free_midi()
-          self.__log.debug("Port wasn't found, exiting")
-          sys.exit()
+        port_index = self._port_manager.find_port(port_list, port_value)
+        if port_index == None:
+          if log_errors:
+            self.__log.info("The %s: %s wasn't found.", arg_name, port_value)
+          return None
         port_value = port_index + 1
         self.__log.debug("Port was found, index: %d", port_value)
       else:
@@ -287,90 +679,312 @@ class MidiConnector:
     if not use_virtual:
       #Internally, port numbers start from 0 because they are in an array
       port_value -= 1
-      if port_value >= num_ports:
-        self.__log.info("Invalid port number was supplied")
-        self._free_midi()
-        self.__log.debug("Exiting after getting invalid port")
-        sys.exit()
+      if (port_value < 0) or (port_value >= num_ports):
+        if log_errors:
+          self.__log.info("Invalid port number was supplied")
+        return None
       
     return port_value, use_virtual
-  
+
+  def _parse_port(self, port_list, arg_name, port_value):
+    """
+    Gets the specified port from the configuration. If it isn't found, then
+    the program will exit
+    Parameters:
+    * See: _find_port
+    Returns:
+    * See: _find_port
+    """
+    port = self._find_port(port_list, arg_name, port_value)
+    if port == None:
+      self._free_midi()
+      self.__log.debug("Port wasn't found, exiting")
+      sys.exit()
+    return port
+
+  def _get_port_args(self, interface_type, xml_dict = None):
+    """
+    Gets the MIDI ports of the configuration
+    Parameters:
+    * interface_type: either 'input' or 'output'
+    * xml_dict: dictionary with the configuration. If None, then the current
+      one will be used
+    Returns:
+    * A list of tuples with the argument name and the port value. The first
+      one is the InPort or OutPort attribute; the InputPort or OutputPort
+      nodes follow
+    """
+    if xml_dict == None:
+      xml_dict = self._xml_dict
+    if interface_type == 'input':
+      port_args = [('InPort', xml_dict.get('@InPort'))]
+      port_number = 1
+      for input_port in xml_dict.get('InputPort', []):
+        port_number += 1
+        port_args.append(('InputPort %d' % port_number, input_port['@Port']))
+    else:
+      port_args = [('OutPort', xml_dict.get('@OutPort'))]
+      for output_port in xml_dict.get('OutputPort', []):
+        port_args.append(('OutputPort %s' % output_port['@Name'],
+                          output_port['@Port']))
+    return port_args
+
+  def _get_handler_args(self, xml_dict = None):
+    """
+    Gets the attributes of the configuration that are only read when creating
+    the MidiProcessor
+    Parameters:
+    * xml_dict: dictionary with the configuration. If None, then the current
+      one will be used
+    Returns:
+    * A list of tuples with the attribute name and its value. The values of
+      HANDLER_ATTRIBUTES come first; the ByteRate of the OutputPort nodes
+      follow
+    """
+    if xml_dict == None:
+      xml_dict = self._xml_dict
+    handler_args = [(attribute, xml_dict.get('@' + attribute))
+                    for attribute in HANDLER_ATTRIBUTES]
+    for output_port in xml_dict.get('OutputPort', []):
+      handler_args.append(('OutputPort %s ByteRate' % output_port['@Name'],
+                           output_port.get('@ByteRate')))
+    return handler_args
+
+  def _find_ports(self, log_errors = True):
+    """
+    Searches all the MIDI ports of the configuration
+    Parameters:
+    * log_errors: whether or not to log a message if a port wasn't found
+    Returns:
+    * True if all the ports were found
+    """
+    for interface_type in INTERFACE_NAMES:
+      port_list = self._get_port_list(interface_type)
+      for arg_name, port_value in self._get_port_args(interface_type):
+        if self._find_port(port_list, arg_name, port_value,
+                           log_errors) == None:
+          return False
+    return True
+
   def _parse_ports(self):
     """
-    Gets the passed ports to the command line
+    Gets the ports given on the configuration
+    Remarks:
+    * Each port will be stored on _midi_ports as a dictionary with the
+      following keys:
+      - 'arg_name': name of the argument used to log messages
+      - 'value': port number or name given on the configuration
+      - 'port': either a port index or a virtual port name
+      - 'is_virtual': whether or not the port is virtual
+      - 'name': name of the opened port or None if it isn't opened
+      - 'interface': MidiIn or MidiOut object or None if it isn't opened
     """
     self.__log.debug("Parsing ports")
-    self._in_port, self._use_virtual_in = self._parse_port(self._in_ports,
-                                                           'InPort')
-    self._out_port, self._use_virtual_out = self._parse_port(self._out_ports,
-                                                             'OutPort')
+    for interface_type in INTERFACE_NAMES:
+      port_list = self._get_port_list(interface_type)
+      midi_ports = []
+      for arg_name, port_value in self._get_port_args(interface_type):
+        port, is_virtual = self._parse_port(port_list, arg_name, port_value)
+        for midi_port in midi_ports:
+          if (midi_port['port'] == port) and \
+             (midi_port['is_virtual'] == is_virtual):
+            self.__log.info("The %s and the %s use the same port",
+                            midi_port['arg_name'], arg_name)
+            self._free_midi()
+            sys.exit()
+        midi_ports.append({
+          'arg_name': arg_name,
+          'value': port_value,
+          'port': port,
+          'is_virtual': is_virtual,
+          'name': None,
+          'interface': None
+        })
+      self._midi_ports[interface_type] = midi_ports
     self.__log.debug("Ports were parsed")
   
-  def _open_midi(self):
-    """Starts MIDI without opening a port"""
-    self.__log.info("Opening MIDI interfaces")
-    try:
-      self._midi_out = MidiOut()
-      self._midi_in = MidiIn()
-      #Note: if you need to catch SysEx, MIDI clock, and active sense
-      #messages, then use the method: ignore_types as follows:
-      #self._midi_in.ignore_types(sysex = False, timing = False,
-      #             active_sense = False)
-      #They are ignored by default. I don't need this right now, so the
-      #standard behaviour is OK for me
-    except:
-      error = traceback.format_exc()
-      self.__log.info(error)
-      self._free_midi()
-      return False
-    self.__log.debug("MIDI interfaces were opened")
-    return True
-  
   def _free_midi(self):
     """Frees MIDI resources"""
     self.__log.debug("Releasing MIDI")
-    if hasattr(self, '_midi_in'):
-      del self._midi_in
-      
-    if hasattr(self, '_midi_out'):
-      del self._midi_out
+    for interface_type in INTERFACE_NAMES:
+      for midi_port in self._midi_ports[interface_type]:
+        midi_port['interface'] = None
     self.__log.info("MIDI was released")
   
-  def _get_midi_ports(self, midi_interface):
-    """
-    Gets the available ports for the specified MIDI interface
-    Parameters:
-    * midi_interface: interface used for listing the ports. It can be
-      either _midi_in or _midi_out.
-    """
-    self.__log.debug("Getting available MIDI ports")
-    ports = midi_interface.get_ports()
-    self.__log.debug("Got:\n%s", PrettyFormat(ports))
-    port_index = 0
-    for port in ports:
-      port_index_str = str(port_index)
-      ports[port_index] = port
-      port_index += 1
-    self.__log.debug("Fixed port indexes:\n%s", PrettyFormat(ports))
-    return ports
-
   def _get_all_ports(self):
     """
     Gets all the available MIDI IN and Out ports.
     """
     in_ports = []
     out_ports = []
-    if self._open_midi():
+    try:
+      #The ports are enumerated again in case that they changed, ie: after
+      #reloading the controller; however, the rtmidi clients are reused
       self.__log.debug("Getting all MIDI IN ports")
-      in_ports = self._get_midi_ports(self._midi_in)
-      self.__log.debug("Got:\n%s", PrettyFormat(in_ports))
+      in_ports = self._port_manager.get_ports('input', refresh = True)
       self.__log.debug("Getting all MIDI OUT ports")
-      out_ports = self._get_midi_ports(self._midi_out)
-      self.__log.debug("Got:\n%s", PrettyFormat(out_ports))
+      out_ports = self._port_manager.get_ports('output', refresh = True)
+    except:
+      error = traceback.format_exc()
+      self.__log.info(error)
     self._in_ports = in_ports
     self._out_ports = out_ports
-    self._free_midi()
-  
+
+  def _wait_for_ports(self):
+    """
+    Waits until the MIDI ports of the configuration are available
+    Returns:
+    * True if the ports were found; False if the port timeout passed or if
+      the waiting was interrupted
+    Remarks:
+    * A port timeout of zero means waiting forever
+    """
+    timeout = self._args.port_timeout
+    start_time = time.monotonic()
+    waiting = False
+    try:
+      while not self._find_ports(False):
+        if not waiting:
+          self.__log.info("Waiting for the MIDI ports. InPort: %s, OutPort: %s",
+                          self._xml_dict.get('@InPort'),
+                          self._xml_dict.get('@OutPort'))
+          waiting = True
+        if (timeout > 0) and (time.monotonic() - start_time >= timeout):
+          self.__log.info("The MIDI ports weren't found after %d seconds",
+                          timeout)
+          return False
+        if self._quit_requested.wait(PORT_POLL_INTERVAL):
+          self.__log.info("Stopped waiting for the MIDI ports")
+          return False
+        self._get_all_ports()
+    except KeyboardInterrupt:
+      self.__log.info("Keyboard interrupt detected")
+      return False
+    if waiting:
+      self.__log.info("The MIDI ports were found")
+    return True
+
+  def _start_port_monitor(self):
+    """
+    Starts a daemon thread that reconnects the MIDI ports if their devices
+    get disconnected and connected again
+    """
+    self._stop_port_monitor.clear()
+    self._port_monitor = threading.Thread(target = self._monitor_ports,
+                                          name = 'MidiPortMonitor',
+                                          daemon = True)
+    self._port_monitor.start()
+
+  def _monitor_ports(self):
+    """
+    Checks periodically that the devices of the opened MIDI ports are still
+    connected. If a device was disconnected, then its port will be closed and
+    opened again when a port matching the configuration appears. The
+    MidiProcessor keeps running meanwhile, so, its state, ie: the current bank
+    and the held pedals, is kept
+    Remarks:
+    * If the port timeout passes without reconnecting the ports, then the
+      MidiProcessor will be ended with the "Quit" status. A port timeout of
+      zero means waiting forever
+    """
+    timeout = self._args.port_timeout
+    disconnection_time = None
+    while not self._stop_port_monitor.wait(PORT_POLL_INTERVAL):
+      try:
+        self._get_all_ports()
+        reconnected = False
+        connected = True
+        for interface_type in INTERFACE_NAMES:
+          for midi_port in self._midi_ports[interface_type]:
+            port_connected, port_reconnected = self._check_port(
+                                                 interface_type, midi_port)
+            connected = connected and port_connected
+            reconnected = reconnected or port_reconnected
+        if reconnected:
+          self._midi_processor.set_midi_ports(
+            self._get_midi_interfaces('input'),
+            self._get_midi_interfaces('output'))
+        if connected:
+          if disconnection_time != None:
+            self.__log.info("The MIDI ports were reconnected after %.1f "
+                            "seconds", time.monotonic() - disconnection_time)
+          disconnection_time = None
+          continue
+        if disconnection_time == None:
+          disconnection_time = time.monotonic()
+        elif (timeout > 0) and \
+             (time.monotonic() - disconnection_time >= timeout):
+          self.__log.info("The MIDI ports weren't reconnected after %d "
+                          "seconds", timeout)
+          self._midi_processor.quit("Quit")
+          return
+      except Exception:
+        self.__log.info("Error while monitoring the MIDI ports:\n%s",
+                        traceback.format_exc())
+
+  def _check_port(self, interface_type, midi_port):
+    """
+    Closes the entered MIDI port if its device was disconnected and opens it
+    again when a matching port is available
+    Parameters:
+    * interface_type: either 'input' or 'output'
+    * midi_port: dictionary with the port. See: _parse_ports
+    Returns:
+    * A tuple with two booleans: whether or not the port is connected and
+      whether or not it was reconnected, so that the MidiProcessor gets the
+      new interface
+    Remarks:
+    * While the port is disconnected, the MidiProcessor keeps the closed
+      interface, so that the indexes of the routed output ports don't change
+    """
+    if midi_port['is_virtual']:
+      return True, False
+    port_list = self._get_port_list(interface_type)
+    interface_name = INTERFACE_NAMES[interface_type]
+    if midi_port['name'] != None:
+      if midi_port['name'] in port_list:
+        return True, False
+      self.__log.info("%s Port: '%s' was disconnected", interface_name,
+                      midi_port['name'])
+      self._close_port(midi_port['interface'])
+      midi_port['name'] = None
+
+    port = self._find_port(port_list, midi_port['arg_name'],
+                           midi_port['value'], False)
+    if port == None:
+      return False, False
+    port_index = port[0]
+    try:
+      midi_interface = self._port_manager.open_port(interface_type,
+                                                    port_index)
+    except Exception:
+      self.__log.info("%s Port: '%s' couldn't be opened:\n%s", interface_name,
+                      port_list[port_index], traceback.format_exc())
+      return False, False
+    midi_port['interface'] = midi_interface
+    midi_port['port'] = port_index
+    midi_port['name'] = port_list[port_index]
+    self.__log.info("%s Port: '%s' was reconnected", interface_name,
+                    midi_port['name'])
+    return True, True
+
+  def _log_port_changes(self, interface_type, previous_ports, ports):
+    """
+    Port listener of the MidiPortManager. It logs the ports that were added
+    or removed
+    Parameters:
+    * interface_type: either 'input' or 'output'
+    * previous_ports: list with the port names before the change
+    * ports: list with the current port names
+    """
+    interface_name = INTERFACE_NAMES[interface_type]
+    for port_name in ports:
+      if port_name not in previous_ports:
+        self.__log.info("%s Port: '%s' was added", interface_name, port_name)
+    for port_name in previous_ports:
+      if port_name not in ports:
+        self.__log.info("%s Port: '%s' was removed", interface_name, port_name)
+
   def _get_formatted_port_list(self, port_list):
     """
     Gets the port list as follows:
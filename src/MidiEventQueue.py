@@ -0,0 +1,164 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# JMMidiBassPedalController v3.0
+# File: src/MidiEventQueue.py
+# By:   Josef Meile <jmeile@hotmail.com> @ 28.10.2020
+# This project is licensed under the MIT License. Please see the LICENSE.md file
+# on the main folder of this code. An online version can be found here:
+# https://github.com/jmeile/JMMidiBassPedalController/blob/master/LICENSE.md
+#
+"""Bounded queue used to pass MIDI events between threads."""
+
+from collections import deque
+import threading
+
+#Possible actions when putting an event into a full queue
+OVERFLOW_POLICIES = ['Block', 'DropEcho', 'DropOldest']
+
+class MidiEventQueue:
+  """
+  Bounded FIFO queue for MIDI events. It is meant to have only one producer:
+  the rtmidi callback thread, and only one consumer: the thread processing the
+  events. Besides of the events, it keeps the following statistics:
+  * high_water_mark: maximum number of events that were waiting on the queue
+  * dropped_events: number of events that were discarded because the queue was
+    full
+  * blocked_events: number of times that the producer had to wait because the
+    queue was full
+  """
+
+  def __init__(self, max_size, overflow_policy = 'Block', is_echo = None):
+    """
+    Initializes the class attributes
+    Parameters:
+    * max_size: maximum number of events on the queue
+    * overflow_policy: what to do when the queue is full:
+      - 'Block': the producer will wait until there is free space
+      - 'DropEcho': the new event will be discarded if it is an echo message;
+        otherwise, the oldest echo message on the queue will be discarded. If
+        there aren't echo messages on the queue, then the producer will wait
+      - 'DropOldest': the oldest event on the queue will be discarded
+    * is_echo: function that receives a MIDI message and returns True if it
+      is only going to be echoed, so, it can be discarded. It is only needed
+      for the 'DropEcho' policy
+    """
+    if overflow_policy not in OVERFLOW_POLICIES:
+      raise Exception("Invalid overflow policy: %s. Possible values: %s" % \
+                      (overflow_policy, str(OVERFLOW_POLICIES)))
+    if (overflow_policy == 'DropEcho') and (is_echo == None):
+      raise Exception("The 'DropEcho' policy needs an is_echo function")
+    self._events = deque()
+    self._max_size = max_size
+    self._overflow_policy = overflow_policy
+    self._is_echo = is_echo
+    self._condition = threading.Condition()
+    self._closed = False
+    self.high_water_mark = 0
+    self.dropped_events = 0
+    self.blocked_events = 0
+
+  def __len__(self):
+    return len(self._events)
+
+  def put(self, event):
+    """
+    Puts an event at the end of the queue
+    Parameters:
+    * event: tuple with the MIDI message, the delta time, the arrival time,
+      and the index of the MIDI IN interface
+    Returns:
+    * False if the event was discarded; otherwise True
+    """
+    with self._condition:
+      events = self._events
+      blocked = False
+      while (len(events) >= self._max_size) and not self._closed:
+        if self._overflow_policy == 'DropOldest':
+          events.popleft()
+          self.dropped_events += 1
+        elif (self._overflow_policy == 'DropEcho') and \
+             self._is_echo(event[0]):
+          self.dropped_events += 1
+          return False
+        elif (self._overflow_policy == 'DropEcho') and \
+             self._drop_oldest_echo_event():
+          pass
+        else:
+          if not blocked:
+            blocked = True
+            self.blocked_events += 1
+          self._condition.wait()
+      if self._closed:
+        return False
+      events.append(event)
+      if len(events) > self.high_water_mark:
+        self.high_water_mark = len(events)
+      self._condition.notify_all()
+    return True
+
+  def put_if_empty(self, event):
+    """
+    Puts an event on the queue only if it is empty, ie: to wake up the thread
+    waiting on get. The size limit and the overflow policy aren't applied
+    Parameters:
+    * event: see: put
+    Returns:
+    * True if the event was put; otherwise False
+    """
+    with self._condition:
+      if (len(self._events) > 0) or self._closed:
+        return False
+      self._events.append(event)
+      self._condition.notify_all()
+    return True
+
+  def _drop_oldest_echo_event(self):
+    """
+    Discards the oldest echo event on the queue
+    Returns:
+    * True if an event was discarded; False if there weren't echo events
+    """
+    for queued_event in self._events:
+      if self._is_echo(queued_event[0]):
+        self._events.remove(queued_event)
+        self.dropped_events += 1
+        return True
+    return False
+
+  def get(self):
+    """
+    Gets the first event of the queue. If the queue is empty, then it will wait
+    until an event arrives
+    Returns:
+    * The first event or None if the queue was closed
+    """
+    with self._condition:
+      while (len(self._events) == 0) and not self._closed:
+        self._condition.wait()
+      if len(self._events) == 0:
+        return None
+      event = self._events.popleft()
+      self._condition.notify_all()
+      return event
+
+  def close(self):
+    """
+    Closes the queue. The events that are already on the queue can be still
+    got; afterwards, get will return None
+    """
+    with self._condition:
+      self._closed = True
+      self._condition.notify_all()
+
+  def get_stats(self):
+    """
+    Returns a dictionary with the queue statistics
+    """
+    return {
+      'size': len(self._events),
+      'max_size': self._max_size,
+      'high_water_mark': self.high_water_mark,
+      'dropped_events': self.dropped_events,
+      'blocked_events': self.blocked_events
+    }
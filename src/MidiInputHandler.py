@@ -11,9 +11,21 @@
 """Wraps MidiIn to add convenience methods for catching common MIDI events."""
 
 from __future__ import print_function
-from CustomLogger import CustomLogger, PrettyFormat
+from CustomLogger import CustomLogger, PrettyFormat, QuietLogger
 import logging
+import threading
+from array import array
+from functools import partial
+from time import perf_counter_ns
 from autologging import logged
+from MidiEventQueue import MidiEventQueue
+from ActiveNotes import ActiveNoteTracker
+from MidiOutputScheduler import MidiOutputScheduler, DEFAULT_BURST_SIZE, \
+                                DEFAULT_MAX_DELAY, URGENT_LANE, ECHO_LANE
+from LatencyHistogram import LatencyHistogram
+from SysExReassembler import SysExReassembler, format_sysex, \
+                             DEFAULT_MAX_SYSEX_SIZE, SYSEX_COMPLETE, \
+                             SYSEX_DISCARDED
 from rtmidi.midiconstants import (CHANNEL_PRESSURE, CONTROL_CHANGE,
                   MIDI_TIME_CODE, NOTE_OFF, NOTE_ON,
                   PITCH_BEND, POLY_PRESSURE, PROGRAM_CHANGE,
@@ -23,6 +35,30 @@ from rtmidi.midiconstants import (CHANNEL_PRESSURE, CONTROL_CHANGE,
                   SYSTEM_RESET, SYSTEM_EXCLUSIVE,
                   END_OF_EXCLUSIVE)
 
+#Classes of MIDI events used for the latency statistics. The handlers set the
+#class of the event being processed on the _event_class attribute
+PEDAL_NOTE_EVENT = 0
+BANK_SELECT_EVENT = 1
+ECHO_EVENT = 2
+SYSEX_EVENT = 3
+IGNORED_EVENT = 4
+EVENT_CLASSES = ['PedalNote', 'BankSelect', 'Echo', 'SysEx', 'Ignored']
+
+#Size of the event queue when several MIDI IN interfaces are used or when
+#events can be injected, and no size was given. On those cases, all the events
+#must be processed by the same worker thread, so, the queue can't be disabled
+FORCED_QUEUE_SIZE = 1024
+
+#python-rtmidi only sends messages longer than this if they start with 0xF0,
+#so, the continuation chunks of a streamed SysEx are sent in pieces of this
+#size
+MAX_CONTINUATION_SIZE = 3
+
+#Names of the rtmidi APIs known to send the pieces of a streamed SysEx as one
+#message; the others may send each piece on its own, ie: WinMM sends short
+#messages with midiOutShortMsg and ALSA encodes each message separately
+SYSEX_STREAMING_APIS = ['API_MACOSX_CORE']
+
 #Creates a logger for this module.
 logger = logging.getLogger(CustomLogger.get_module_name())
 
@@ -76,28 +112,90 @@ class MidiInputHandler:
   
   def __init__(self, midi_in, midi_out, console_echo = False,
                ignore_sysex = True, ignore_timing = True,
-               ignore_active_sense = True):
+               ignore_active_sense = True, queue_size = 0,
+               overflow_policy = 'Block', inject_events = False,
+               max_sysex_size = DEFAULT_MAX_SYSEX_SIZE,
+               sysex_streaming = False, output_byte_rate = 0,
+               output_burst_size = DEFAULT_BURST_SIZE,
+               output_max_delay = DEFAULT_MAX_DELAY):
     """
     Initializes the class attributes
     Parameters:
-    * midi_in: MIDI IN interface to use
+    * midi_in: MIDI IN interface to use. If None, then no MIDI messages will
+      be received; this is useful to only parse a configuration. It can be
+      also a list of interfaces; on that case, their events will be put on the
+      same event queue, even if queue_size is zero
     * midi_out: MIDI OUT interface to use. If None, then the messages will be
-      printed into the console
+      printed into the console. It can be also a list of interfaces; the
+      first one will be the default, where this class sends its messages
     * console_echo: if used together with midi_out, then the message will be
       first printed into the console, then it will be sent
     * ignore_* parameters: see the "_ignore_messages" method
+    * queue_size: if bigger than zero, then the rtmidi callback will only put
+      the incomming events on a queue of this size and a worker thread will
+      process them. If zero, then the events will be processed directly on the
+      rtmidi callback thread
+    * overflow_policy: what to do when the queue is full. See the
+      MidiEventQueue class for the possible values
+    * inject_events: whether or not messages will be injected with
+      inject_event. If True, then the event queue will be enabled, even if
+      queue_size is zero
+    * max_sysex_size: maximum size in bytes of a received SysEx message. Bigger
+      messages will be discarded
+    * sysex_streaming: if True, then the chunks of the received SysEx messages
+      will be sent as soon as they arrive instead of joining them first. On
+      this case, max_sysex_size won't be checked. It will be ignored if a
+      MIDI OUT interface uses an API that can't stream SysEx messages. See:
+      SYSEX_STREAMING_APIS
+    * output_byte_rate: maximum number of bytes per second sent to the MIDI
+      OUT interfaces. Zero means no limit. It can be also a list with the
+      rate of each interface. See: MidiOutputScheduler
+    * output_burst_size: number of bytes that can be sent at once to an
+      interface with a byte rate
+    * output_max_delay: maximum time in seconds that the messages may wait to
+      be sent to an interface with a byte rate; afterwards, the echo messages
+      and then the note messages will be discarded
     """
     self.__log.debug("Initializing MidiInputHandler")
-    self._midi_in = midi_in
-    self._midi_out = midi_out
+    self._set_interfaces(midi_in, midi_out)
+    #Sounding notes of each MIDI OUT interface
+    self._note_trackers = [ActiveNoteTracker() for midi_out in self._midi_outs]
+    self._output_schedulers = None
+    self._create_output_schedulers(output_byte_rate, output_burst_size,
+                                   output_max_delay)
     self._console_echo = console_echo
-    self._sysex_buffer = []
-    self._sysex_chunk = 0
+    if sysex_streaming and not self._can_stream_sysex(midi_out):
+      self.__log.info("SysEx streaming isn't supported by the MIDI API; the "
+                      "SysEx messages will be joined before sending them")
+      sysex_streaming = False
+    #SysEx buffer of each MIDI IN interface, so that dumps arriving at the same
+    #time on different interfaces don't get mixed; the last one is used by the
+    #injected events. _sysex is the one of the event being processed
+    self._sysex_buffers = [SysExReassembler(max_sysex_size, sysex_streaming)
+                           for input_index in range(len(self._midi_ins) + 1)]
+    self._input_index = 0
+    self._sysex = self._sysex_buffers[0]
+    self._event_queue = None
+    self._event_worker = None
+    self._event_class = IGNORED_EVENT
+    self._pending_update = None
+    #Used when the event queue is disabled, so that the scheduled updates
+    #aren't run while an event is being processed
+    self._event_lock = threading.RLock()
+    self._latency_histograms = [LatencyHistogram() for event_class in
+                                EVENT_CLASSES]
+    self._ignore_options = (ignore_sysex, ignore_timing, ignore_active_sense)
+    #Number of events received by each MIDI IN interface; they are only
+    #counted when the event queue is enabled
+    self._input_counts = array('q', bytes(8 * len(self._midi_ins)))
+    #Number of messages sent to each MIDI OUT interface; subclasses routing
+    #the messages to several interfaces must count them
+    self._output_counts = array('q', bytes(8 * len(self._midi_outs)))
+    #Used to calculate the event rate
+    self._start_time = perf_counter_ns()
 
-    self._ignore_messages(ignore_sysex, ignore_timing, ignore_active_sense)
-    
-    #Sets the main MIDI callback where all preprocessing will be done
-    self._midi_in.set_callback(self)
+    if self._midi_in != None:
+      self._ignore_messages(ignore_sysex, ignore_timing, ignore_active_sense)
     
     #Creates the built-in callbacks, which will only echo the MIDI message
     base_callback = getattr(self, '_send_midi_message')
@@ -113,35 +211,503 @@ class MidiInputHandler:
         #it will define here at the superclass
         setattr(self, message_callback_name, callback)
     self.__log.debug("Callbacks were set")
+    self._dispatch_table = self._create_dispatch_table()
+
+    #Sets the main MIDI callback where all preprocessing will be done. This
+    #must be done at the end; otherwise, incomming messages could reach a
+    #partially initialized handler
+    if ((len(self._midi_ins) > 1) or inject_events) and (queue_size == 0):
+      queue_size = FORCED_QUEUE_SIZE
+    if self._midi_in == None:
+      self.__log.debug("No MIDI IN interface was given")
+    elif queue_size > 0:
+      self.__log.debug("Starting event queue of size %d with overflow "
+                       "policy: %s", queue_size, overflow_policy)
+      self._event_queue = MidiEventQueue(queue_size, overflow_policy,
+                                         self._is_echo_message)
+      self._event_worker = threading.Thread(target = self._process_events,
+                                            name = 'MidiEventWorker',
+                                            daemon = True)
+      self._event_worker.start()
+    if self._midi_in != None:
+      self._set_callbacks()
     self.__log.debug("MidiInputHandler was initialized:\n%s", 
                      PrettyFormat(self.__dict__))
 
+  def _set_interfaces(self, midi_in, midi_out):
+    """
+    Sets the MIDI interfaces
+    Parameters:
+    * midi_in: a MIDI IN interface, a list of them, or None
+    * midi_out: a MIDI OUT interface, a list of them, or None
+    Remarks:
+    * _midi_in and _midi_out will be the first interfaces or None; _midi_ins
+      and _midi_outs will be lists with all the interfaces
+    """
+    if type(midi_in) not in [list, tuple]:
+      midi_in = [midi_in] if midi_in != None else []
+    if type(midi_out) not in [list, tuple]:
+      midi_out = [midi_out] if midi_out != None else []
+    self._midi_ins = list(midi_in)
+    self._midi_outs = list(midi_out)
+    self._midi_in = self._midi_ins[0] if len(self._midi_ins) > 0 else None
+    self._midi_out = self._midi_outs[0] if len(self._midi_outs) > 0 else None
+
+  @staticmethod
+  def _can_stream_sysex(midi_out):
+    """
+    Checks if the SysEx messages can be streamed to the MIDI OUT interfaces
+    Parameters:
+    * midi_out: a MIDI OUT interface, a list of them, or None
+    Returns:
+    * False if an rtmidi interface uses an API not listed on
+      SYSEX_STREAMING_APIS; otherwise True. Interfaces that aren't from rtmidi
+      get the pieces of the SysEx messages as they are sent
+    """
+    if type(midi_out) not in [list, tuple]:
+      midi_out = [midi_out] if midi_out != None else []
+    streaming_apis = None
+    for interface in midi_out:
+      if not hasattr(interface, 'get_current_api'):
+        continue
+      if streaming_apis == None:
+        import rtmidi
+        streaming_apis = [getattr(rtmidi, api_name) for api_name in
+                          SYSEX_STREAMING_APIS if hasattr(rtmidi, api_name)]
+      if interface.get_current_api() not in streaming_apis:
+        return False
+    return True
+
+  def _create_output_schedulers(self, byte_rate, burst_size, max_delay):
+    """
+    Creates a MidiOutputScheduler for each MIDI OUT interface with a byte rate
+    Parameters:
+    * byte_rate: byte rate of all the interfaces or a list with the byte
+      rate of each one. Zero means no limit
+    * burst_size, max_delay: see: MidiOutputScheduler
+    Remarks:
+    * _output_schedulers will be None if no interface has a byte rate;
+      otherwise, a list with the scheduler of each interface or None
+    """
+    if type(byte_rate) not in [list, tuple]:
+      byte_rate = [byte_rate] * len(self._midi_outs)
+    if max(list(byte_rate) + [0]) > 0:
+      self._output_schedulers = []
+      for midi_out, output_byte_rate in zip(self._midi_outs, byte_rate):
+        output_scheduler = None
+        if output_byte_rate > 0:
+          self.__log.info("Limiting the MIDI OUT rate to %d bytes per second",
+                          output_byte_rate)
+          output_scheduler = MidiOutputScheduler(midi_out, output_byte_rate,
+                                                 burst_size, max_delay)
+        self._output_schedulers.append(output_scheduler)
+    self._set_output_senders()
+
+  def _set_output_senders(self):
+    """
+    Puts the note trackers and the output schedulers in place of their MIDI
+    OUT interfaces and sets the functions used to send the echo and the urgent
+    messages
+    Remarks:
+    * Each message goes first through the ActiveNoteTracker of its interface,
+      then through its MidiOutputScheduler, if any
+    * _echo_senders and _urgent_senders will be lists with a function for each
+      interface, which sends the message with the right priority. Interfaces
+      without scheduler ignore the priorities
+    """
+    self._echo_senders = []
+    self._urgent_senders = []
+    for output_index in range(len(self._midi_outs)):
+      midi_out = self._midi_outs[output_index]
+      note_tracker = self._note_trackers[output_index]
+      output_scheduler = None
+      if self._output_schedulers != None:
+        output_scheduler = self._output_schedulers[output_index]
+      if output_scheduler == None:
+        note_tracker.set_midi_out(midi_out)
+        self._midi_outs[output_index] = note_tracker
+        self._echo_senders.append(note_tracker.send_message)
+        self._urgent_senders.append(note_tracker.send_message)
+        continue
+      output_scheduler.set_midi_out(midi_out)
+      note_tracker.set_midi_out(output_scheduler)
+      self._midi_outs[output_index] = note_tracker
+      self._echo_senders.append(partial(note_tracker.send_message,
+                                        lane = ECHO_LANE))
+      self._urgent_senders.append(partial(note_tracker.send_message,
+                                          lane = URGENT_LANE))
+    self._midi_out = self._midi_outs[0] if len(self._midi_outs) > 0 else None
+
+  def _set_callbacks(self):
+    """
+    Sets the callback of each MIDI IN interface. If the event queue is
+    enabled, then the index of the interface will be passed as data to the
+    callback, so that the events can be counted by interface
+    """
+    input_index = 0
+    for midi_in in self._midi_ins:
+      if self._event_queue != None:
+        midi_in.set_callback(self._queue_event, input_index)
+      else:
+        midi_in.set_callback(self)
+      input_index += 1
+
+  def set_midi_ports(self, midi_in, midi_out):
+    """
+    Replaces the MIDI interfaces, ie: after reconnecting a MIDI device. The
+    state of the handler, ie: the event queue and the statistics, is kept
+    Parameters:
+    * midi_in: new MIDI IN interface or list of interfaces. They will get the
+      same ignored messages and callback as the ones given to the constructor
+    * midi_out: new MIDI OUT interface or list of interfaces
+    Remarks:
+    * The handler must have been created with the same number of interfaces
+    """
+    self.__log.debug("Replacing MIDI interfaces")
+    self._set_interfaces(midi_in, midi_out)
+    self._set_output_senders()
+    self._ignore_messages(*self._ignore_options)
+    self._set_callbacks()
+
+  @classmethod
+  def set_quiet_mode(cls, quiet = True):
+    """
+    Enables or disables the quiet mode. On quiet mode, the debug messages of
+    this class and its super classes will be ignored without checking the log
+    level or formatting them, so, they won't cost anything while processing
+    the MIDI messages
+    Parameters:
+    * quiet: whether or not to enable the quiet mode
+    """
+    QuietLogger.set_quiet_mode(cls, quiet)
+
+  def _create_dispatch_table(self):
+    """
+    Creates a table with 256 entries, one for each possible status byte,
+    containing the bound callback that will handle the message.
+    Returns:
+    * A list where the index is the status byte and the value is the
+      callback
+    Remarks:
+    * Channel messages (0x80 until 0xEF) are mapped sixteen times, once for
+      each MIDI channel, so that the status doesn't need to be masked.
+    * Data bytes (0x00 until 0x7F), END_OF_EXCLUSIVE, and undefined system
+      messages are mapped to _on_unhandled_message, which will decide if the
+      message is the continuation of a SysEx message
+    """
+    self.__log.debug("Creating dispatch table")
+    unhandled_callback = getattr(self, '_on_unhandled_message')
+    dispatch_table = [unhandled_callback] * 256
+    for status, midi_message in self._midi_messages.items():
+      callback = getattr(self, self._callback_preffix + midi_message)
+      if status < SYSTEM_EXCLUSIVE:
+        for channel in range(16):
+          dispatch_table[status | channel] = callback
+      else:
+        dispatch_table[status] = callback
+    self.__log.debug("Dispatch table was created")
+    return dispatch_table
+
   def __call__(self, event, data = None):
-    self.__log.debug("Executing callback with: %s", PrettyFormat(event))
+    """
+    Main MIDI callback. It will fire the handler registered on the dispatch
+    table for the status byte of the incomming message
+    """
+    start_time = perf_counter_ns()
     message, deltatime = event
-    status = message[0]
-    if message[0] != SYSTEM_EXCLUSIVE:
-      new_status = message[0] & 0xF0
-      if new_status != SYSTEM_EXCLUSIVE:
-        #This will avoid that messages like SONG_START (0XFA) get
-        #wrongly classified as SysEx
-        status = new_status
-    
-    midi_message = self._midi_messages.get(status, None)
-    callback_name = '_send_midi_message'
-    if midi_message is None:
-      if len(self._sysex_buffer) != 0:
-        self.__log.debug("Catched SysEx message chunk")
-        #This means that a SysEx message started
-        callback_name = self._callback_preffix + 'system_exclusive'
-      else:
-        self.__log.debug("Catched unhandled MIDI message")
+    with self._event_lock:
+      if self._pending_update != None:
+        self._run_pending_update()
+      self._event_class = IGNORED_EVENT
+      self._dispatch_table[message[0]](message)
+      #At this point, all the send_message calls for this event have returned
+      self._latency_histograms[self._event_class].record(perf_counter_ns() -
+                                                         start_time)
+
+  def _queue_event(self, event, data = None):
+    """
+    MIDI callback used when the event queue is enabled. It only puts the
+    message, the delta time, and the arrival time on the queue; the message
+    will be processed later on the worker thread
+    """
+    message, deltatime = event
+    input_index = 0
+    if data != None:
+      self._input_counts[data] += 1
+      input_index = data
+    self._event_queue.put((message, deltatime, perf_counter_ns(),
+                           input_index))
+
+  def inject_event(self, message):
+    """
+    Processes a message as if it was received by the MIDI IN interface. It
+    will be put on the event queue, so that it is processed on the worker
+    thread after the events that are already there
+    Parameters:
+    * message: list with the bytes of the MIDI message
+    Returns:
+    * False if the event was discarded; otherwise True
+    Remarks:
+    * The handler must have been created with inject_events set to True
+    """
+    if self._event_queue == None:
+      raise Exception("Events can only be injected when the event queue is "
+                      "enabled")
+    return self._event_queue.put((message, 0.0, perf_counter_ns(),
+                                  len(self._midi_ins)))
+
+  def _process_events(self):
+    """
+    Main loop of the worker thread. It takes the events from the queue in the
+    same order as they arrived and fires the handler registered on the
+    dispatch table. It will end after the queue gets closed and drained
+    Remarks:
+    * The latencies are measured from the arrival time, so, they include the
+      time that the event waited on the queue
+    * Before processing an event, _input_index and _sysex are set to the ones
+      of the interface where it arrived
+    * Events without MIDI message are only put by run_before_next_event to
+      wake up the worker
+    """
+    self.__log.debug("Event worker was started")
+    event_queue = self._event_queue
+    dispatch_table = self._dispatch_table
+    latency_histograms = self._latency_histograms
+    sysex_buffers = self._sysex_buffers
+    event = event_queue.get()
+    while event != None:
+      message = event[0]
+      self._input_index = event[3]
+      self._sysex = sysex_buffers[event[3]]
+      if self._pending_update != None:
+        self._run_pending_update()
+      if message == None:
+        event = event_queue.get()
+        continue
+      self._event_class = IGNORED_EVENT
+      try:
+        dispatch_table[message[0]](message)
+      except Exception:
+        self.__log.exception("Error while processing MIDI message: %s",
+                             message)
+      latency_histograms[self._event_class].record(perf_counter_ns() -
+                                                   event[2])
+      event = event_queue.get()
+    self.__log.debug("Event worker was stopped")
+
+  def run_before_next_event(self, update):
+    """
+    Runs a function between two MIDI events, so that the state of the handler
+    can be changed from other threads without being seen half changed by the
+    event being processed
+    Parameters:
+    * update: function without parameters to run. If another function was
+      already scheduled, then it will be replaced
+    Remarks:
+    * If the event queue is enabled, then the function will be run on the
+      worker thread. When the queue is empty, an event without MIDI message is
+      put on it, so that the function runs right away instead of waiting for
+      the next MIDI event
+    * Otherwise, it will be run on the calling thread after the event being
+      processed, if any, is done
+    """
+    self._pending_update = update
+    if self._event_queue != None:
+      self._event_queue.put_if_empty((None, 0.0, perf_counter_ns(),
+                                      len(self._midi_ins)))
     else:
-      self.__log.debug("Catched message: %s", midi_message)
-      callback_name = self._callback_preffix + midi_message
-    callback = getattr(self, callback_name)
-    callback(message)
-    self.__log.debug("Callback was excecuted")
+      with self._event_lock:
+        if self._pending_update != None:
+          self._run_pending_update()
+
+  def _run_pending_update(self):
+    """
+    Runs the function scheduled by run_before_next_event
+    """
+    update = self._pending_update
+    self._pending_update = None
+    try:
+      update()
+    except Exception:
+      self.__log.exception("Error while running scheduled update")
+
+  def _is_echo_message(self, message):
+    """
+    Determines whether the entered message will be only echoed, so, it can be
+    dropped if the event queue is full and its overflow policy is: 'DropEcho'.
+    By default, no message is considered as echo. Override this on the
+    subclass if needed
+    Parameters:
+    * message: Contains a list with the bytes of the MIDI Message
+    Returns:
+    * True if the message is an echo message; False otherwise
+    """
+    return False
+
+  def get_queue_stats(self):
+    """
+    Gets the statistics of the event queue
+    Returns:
+    * A dictionary with the statistics or None if the queue isn't enabled.
+      See: MidiEventQueue.get_stats
+    """
+    if self._event_queue == None:
+      return None
+    return self._event_queue.get_stats()
+
+  def get_latency_stats(self):
+    """
+    Gets the latency statistics of each class of MIDI events. The latency is
+    measured from the moment the event arrives until all the send_message
+    calls for it have returned
+    Returns:
+    * A dictionary where the keys are the names of the event classes and the
+      values are dictionaries with: count, p50, p99, and max. The latencies
+      are given in nanoseconds. Classes without events are omitted
+    """
+    latency_stats = {}
+    for event_class in range(len(EVENT_CLASSES)):
+      histogram = self._latency_histograms[event_class]
+      if histogram.get_count() != 0:
+        latency_stats[EVENT_CLASSES[event_class]] = histogram.get_stats()
+    return latency_stats
+
+  def log_latency_stats(self):
+    """
+    Logs the latency statistics of each class of MIDI events
+    """
+    latency_stats = self.get_latency_stats()
+    if len(latency_stats) == 0:
+      self.__log.info("Latencies: no MIDI events were processed")
+    for event_class, stats in latency_stats.items():
+      self.__log.info("Latencies of %s events: count: %d, p50: %.1f us, "
+                      "p99: %.1f us, max: %.1f us", event_class,
+                      stats['count'], stats['p50'] / 1000.0,
+                      stats['p99'] / 1000.0, stats['max'] / 1000.0)
+
+  def get_event_stats(self):
+    """
+    Gets the number of processed MIDI events and their rate since the handler
+    was created
+    Returns:
+    * A dictionary with: 'events', the number of events of all the classes,
+      'seconds', the elapsed time, and 'rate', the events per second
+    """
+    events = 0
+    for histogram in self._latency_histograms:
+      events += histogram.get_count()
+    seconds = (perf_counter_ns() - self._start_time) / 1e9
+    rate = 0.0
+    if seconds > 0:
+      rate = events / seconds
+    return {'events': events, 'seconds': seconds, 'rate': rate}
+
+  def get_port_stats(self):
+    """
+    Gets the number of events received by each MIDI IN interface and the
+    number of messages sent to each MIDI OUT interface
+    Returns:
+    * A dictionary with two lists: 'inputs' and 'outputs', which have the
+      same order as the interfaces
+    """
+    return {
+      'inputs': self._input_counts.tolist(),
+      'outputs': self._output_counts.tolist()
+    }
+
+  def get_output_stats(self):
+    """
+    Gets the statistics of the output schedulers
+    Returns:
+    * A list with the statistics of each MIDI OUT interface, see:
+      MidiOutputScheduler.get_stats, or None for the interfaces without byte
+      rate. If no interface has a byte rate, then None will be returned
+    """
+    if self._output_schedulers == None:
+      return None
+    return [output_scheduler.get_stats() if output_scheduler != None else None
+            for output_scheduler in self._output_schedulers]
+
+  def get_active_notes(self):
+    """
+    Gets the notes that are sounding on each MIDI OUT interface
+    Returns:
+    * A list with the ActiveNotes of each interface
+    """
+    return list(self._note_trackers)
+
+  def send_notes_off(self, keep_notes = None):
+    """
+    Sends a NOTE OFF message for each note that is still sounding on the MIDI
+    OUT interfaces, so that no note gets stuck without having to reset all
+    the channels
+    Parameters:
+    * keep_notes: list with an ActiveNotes object for each interface. Its
+      notes will keep sounding. If None, then all the notes will be stopped
+    Returns:
+    * The number of sent NOTE OFF messages
+    Remarks:
+    * On the outputs with byte rate, the NOTE OFF messages have the highest
+      priority. See: MidiOutputScheduler
+    """
+    num_messages = 0
+    for output_index in range(len(self._note_trackers)):
+      notes_off = self._note_trackers[output_index].get_notes_off(
+                    keep_notes[output_index] if keep_notes != None else None)
+      urgent_sender = self._urgent_senders[output_index]
+      for message in notes_off:
+        self.__log.debug("Sending MIDI message: %s", message)
+        urgent_sender(message)
+      self._output_counts[output_index] += len(notes_off)
+      num_messages += len(notes_off)
+    return num_messages
+
+  def close(self):
+    """
+    Stops the worker thread after processing the events that are still on the
+    queue, stops the notes that are still sounding, sends the messages waiting
+    on the output schedulers, and logs the statistics
+    """
+    if self._event_queue != None:
+      self.__log.debug("Closing event queue")
+      self._event_queue.close()
+      self._event_worker.join()
+      self.__log.info("Event queue statistics: %s", self.get_queue_stats())
+    try:
+      num_notes = self.send_notes_off()
+      if num_notes > 0:
+        self.__log.info("%d sounding notes were stopped", num_notes)
+    except Exception:
+      #The queued messages must be still sent, ie: if only one of the MIDI OUT
+      #interfaces failed
+      self.__log.exception("Error while stopping the sounding notes")
+    if self._output_schedulers != None:
+      self.__log.debug("Closing output schedulers")
+      for output_scheduler in self._output_schedulers:
+        if output_scheduler != None:
+          output_scheduler.close()
+      self.__log.info("Output scheduler statistics: %s",
+                      self.get_output_stats())
+    if (len(self._midi_ins) > 1) or (len(self._midi_outs) > 1):
+      self.__log.info("Port statistics: %s", self.get_port_stats())
+    self.log_latency_stats()
+
+  def _on_unhandled_message(self, message):
+    """
+    Handles messages without an entry on _midi_messages
+    Parameters:
+    * message: Contains a list with the bytes of the MIDI Message
+    Remarks:
+    * If a SysEx message reception was started, then the message will be
+      threatened as the next SysEx chunk; otherwise, it will be sent with
+      _send_midi_message
+    """
+    if self._sysex.is_receiving():
+      self.__log.debug("Catched SysEx message chunk")
+      self._dispatch_table[SYSTEM_EXCLUSIVE](message)
+    else:
+      self.__log.debug("Catched unhandled MIDI message")
+      self._send_midi_message(message)
 
   def _send_midi_message(self, message):
     """
@@ -157,17 +723,20 @@ class MidiInputHandler:
       assuming _callback_preffix equal to "_on_")
     """
     self.__log.debug("Sending MIDI message: %s", message)
-    #This may really slower things because it will do some operations in
-    #the message to make it human readable. Use it only for debugging
-    message_string = "MIDI message: %s" % \
-      '[{}]'.format(' '.join(hex(x).lstrip("0x").upper().zfill(2)
-      for x in message))
-    self.__log.debug(message_string)
-
-    if (self._midi_out == None) or (self._console_echo):
-      self.__log.info(message_string)
+    print_message = (self._midi_out == None) or (self._console_echo)
+    if print_message or self.__log.isEnabledFor(logging.DEBUG):
+      #This may really slower things because it will do some operations in
+      #the message to make it human readable, so, it is only done when the
+      #message is going to be printed or logged
+      message_string = "MIDI message: %s" % \
+        '[{}]'.format(' '.join(hex(x).lstrip("0x").upper().zfill(2)
+        for x in message))
+      self.__log.debug(message_string)
+      if print_message:
+        self.__log.info(message_string)
     
     if self._midi_out != None:
+      self._event_class = ECHO_EVENT
       self._midi_out.send_message(message)
     self.__log.debug("MIDI message was sent")
 
@@ -176,40 +745,57 @@ class MidiInputHandler:
     Appends the entered message to the SysEx buffer.
     Parameters:
     * message: SysEx message chunk to append to the buffer
-    Returns: False if the end of the SysEx message (0xF7) was detected, so,
-         no more data needs to be read. True will be returned if the
-         SysEx message is not yet complete
+    Returns:
+    * SYSEX_COMPLETE if the end of the SysEx message (0xF7) was detected, so,
+      no more data needs to be read, SYSEX_DISCARDED if the message was
+      bigger than the maximum size, or SYSEX_INCOMPLETE if the SysEx message
+      is not yet complete. See: SysExReassembler.add
     Remarks:
     * Please note that this method will be only called after the reception
       of a SysEx message was started. This must be done inside the
       _on_system_exclusive handler. Do not override this on the subclass
     """
-    self.__log.debug("Receiving SysEx message: %s", message)
-    self._sysex_chunk += 1
-    if len(self._sysex_buffer) == 0:
-      self.__log.debug("Beginning SysEx reception. Chunk number: %d, "
-        "bytes: %d", self._sysex_chunk, len(message))
-      #gets the first part of the system_exclusive message
-      self._sysex_buffer = message
-    else:
-      self.__log.debug("Reading next SysEx fragment. Chunk number: %s, "
-        "bytes: %d", self._sysex_chunk, len(message))
-      #appends the next part of the system_exclusive message
-      self._sysex_buffer.extend(message)
-
-    if self._sysex_buffer[-1] == END_OF_EXCLUSIVE:
-      #End receiving SysEx
-      self.__log.debug("SysEx reception was completed. Total chunks: %s, "
-        "total bytes: %d", self._sysex_chunk, len(self._sysex_buffer))
-            
-      #This may really slower things because it will do some operations in
-      #the message to make it human readable. Use it only for debugging 
-      self.__log.debug("MIDI message: %s",
-        '[{}]'.format(' '.join(hex(x).lstrip("0x").upper().zfill(2)
-        for x in self._sysex_buffer)))
-      return False
+    sysex = self._sysex
+    result = sysex.add(message)
+    if self.__log.isEnabledFor(logging.DEBUG):
+      #Only the first bytes are formatted; formatting a whole dump would
+      #delay the next events by several seconds
+      self.__log.debug("Received SysEx chunk number: %d: %s",
+                       sysex.get_chunks(), format_sysex(message))
+      if result == SYSEX_COMPLETE:
+        self.__log.debug("SysEx reception was completed. Total chunks: %d, "
+                         "total bytes: %d", sysex.get_chunks(),
+                         sysex.get_size())
+    if result == SYSEX_DISCARDED:
+      self.__log.info("A SysEx message of %d bytes was discarded because it "
+                      "is too big", sysex.get_size())
+    return result
 
-    return True
+  def _stream_sysex_chunk(self, message, send_message):
+    """
+    Sends a chunk of a SysEx message that is being received on streaming mode
+    Parameters:
+    * message: SysEx message chunk
+    * send_message: function sending the chunk, ie: MidiOut.send_message
+    Remarks:
+    * The continuation chunks don't start with 0xF0, so, python-rtmidi would
+      reject them if they are longer than MAX_CONTINUATION_SIZE; on that
+      case, they will be sent in several pieces. RtMidi doesn't guarantee that
+      they get joined again on the output stream; this is why streaming is
+      only enabled for the APIs on SYSEX_STREAMING_APIS
+    * Sending many small pieces is much slower than sending the whole message
+      at once; streaming only reduces the time until the first byte is sent
+      and the memory used by big dumps
+    """
+    num_bytes = len(message)
+    if (message[0] == SYSTEM_EXCLUSIVE) or \
+       (num_bytes <= MAX_CONTINUATION_SIZE):
+      send_message(message)
+      return
+    byte_index = 0
+    while byte_index < num_bytes:
+      send_message(message[byte_index:byte_index + MAX_CONTINUATION_SIZE])
+      byte_index += MAX_CONTINUATION_SIZE
 
   def _send_system_exclusive(self, message):
     """
@@ -226,23 +812,25 @@ class MidiInputHandler:
       _on_system_exclusive (Here I'm assuming that _callback_preffix is
       equal to "_on_"), then leave the part receiving the SysEx equal; only
       after you have received the whole SysEx, you should add your post
-      processing. You must also clear the SysEx buffer afterwards
+      processing. The SysEx buffer is cleared when the next message begins
+    * On streaming mode, each chunk will be sent as soon as it arrives
     """
-    if not self._receive_sysex(message):
-      self.__log.debug("Sending SysEx message: %s", message)
+    self._event_class = SYSEX_EVENT
+    result = self._receive_sysex(message)
+    if self._sysex.is_streaming():
+      if self._midi_out != None:
+        self._stream_sysex_chunk(message, self._midi_out.send_message)
+    elif result == SYSEX_COMPLETE:
+      self.__log.debug("Sending SysEx message")
       #This means that the end of the SysEx message (0xF7) was detected,
       #so, no further bytes will be received. Here the SysEx buffer will
-      #be sent and afterwards cleared
+      #be sent
+      sysex_message = self._sysex.get_message()
       if (self._midi_out == None) or (self._console_echo):
-        self.__log.info(PrettyFormat(self._sysex_buffer))
+        self.__log.info(PrettyFormat(list(sysex_message)))
         
       if self._midi_out != None:
-        self._midi_out.send_message(self._sysex_buffer)
-
-      #Clears SysEx buffer
-      self._sysex_buffer = []
-      #Resets SysEx count to zero
-      self._sysex_chunk = 0
+        self._midi_out.send_message(sysex_message)
       self.__log.debug("SysEx message was sent")
 
   def _ignore_messages(self, ignore_sysex = True, ignore_timing = True,
@@ -264,5 +852,6 @@ class MidiInputHandler:
     self.__log.debug("ignore_sysex: %s, ignore_timing: %s, "
                      "ignore_active_sense: %s", ignore_sysex, ignore_timing,
                      ignore_active_sense)
-    self._midi_in.ignore_types(sysex = ignore_sysex,
-      timing = ignore_timing, active_sense = ignore_active_sense)
+    for midi_in in self._midi_ins:
+      midi_in.ignore_types(sysex = ignore_sysex, timing = ignore_timing,
+                           active_sense = ignore_active_sense)
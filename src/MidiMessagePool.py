@@ -0,0 +1,69 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# JMMidiBassPedalController v3.0
+# File: src/MidiMessagePool.py
+# By:   Josef Meile <jmeile@hotmail.com> @ 28.10.2020
+# This project is licensed under the MIT License. Please see the LICENSE.md file
+# on the main folder of this code. An online version can be found here:
+# https://github.com/jmeile/JMMidiBassPedalController/blob/master/LICENSE.md
+#
+"""Stores static MIDI messages in one contiguous buffer."""
+
+class MidiMessagePool:
+  """
+  Pool of MIDI messages backed by a single buffer. The messages are first
+  added, then the pool gets frozen; afterwards each message can be retrieved
+  as a read only memoryview slice of the buffer, which can be directly passed
+  to MidiOut.send_message without creating new lists
+  """
+
+  def __init__(self):
+    """
+    Initializes the class attributes
+    """
+    self._buffer = bytearray()
+    self._offsets = {}
+    self._views = None
+
+  def add(self, message):
+    """
+    Adds a message to the pool. Identical messages will be only stored once
+    Parameters:
+    * message: sequence with the bytes of the MIDI or SysEx message
+    Remarks:
+    * Messages can't be added after calling freeze
+    """
+    if self._views != None:
+      raise Exception("Messages can't be added to a frozen pool")
+    message = tuple(message)
+    if message not in self._offsets:
+      self._offsets[message] = len(self._buffer)
+      self._buffer.extend(message)
+
+  def freeze(self):
+    """
+    Copies the added messages to an immutable buffer and creates the
+    memoryview slices of each message
+    """
+    arena = memoryview(bytes(self._buffer))
+    views = {}
+    for message, offset in self._offsets.items():
+      views[message] = arena[offset:offset + len(message)]
+    self._views = views
+
+  def get(self, message):
+    """
+    Gets the memoryview slice of an added message
+    Parameters:
+    * message: sequence with the bytes of the MIDI or SysEx message
+    Returns:
+    * A read only memoryview with the message bytes
+    """
+    return self._views[tuple(message)]
+
+  def __len__(self):
+    """
+    Returns the size in bytes of the buffer
+    """
+    return len(self._buffer)
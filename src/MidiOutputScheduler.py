@@ -0,0 +1,287 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# JMMidiBassPedalController v3.0
+# File: src/MidiOutputScheduler.py
+# By:   Josef Meile <jmeile@hotmail.com> @ 28.10.2020
+# This project is licensed under the MIT License. Please see the LICENSE.md file
+# on the main folder of this code. An online version can be found here:
+# https://github.com/jmeile/JMMidiBassPedalController/blob/master/LICENSE.md
+#
+"""Limits the rate of the messages sent to a slow MIDI OUT interface."""
+
+from collections import deque
+import threading
+from time import perf_counter
+from rtmidi.midiconstants import NOTE_OFF, NOTE_ON, CONTROL_CHANGE, \
+                                 ALL_SOUND_OFF, ALL_NOTES_OFF
+
+#Priority lanes of the scheduled messages; the messages of the first lanes are
+#sent first:
+#* URGENT_LANE: NOTE OFF messages and panic commands
+#* NOTE_LANE: bass pedal and chord notes, and the other messages of the pedals
+#* ECHO_LANE: echoed messages
+URGENT_LANE = 0
+NOTE_LANE = 1
+ECHO_LANE = 2
+LANE_NAMES = ['urgent', 'notes', 'echo']
+
+#Bytes per second of a MIDI DIN cable: 31250 bauds with 10 bits per byte
+DIN_BYTE_RATE = 3125
+
+#Default number of bytes that can be sent at once without waiting
+DEFAULT_BURST_SIZE = 64
+
+#Default maximum time in seconds that the queued messages may need to be sent
+DEFAULT_MAX_DELAY = 0.1
+
+def is_note_off(message):
+  """
+  Checks if the entered message stops notes
+  Parameters:
+  * message: MIDI message
+  Returns:
+  * True if it is a NOTE OFF, a NOTE ON with zero velocity, or an ALL SOUND
+    OFF or ALL NOTES OFF controller message
+  """
+  status = message[0] & 0xF0
+  if status == NOTE_OFF:
+    return True
+  if len(message) < 3:
+    return False
+  if status == NOTE_ON:
+    return message[2] == 0
+  if status == CONTROL_CHANGE:
+    return message[1] in (ALL_SOUND_OFF, ALL_NOTES_OFF)
+  return False
+
+class MidiOutputScheduler:
+  """
+  Sends the messages to a MIDI OUT interface without exceeding a byte rate,
+  ie: the one of a MIDI DIN cable; some cheap interfaces drop the messages
+  when they get more than that. The rate is limited with a token bucket:
+  messages are sent immediately while there are enough bytes left on the
+  bucket; otherwise, they are queued on their priority lane and a thread
+  sends them as soon as the bucket gets refilled.
+  Remarks:
+  * NOTE OFF messages always go to the urgent lane. If a NOTE ON for the same
+    channel and note is still waiting on another lane, then it will be
+    discarded; otherwise, the NOTE OFF would be sent first and the note would
+    get stuck. ALL SOUND OFF and ALL NOTES OFF messages are handled the same
+    way
+  * If the queued messages need more time than the maximum delay to be sent,
+    then the oldest echo messages will be discarded; if there aren't any, the
+    oldest messages of the note lane. The urgent messages are never discarded
+  * Besides of the messages, it keeps the following statistics for each lane:
+    - sent: number of sent messages
+    - deferred: number of messages that had to wait on the queue
+    - dropped: number of messages that were discarded because of overload
+    - cancelled: number of NOTE ON messages discarded because their NOTE OFF
+      arrived before they were sent
+  """
+
+  def __init__(self, midi_out, byte_rate = DIN_BYTE_RATE,
+               burst_size = DEFAULT_BURST_SIZE,
+               max_delay = DEFAULT_MAX_DELAY):
+    """
+    Initializes the class attributes
+    Parameters:
+    * midi_out: MIDI OUT interface where the messages will be sent
+    * byte_rate: maximum number of bytes per second
+    * burst_size: number of bytes that can be sent at once without waiting.
+      Messages bigger than this, ie: SysEx dumps, are sent when the bucket is
+      full and the next messages wait until their bytes are paid back
+    * max_delay: maximum time in seconds that the queued messages may need
+      to be sent before starting to discard them
+    """
+    self._midi_out = midi_out
+    self._byte_rate = float(byte_rate)
+    self._burst_size = burst_size
+    self._max_queued_bytes = max(burst_size, int(byte_rate * max_delay))
+    self._tokens = float(burst_size)
+    self._refill_time = perf_counter()
+    self._lanes = [deque() for lane in LANE_NAMES]
+    self._queued_bytes = 0
+    self._condition = threading.Condition()
+    self._closed = False
+    self.high_water_mark = 0
+    self.sent_messages = [0] * len(LANE_NAMES)
+    self.deferred_messages = [0] * len(LANE_NAMES)
+    self.dropped_messages = [0] * len(LANE_NAMES)
+    self.cancelled_messages = [0] * len(LANE_NAMES)
+    self._sender = threading.Thread(target = self._send_queued_messages,
+                                    name = 'MidiOutputScheduler',
+                                    daemon = True)
+    self._sender.start()
+
+  def set_midi_out(self, midi_out):
+    """
+    Replaces the MIDI OUT interface, ie: after reconnecting a MIDI device. The
+    queued messages will be sent to the new interface
+    """
+    with self._condition:
+      self._midi_out = midi_out
+
+  def send_message(self, message, lane = NOTE_LANE):
+    """
+    Sends a message or queues it if the byte rate was reached
+    Parameters:
+    * message: MIDI message to send
+    * lane: priority lane of the message. NOTE OFF messages always go to the
+      urgent lane
+    """
+    if is_note_off(message):
+      lane = URGENT_LANE
+    with self._condition:
+      if self._closed:
+        self.dropped_messages[lane] += 1
+        return
+      if lane == URGENT_LANE:
+        self._cancel_note_on(message)
+      self._refill()
+      if (self._queued_bytes == 0) and \
+         (self._tokens >= min(len(message), self._burst_size)):
+        self._send(message, lane)
+        return
+      #The message is copied because the caller may reuse its object, ie: the
+      #buffer of the SysExReassembler, before the message gets sent
+      message = bytes(message)
+      self._lanes[lane].append(message)
+      self._queued_bytes += len(message)
+      self.deferred_messages[lane] += 1
+      if self._queued_bytes > self.high_water_mark:
+        self.high_water_mark = self._queued_bytes
+      self._shed_messages()
+      self._condition.notify_all()
+
+  def _refill(self):
+    """
+    Adds to the bucket the bytes earned since the last refill
+    """
+    now = perf_counter()
+    self._tokens = min(float(self._burst_size), self._tokens + \
+                       (now - self._refill_time) * self._byte_rate)
+    self._refill_time = now
+
+  def _send(self, message, lane):
+    """
+    Sends a message and takes its bytes from the bucket. It must be called
+    while holding the lock, so that the messages keep their order
+    """
+    self._tokens -= len(message)
+    self._midi_out.send_message(message)
+    self.sent_messages[lane] += 1
+
+  def _cancel_note_on(self, message):
+    """
+    Discards the queued NOTE ON messages stopped by the entered message
+    Parameters:
+    * message: urgent message. NOTE OFF messages stop the NOTE ON messages of
+      their note and channel; ALL SOUND OFF and ALL NOTES OFF, the ones of
+      their channel
+    """
+    if (self._queued_bytes == 0) or not is_note_off(message):
+      return
+    note_on_status = NOTE_ON | (message[0] & 0x0F)
+    note = None
+    if (message[0] & 0xF0) != CONTROL_CHANGE:
+      note = message[1]
+    for lane in [NOTE_LANE, ECHO_LANE]:
+      queue = self._lanes[lane]
+      cancelled = [queued_message for queued_message in queue
+                   if (queued_message[0] == note_on_status) and \
+                      (len(queued_message) == 3) and \
+                      (queued_message[2] != 0) and \
+                      (note == None or queued_message[1] == note)]
+      for queued_message in cancelled:
+        queue.remove(queued_message)
+        self._queued_bytes -= len(queued_message)
+        self.cancelled_messages[lane] += 1
+
+  def _shed_messages(self):
+    """
+    Discards the oldest echo messages and afterwards the oldest note messages
+    until the queued messages can be sent within the maximum delay
+    """
+    for lane in [ECHO_LANE, NOTE_LANE]:
+      queue = self._lanes[lane]
+      while (self._queued_bytes > self._max_queued_bytes) and (len(queue) > 0):
+        self._queued_bytes -= len(queue.popleft())
+        self.dropped_messages[lane] += 1
+
+  def _send_queued_messages(self):
+    """
+    Main loop of the sender thread. It sends the queued messages, starting with
+    the urgent ones, as soon as there are enough bytes on the bucket
+    """
+    with self._condition:
+      while True:
+        if self._queued_bytes == 0:
+          if self._closed:
+            return
+          self._condition.wait()
+          continue
+        lane = None
+        for lane_index in range(len(LANE_NAMES)):
+          if len(self._lanes[lane_index]) > 0:
+            lane = lane_index
+            break
+        if lane == None:
+          #The byte count doesn't match the queues anymore; the thread must
+          #keep running, so, the count is fixed
+          self._queued_bytes = 0
+          continue
+        message = self._lanes[lane][0]
+        self._refill()
+        missing_bytes = min(len(message), self._burst_size) - self._tokens
+        if missing_bytes > 0:
+          #New messages may arrive meanwhile; an urgent one will be sent first
+          self._condition.wait(missing_bytes / self._byte_rate)
+          continue
+        self._lanes[lane].popleft()
+        self._queued_bytes -= len(message)
+        try:
+          self._send(message, lane)
+        except Exception:
+          #The interface may be gone, ie: the device was unplugged; the
+          #thread must keep running for the interface replacing it
+          self.dropped_messages[lane] += 1
+        self._condition.notify_all()
+
+  def close(self, timeout = None):
+    """
+    Sends the queued messages and stops the sender thread
+    Parameters:
+    * timeout: maximum number of seconds to wait. The messages still queued
+      afterwards will be discarded. If None, then the time needed to send the
+      queued messages plus one second will be used
+    """
+    with self._condition:
+      self._closed = True
+      if timeout == None:
+        timeout = self._queued_bytes / self._byte_rate + 1.0
+      self._condition.notify_all()
+    self._sender.join(timeout)
+    with self._condition:
+      for lane in range(len(LANE_NAMES)):
+        self.dropped_messages[lane] += len(self._lanes[lane])
+        self._lanes[lane].clear()
+      self._queued_bytes = 0
+      self._condition.notify_all()
+    self._sender.join()
+
+  def get_stats(self):
+    """
+    Returns a dictionary with the scheduler statistics. The counters are
+    dictionaries with the value of each lane
+    """
+    with self._condition:
+      return {
+        'byte_rate': int(self._byte_rate),
+        'queued_bytes': self._queued_bytes,
+        'high_water_mark': self.high_water_mark,
+        'sent': dict(zip(LANE_NAMES, self.sent_messages)),
+        'deferred': dict(zip(LANE_NAMES, self.deferred_messages)),
+        'dropped': dict(zip(LANE_NAMES, self.dropped_messages)),
+        'cancelled': dict(zip(LANE_NAMES, self.cancelled_messages))
+      }
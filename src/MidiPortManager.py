@@ -0,0 +1,212 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# JMMidiBassPedalController v3.0
+# File: src/MidiPortManager.py
+# By:   Josef Meile <jmeile@hotmail.com> @ 28.10.2020
+# This project is licensed under the MIT License. Please see the LICENSE.md file
+# on the main folder of this code. An online version can be found here:
+# https://github.com/jmeile/JMMidiBassPedalController/blob/master/LICENSE.md
+#
+"""Process wide manager of the rtmidi clients used to list and open ports."""
+
+from __future__ import print_function
+import fnmatch
+import os
+import re
+import threading
+from rtmidi import MidiIn, MidiOut
+from CustomLogger import CustomLogger, PrettyFormat
+import logging
+from autologging import logged
+
+#Types of MIDI interfaces, as used by rtmidi.midiutil.open_midiport
+INTERFACE_TYPES = ['input', 'output']
+
+#Creates a logger for this module.
+logger = logging.getLogger(CustomLogger.get_module_name())
+
+#Setups the logger with default settings
+logger.setup()
+
+#Shared port manager. See: get_port_manager
+_port_manager = None
+
+#Makes sure that only one port manager gets created
+_port_manager_lock = threading.Lock()
+
+def get_port_manager():
+  """
+  Gets the port manager of this process. It will be created the first time
+  that it is requested
+  """
+  global _port_manager
+  with _port_manager_lock:
+    if _port_manager == None:
+      _port_manager = MidiPortManager()
+    return _port_manager
+
+@logged(logger)
+class MidiPortManager:
+  """
+  Keeps one rtmidi client per interface type for the whole process, so that
+  listing and opening the ports, ie: after reloading the controller, doesn't
+  create and destroy sequencer clients each time. Besides, it caches:
+  * the names of the available ports. The functions registered with
+    add_port_listener will be called when they change
+  * the compiled fnmatch patterns used to search the ports by name
+  """
+
+  def __init__(self):
+    """
+    Initializes the class attributes
+    """
+    self._clients = {'input': None, 'output': None}
+    self._ports = {'input': None, 'output': None}
+    self._port_listeners = []
+    self._patterns = {}
+    self._lock = threading.RLock()
+
+  def get_client(self, interface_type):
+    """
+    Gets the rtmidi client for the specified interface type
+    Parameters:
+    * interface_type: either 'input' or 'output'
+    Returns:
+    * The MidiIn or MidiOut object. It will be created the first time that it
+      is requested
+    """
+    with self._lock:
+      client = self._clients[interface_type]
+      if client == None:
+        self.__log.debug("Creating MIDI %s client", interface_type)
+        if interface_type == 'input':
+          client = MidiIn()
+        else:
+          client = MidiOut()
+        self._clients[interface_type] = client
+      return client
+
+  def add_port_listener(self, listener):
+    """
+    Registers a function that will be called when the available ports change
+    Parameters:
+    * listener: function receiving the interface type, the previous list of
+      port names, and the new one
+    """
+    with self._lock:
+      if listener not in self._port_listeners:
+        self._port_listeners.append(listener)
+
+  def remove_port_listener(self, listener):
+    """
+    Removes a function registered with add_port_listener
+    Parameters:
+    * listener: function to remove
+    """
+    with self._lock:
+      if listener in self._port_listeners:
+        self._port_listeners.remove(listener)
+
+  def get_ports(self, interface_type, refresh = False):
+    """
+    Gets the names of the available ports
+    Parameters:
+    * interface_type: either 'input' or 'output'
+    * refresh: if True, then the ports will be enumerated again; otherwise,
+      the cached list will be returned if there is one
+    Returns:
+    * A list with the port names. Their positions are the port indexes used
+      by rtmidi
+    Remarks:
+    * If the ports changed since the last enumeration, then the registered
+      listeners will be called
+    """
+    with self._lock:
+      previous_ports = self._ports[interface_type]
+      if (previous_ports != None) and not refresh:
+        return previous_ports
+      ports = self.get_client(interface_type).get_ports()
+      self.__log.debug("Got MIDI %s ports:\n%s", interface_type,
+                       PrettyFormat(ports))
+      self._ports[interface_type] = ports
+      listeners = list(self._port_listeners)
+    if (previous_ports != None) and (ports != previous_ports):
+      for listener in listeners:
+        listener(interface_type, previous_ports, ports)
+    return ports
+
+  def find_port(self, port_list, pattern):
+    """
+    Searches a port by name
+    Parameters:
+    * port_list: list with the port names
+    * pattern: fnmatch pattern with the name of the port, ie: "USB Midi*"
+    Returns:
+    * The index of the first matching port or None if it wasn't found
+    Remarks:
+    * The names are matched as fnmatch.filter does, so, on Windows the case is
+      ignored
+    """
+    match = self._patterns.get(pattern)
+    if match == None:
+      match = re.compile(fnmatch.translate(os.path.normcase(pattern))).match
+      self._patterns[pattern] = match
+    port_index = 0
+    for port_name in port_list:
+      if match(os.path.normcase(port_name)) != None:
+        return port_index
+      port_index += 1
+    return None
+
+  def open_port(self, interface_type, midi_port, is_virtual = False,
+                client_name = None):
+    """
+    Opens a port with the client of the specified interface type
+    Parameters:
+    * interface_type: either 'input' or 'output'
+    * midi_port: index of the port to open or the name of the virtual port
+    * is_virtual: whether or not a virtual port will be created
+    * client_name: name of the client for virtual ports. Other applications
+      will see the virtual port as: <client_name>:<midi_port>
+    Returns:
+    * The MidiIn or MidiOut object with the opened port
+    Remarks:
+    * If the client already has an opened port, then a new client will be
+      created for this port; it will be released when closing the port
+    * It can be called from several threads, ie: by the controllers of the
+      ControllerHost
+    """
+    with self._lock:
+      midi_interface = self.get_client(interface_type)
+      if midi_interface.is_port_open():
+        self.__log.debug("The MIDI %s client is being used; creating a new one",
+                         interface_type)
+        if interface_type == 'input':
+          midi_interface = MidiIn()
+        else:
+          midi_interface = MidiOut()
+      #The port is opened while holding the lock; otherwise, other thread
+      #could also find the shared client free and open its port on it
+      if is_virtual:
+        if client_name != None:
+          try:
+            midi_interface.set_client_name(client_name)
+          except NotImplementedError:
+            self.__log.debug("The client name can't be changed on this API")
+        midi_interface.open_virtual_port(midi_port)
+      else:
+        midi_interface.open_port(midi_port)
+      return midi_interface
+
+  def close_port(self, midi_interface):
+    """
+    Closes the port of the entered interface. The shared clients are kept, so
+    that they can be used to open other ports
+    Parameters:
+    * midi_interface: MidiIn or MidiOut object returned by open_port
+    """
+    if isinstance(midi_interface, MidiIn):
+      #Otherwise, the client would keep a reference to the old callback
+      midi_interface.cancel_callback()
+    midi_interface.close_port()
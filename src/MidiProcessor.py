@@ -16,20 +16,151 @@ overwritting the NOTE ON, NOTE OFF, AND CONTROL CHANGE messages
 from __future__ import print_function
 import traceback
 import time
-from MidiInputHandler import MidiInputHandler
+import threading
+import hashlib
+import pickle
+from collections import namedtuple
+from MidiInputHandler import MidiInputHandler, PEDAL_NOTE_EVENT, \
+                             BANK_SELECT_EVENT, ECHO_EVENT, SYSEX_EVENT
 from MidiUtilities import calculate_base_note_octave, parse_note, \
                           is_valid_sysex, is_valid_midi_message, \
                           NOTE_SYMBOL_TO_MIDI, NOTE_VELOCITIES, FIRST_OCTAVE, \
                           LAST_OCTAVE, BANK_SELECT_FUNCTIONS, NOTE_TRIGGERS
 from StringUtilities import read_text_file, multiple_split
 from ByteUtilities import convert_unicode_to_7_bit_bytes, \
-                          convert_byte_array_to_list
+                          convert_byte_array_to_list, build_bank_list_pages, \
+                          BankListDecoder, BANK_LIST_REQUEST_OPERATION
+from MidiMessagePool import MidiMessagePool
+from ActiveNotes import ActiveNotes
+from MidiOutputScheduler import DEFAULT_BURST_SIZE, DEFAULT_MAX_DELAY
+from SysExReassembler import format_sysex, DEFAULT_MAX_SYSEX_SIZE, \
+                             SYSEX_COMPLETE
 from CustomLogger import CustomLogger, PrettyFormat
 import logging
 from autologging import logged
 from rtmidi.midiconstants import (CONTROL_CHANGE, NOTE_OFF, NOTE_ON,
                                   SYSTEM_EXCLUSIVE, END_OF_EXCLUSIVE)
 
+#Name of the output port given by the OutPort attribute on the Routing node
+DEFAULT_OUTPUT_NAME = "Default"
+
+#Maximum seconds that the main loop waits before checking again for keyboard
+#interrupts
+KEYBOARD_INTERRUPT_INTERVAL = 1.0
+
+"""
+Compiled actions of a pedal for a given trigger (NOTE ON or NOTE OFF):
+* messages: General MIDI and SysEx messages to send first
+* velocity_table: tuple with 128 elements, one per incomming velocity, each
+  containing the fully built bass pedal and chord note messages
+* zero_velocity_messages: the bass pedal and chord note messages with a
+  velocity of zero; they will be sent when a NOTE ON message with a zero
+  velocity was changed to NOTE OFF
+* bank_select: BankSelect operation; it will be only set on NOTE OFF
+* send_panic: whether or not to send the panic command; it will be only set on
+  NOTE OFF
+* note_off_action: the PedalAction used to release the pedal. It will be only
+  set on NOTE ON
+"""
+PedalAction = namedtuple('PedalAction', ['messages', 'velocity_table',
+                                         'zero_velocity_messages',
+                                         'bank_select', 'send_panic',
+                                         'note_off_action'])
+
+class HeldPedals:
+  """
+  Ordered set with the pedals that are currently pressed. The pedals are kept
+  in the order they were pressed. All the data is stored on preallocated lists,
+  so, pressing and releasing pedals won't allocate any memory
+  """
+
+  def __init__(self):
+    """
+    Initializes the class attributes
+    """
+    #Notes of the pressed pedals in the order they were pressed
+    self._notes = [0] * 128
+    #Tuples with the NOTE OFF PedalAction and velocity of each pressed pedal,
+    #indexed by the pedal note
+    self._pedals = [None] * 128
+    self._count = 0
+
+  def __len__(self):
+    return self._count
+
+  def __contains__(self, note):
+    return self._pedals[note] != None
+
+  def __getitem__(self, note):
+    """
+    Gets a tuple with the NOTE OFF PedalAction and velocity of a pressed pedal
+    """
+    return self._pedals[note]
+
+  def __repr__(self):
+    return repr(dict((note, self._pedals[note]) for note in self.notes()))
+
+  def notes(self):
+    """
+    Returns a list with the notes of the pressed pedals in the order they were
+    pressed
+    """
+    return self._notes[:self._count]
+
+  def first(self):
+    """
+    Returns the note of the first pressed pedal
+    """
+    return self._notes[0]
+
+  def add(self, note, pedal_action, velocity):
+    """
+    Adds a pedal at the end of the set. If the pedal was already pressed, then
+    its data will be replaced, but it will keep its order
+    Parameters:
+    * note: note of the pressed pedal
+    * pedal_action: NOTE OFF PedalAction used to release the pedal
+    * velocity: velocity used to press the pedal
+    """
+    if self._pedals[note] == None:
+      self._notes[self._count] = note
+      self._count += 1
+    self._pedals[note] = (pedal_action, velocity)
+
+  def replace(self, note, pedal_action, velocity):
+    """
+    Replaces the data of a pressed pedal without changing its order
+    """
+    self._pedals[note] = (pedal_action, velocity)
+
+  def remove(self, note):
+    """
+    Removes a pedal from the set. Nothing will be done if it isn't pressed
+    """
+    if self._pedals[note] == None:
+      return
+    self._pedals[note] = None
+    notes = self._notes
+    note_index = 0
+    while notes[note_index] != note:
+      note_index += 1
+    self._count -= 1
+    while note_index < self._count:
+      notes[note_index] = notes[note_index + 1]
+      note_index += 1
+
+def get_digest(value):
+  """
+  Calculates a digest of the entered value, so that it can be compared with
+  the values of other configurations without keeping them in memory
+  Parameters:
+  * value: picklable object, ie: a node of the xml dict
+  Returns:
+  * A string with the hexadecimal digest
+  """
+  return hashlib.sha256(pickle.dumps(value, pickle.HIGHEST_PROTOCOL)). \
+           hexdigest()
+
 #Creates a logger for this module.
 logger = logging.getLogger(CustomLogger.get_module_name())
 
@@ -46,7 +177,7 @@ class MidiProcessor(MidiInputHandler):
   
   def __init__(self, xml_dict, midi_in, midi_out,
                ignore_sysex = True, ignore_timing = True,
-               ignore_active_sense = True):
+               ignore_active_sense = True, inject_events = False):
     """
     Calls the MidiInputHandler constructor and initializes the sub class
     attributes
@@ -56,23 +187,81 @@ class MidiProcessor(MidiInputHandler):
     * midi_in: MIDI IN interface to use
     * midi_out: MIDI OUT interface to use
     * ignore_* parameters: see the "_ignore_messages" method
+    * inject_events: whether or not the control commands will be sent with
+      send_control_command. See: MidiInputHandler.__init__
+    Remarks:
+    * The size and the overflow policy of the event queue are taken from the
+      "EventQueueSize" and "EventQueueOverflow" attributes of the xml_dict;
+      the SysEx settings from "MaxSysExSize" and "SysExStreaming"; and the
+      output rate limits from "OutputByteRate", "OutputBurstSize", and
+      "OutputMaxDelay"
     """
     self.__log.debug("Initializing MidiProcessor")
-    super().__init__(midi_in, midi_out, ignore_sysex, ignore_timing,
-                     ignore_active_sense)
+    #The xml dict must be set before calling the super constructor because
+    #the worker thread of the event queue may already use it
     self._xml_dict = xml_dict
-    self._quit = False
+    super().__init__(midi_in, midi_out, ignore_sysex = ignore_sysex,
+                     ignore_timing = ignore_timing,
+                     ignore_active_sense = ignore_active_sense,
+                     queue_size = xml_dict.get('@EventQueueSize', 0),
+                     overflow_policy = xml_dict.get('@EventQueueOverflow',
+                                                    'Block'),
+                     inject_events = inject_events,
+                     max_sysex_size = xml_dict.get('@MaxSysExSize',
+                                                   DEFAULT_MAX_SYSEX_SIZE),
+                     sysex_streaming = xml_dict.get('@SysExStreaming', False),
+                     output_byte_rate = self._get_output_byte_rates(xml_dict),
+                     output_burst_size = xml_dict.get('@OutputBurstSize',
+                                                      DEFAULT_BURST_SIZE),
+                     output_max_delay = xml_dict.get('@OutputMaxDelay',
+                                        DEFAULT_MAX_DELAY * 1000) / 1000.0)
+    #Set when the main loop must end, so that read_midi wakes up immediately
+    self._quit_event = threading.Event()
+    self._quit_time = None
+    self._reload_time = None
+    self._reload_handler = None
     self._status = None
     self._panic_command = []
     self._send_bank_names = "F0 7D 00 "
+    #Detects the bank list requests on the incoming SysEx chunks; like the
+    #SysEx buffers, there is one for each MIDI IN interface
+    self._bank_list_decoders = [BankListDecoder(decode_names = False)
+                                for sysex in self._sysex_buffers]
     self.__log.debug("MidiProcessor Initialized:\n%s",
                      PrettyFormat(self.__dict__))
 
-  def parse_xml(self):
-    """Parses the xml dict"""
+  @staticmethod
+  def _get_output_byte_rates(xml_dict):
+    """
+    Gets the byte rate of each output port
+    Parameters:
+    * xml_dict: dictionary with the parsed configuration file
+    Returns:
+    * A list with the byte rate of the OutPort followed by the ones of the
+      OutputPort nodes. The OutputPort nodes without "ByteRate" attribute
+      take the "OutputByteRate" of the controller
+    """
+    output_byte_rate = xml_dict.get('@OutputByteRate', 0)
+    return [output_byte_rate] + \
+           [output_port.get('@ByteRate', output_byte_rate)
+            for output_port in xml_dict.get('OutputPort', [])]
+
+  def parse_xml(self, previous_xml_dict = None):
+    """
+    Parses the xml dict
+    Parameters:
+    * previous_xml_dict: xml dict compiled by a previous call of parse_xml,
+      ie: before reloading the configuration. If given, then the banks that
+      didn't change will be taken from it instead of being compiled again
+    """
     self.__log.debug("Parsing xml file")
+    #The digest must be calculated before parsing; otherwise, it would change
+    #each time that the xml dict gets parsed
+    self._xml_dict['@ControllerDigest'] = get_digest(dict(
+      (key, value) for key, value in self._xml_dict.items()
+      if key not in ['Bank', 'Start', 'Stop', 'Panic']))
     self._current_bank = self._xml_dict['@InitialBank'] - 1
-    self._previous_pedals = {}
+    self._previous_pedals = HeldPedals()
     self.__log.info("Current Bank: %s", self._xml_dict['@InitialBank'])
     self._parse_out_channels('BassPedal', self._xml_dict)
     self._parse_out_channels('Chord', self._xml_dict)
@@ -87,11 +276,51 @@ class MidiProcessor(MidiInputHandler):
     #Internally midi channels begin with zero
     self._xml_dict['@InChannel'] -= 1
     self._parse_panic()
-    self._parse_banks()
+    self._parse_banks(previous_xml_dict)
+    self._compile_banks(previous_xml_dict)
+    self._parse_routing()
     self._parse_start_stop("Start")
     self._parse_start_stop("Stop")
     self.__log.debug("Got:\n%s", PrettyFormat(self._xml_dict))
 
+  def get_compiled_config(self):
+    """
+    Gets the configuration compiled by parse_xml, so that it can be cached
+    Returns:
+    * A dictionary with the following keys:
+      - xml_dict: the parsed and compiled xml dict
+      - panic_command: list with the messages of the panic command
+      - dependencies: list with other files used by the configuration, ie:
+        the panic file
+    """
+    dependencies = []
+    panic_node = self._xml_dict.get("Panic")
+    if (type(panic_node) == dict) and panic_node.get('@File'):
+      dependencies.append(panic_node['@File'])
+    return {
+      'xml_dict': self._xml_dict,
+      'panic_command': self._panic_command,
+      'dependencies': dependencies
+    }
+
+  def load_compiled_config(self, compiled_config):
+    """
+    Uses a configuration returned by get_compiled_config instead of parsing
+    the xml dict again
+    Parameters:
+    * compiled_config: dictionary returned by get_compiled_config
+    Remarks:
+    * The message pool can't be cached, so, it will be created again
+    """
+    self.__log.debug("Loading compiled configuration")
+    self._xml_dict = compiled_config['xml_dict']
+    self._panic_command = compiled_config['panic_command']
+    self._current_bank = self._xml_dict['@InitialBank'] - 1
+    self._previous_pedals = HeldPedals()
+    self.__log.info("Current Bank: %s", self._xml_dict['@InitialBank'])
+    self._pool_messages()
+    self.__log.debug("Compiled configuration was loaded")
+
   def _parse_out_channels(self, channel_name, current_node, parent_node = None):
     """
     Converts the string comma separated list channel numbers to a python list
@@ -189,47 +418,341 @@ class MidiProcessor(MidiInputHandler):
           raise Exception(message)
     return panic_command
 
-  def _parse_banks(self):
+  def _parse_routing(self):
+    """
+    Parses the Routing node and the additional output ports. The routes will
+    be stored in the xml_dict as follows:
+    * "@RouteTable": list with 256 elements, one per status byte, containing
+      tuples with the indexes of the output ports where the messages with that
+      status will be sent. The index zero is the port given by OutPort; the
+      OutputPort nodes follow in the same order as they were defined. If there
+      aren't additional output ports, then it will be None and all the
+      messages will be sent through OutPort
+    * "@EchoRoute": tuple with the indexes of the output ports for the echoed
+      messages
+    Remarks:
+    * The messages are routed by their MIDI channel: the channels used by the
+      bass pedal notes will be sent to the BassPedal outputs, the channels
+      used by the chord notes to the Chord outputs, and the other messages to
+      the default output port. Because of this, if bass pedal and chord notes
+      share a channel, then they must have the same outputs
+    """
+    self.__log.debug("Parsing routing")
+    output_names = [DEFAULT_OUTPUT_NAME]
+    for output_port in self._xml_dict.get("OutputPort", []):
+      if output_port['@Name'] in output_names:
+        raise Exception("The OutputPort name: %s was used twice" % \
+                        output_port['@Name'])
+      output_names.append(output_port['@Name'])
+    routing = self._xml_dict.get("Routing", {})
+
+    def get_route(route_name):
+      """Gets a tuple with the output indexes of the entered route"""
+      route = []
+      for output_name in routing.get('@' + route_name, [DEFAULT_OUTPUT_NAME]):
+        if output_name not in output_names:
+          raise Exception("The %s Routing has an unknown OutputPort: %s" % \
+                          (route_name, output_name))
+        route.append(output_names.index(output_name))
+      return tuple(route)
+
+    bass_pedal_route = get_route("BassPedal")
+    chord_route = get_route("Chord")
+    self._xml_dict["@EchoRoute"] = get_route("Echo")
+    if len(output_names) == 1:
+      self._xml_dict["@RouteTable"] = None
+      self.__log.debug("There aren't additional output ports")
+      return
+
+    channel_routes = [None] * 16
+    for bank in self._xml_dict['Bank']:
+      for pedal in bank["@PedalList"].values():
+        if pedal.get("@BassNote") != None:
+          for channel in pedal["@OutBassPedalChannel"]:
+            channel_routes[channel] = channel_routes[channel] or set()
+            channel_routes[channel].add(bass_pedal_route)
+        if pedal.get("@ChordNotes") != None:
+          for channel in pedal["@OutChordChannel"]:
+            channel_routes[channel] = channel_routes[channel] or set()
+            channel_routes[channel].add(chord_route)
+
+    default_route = (0,)
+    route_table = [default_route] * 256
+    for channel in range(16):
+      if channel_routes[channel] == None:
+        continue
+      if len(channel_routes[channel]) > 1:
+        raise Exception("The MIDI channel %d is used by bass pedal and chord "
+                        "notes with different Routings" % (channel + 1))
+      route = channel_routes[channel].pop()
+      for status in range(NOTE_OFF, SYSTEM_EXCLUSIVE, 0x10):
+        route_table[status | channel] = route
+    self._xml_dict["@RouteTable"] = route_table
+    self.__log.debug("Routing was parsed")
+
+  def _parse_banks(self, previous_xml_dict = None):
     """
     Parses the banks from the xml_dict
+    Parameters:
+    * previous_xml_dict: xml dict compiled before reloading the configuration.
+      The banks that didn't change will be taken from there
+    Remarks:
+    * The indexes of the parsed banks will be stored in: _rebuilt_banks
+    * Each bank will store the digest of its unparsed node in "@Digest", and
+      its name encoded for the bank list SysEx in "@NameSysEx" together with
+      the sum of its bytes in "@NameByteSum". This way, the SysEx can be put
+      together without encoding the names of the reused banks again
     """
     self.__log.debug("Parsing banks")
     bank_index = 0
     encoding = self._xml_dict.get("@Encoding")
     total_byte_sum = 0
     banks_sysex = [0xF0, 0x7D, 0x00]
-    for bank in self._xml_dict['Bank']:
-      self.__log.debug("Parsing bank: %d", bank_index)
-      bank_name = bank.get('@Name', None)
-      if bank_name in [None, '']:
-        bank_name = 'Bank' + str(bank_index)
-        bank["@Name"] = bank_name
-      
-      bank_name_bytes = convert_unicode_to_7_bit_bytes(bank_name, \
-                                                       encoding = encoding)
-      bank_name_sysex, bank_name_lengths, bank_name_sum = \
-        convert_byte_array_to_list(bank_name_bytes)
-      total_byte_sum += bank_name_sum
-      banks_sysex += bank_name_lengths + bank_name_sysex
-      self._parse_out_channels('BassPedal', bank, self._xml_dict)
-      self._parse_out_channels('Chord', bank, self._xml_dict)
-      self._parse_velocity_transpose("BassPedal", "Velocity", bank, 
-                                     self._xml_dict)
-      self._parse_velocity_transpose("Chord", "Velocity", bank, self._xml_dict)
-      self._parse_velocity_transpose("BassPedal", "Transpose", bank, 
-                                     self._xml_dict)
-      self._parse_velocity_transpose("Chord", "Transpose", bank, self._xml_dict)
-
-      self._parse_octave(bank, self._xml_dict)
-      self._parse_pedals(bank, bank_index)
-      self.__log.debug("Bank were parsed")
+    banks = self._xml_dict['Bank']
+    num_banks = len(banks)
+    previous_banks = []
+    if (previous_xml_dict != None) and \
+       (previous_xml_dict.get('@ControllerDigest') == \
+        self._xml_dict['@ControllerDigest']):
+      previous_banks = previous_xml_dict['Bank']
+    self._rebuilt_banks = []
+    for bank in banks:
+      uses_bank_select = False
+      for pedal in bank.get('Pedal', []):
+        if pedal.get('@BankSelect') != None:
+          uses_bank_select = True
+      #The parsed bank also depends on its index because of the default name
+      #and the relative bank selections; the number of banks is only needed if
+      #the bank has pedals selecting banks
+      bank_digest = get_digest((bank, bank_index,
+                                num_banks if uses_bank_select else None))
+      if (bank_index < len(previous_banks)) and \
+         (previous_banks[bank_index].get('@Digest') == bank_digest):
+        self.__log.debug("Reusing bank: %d", bank_index)
+        bank = previous_banks[bank_index]
+        banks[bank_index] = bank
+      else:
+        self.__log.debug("Parsing bank: %d", bank_index)
+        self._rebuilt_banks.append(bank_index)
+        bank_name = bank.get('@Name', None)
+        if bank_name in [None, '']:
+          bank_name = 'Bank' + str(bank_index)
+          bank["@Name"] = bank_name
+        
+        bank_name_bytes = convert_unicode_to_7_bit_bytes(bank_name, \
+                                                         encoding = encoding)
+        bank_name_sysex, bank_name_lengths, bank_name_sum = \
+          convert_byte_array_to_list(bank_name_bytes)
+        bank["@NameSysEx"] = bank_name_lengths + bank_name_sysex
+        bank["@NameByteSum"] = bank_name_sum
+        self._parse_out_channels('BassPedal', bank, self._xml_dict)
+        self._parse_out_channels('Chord', bank, self._xml_dict)
+        self._parse_velocity_transpose("BassPedal", "Velocity", bank, 
+                                       self._xml_dict)
+        self._parse_velocity_transpose("Chord", "Velocity", bank,
+                                       self._xml_dict)
+        self._parse_velocity_transpose("BassPedal", "Transpose", bank, 
+                                       self._xml_dict)
+        self._parse_velocity_transpose("Chord", "Transpose", bank,
+                                       self._xml_dict)
+
+        self._parse_octave(bank, self._xml_dict)
+        self._parse_pedals(bank, bank_index)
+        bank["@Digest"] = bank_digest
+        self.__log.debug("Bank were parsed")
+      total_byte_sum += bank["@NameByteSum"]
+      banks_sysex += bank["@NameSysEx"]
       bank_index += 1
       
     checksum = 128 - (total_byte_sum % 128)
     banks_sysex += [checksum, 0xF7]
     self._xml_dict["@BanksSysEx"] = banks_sysex
+    if previous_xml_dict != None:
+      self.__log.info("Banks reused: %d, rebuilt: %d",
+                      num_banks - len(self._rebuilt_banks),
+                      len(self._rebuilt_banks))
     self.__log.debug("Banks were parsed")
   
+  def _compile_banks(self, previous_xml_dict = None):
+    """
+    Compiles the parsed banks into action plans, which will be stored in the
+    "@BankPlans" list of the xml_dict
+    Parameters:
+    * previous_xml_dict: xml dict compiled before reloading the configuration.
+      The plans of the banks that weren't parsed again by _parse_banks will be
+      taken from there
+    Remarks:
+    * There will be a plan for each bank. Each plan is a dictionary with two
+      keys: NOTE_ON and NOTE_OFF; their values are lists with 128 elements,
+      one per MIDI note, which will contain either the PedalAction for the
+      note or None if there isn't a pedal for that note. This way, incomming
+      messages can be processed with one lookup.
+    * Identical messages and velocity table entries are shared between all
+      pedals, so, pedals with fixed velocities will use the same entry for
+      all the incomming velocities
+    """
+    self.__log.debug("Compiling banks")
+    bank_plans = []
+    compiled_values = {}
+    bank_index = 0
+    rebuilt_banks = set(self._rebuilt_banks)
+    for bank in self._xml_dict['Bank']:
+      if bank_index not in rebuilt_banks:
+        bank_plans.append(previous_xml_dict["@BankPlans"][bank_index])
+        bank_index += 1
+        continue
+      bank_plan = {NOTE_ON: [None] * 128, NOTE_OFF: [None] * 128}
+      for note, pedal in bank["@PedalList"].items():
+        message_list = pedal.get("@MessageList", {})
+        note_messages = pedal.get("@NoteMessages", {})
+        pedal_name = "Bank: %d, pedal note: %d" % (bank_index + 1, note)
+        note_off_action = PedalAction(
+          messages = tuple(message_list.get(NOTE_OFF, [])),
+          velocity_table = self._create_velocity_table(
+                             note_messages.get(NOTE_OFF, []), compiled_values,
+                             pedal_name + ", NOTE OFF"),
+          zero_velocity_messages = self._set_note_velocity(
+                                     note_messages.get(NOTE_OFF, []), 0,
+                                     compiled_values, True)[0],
+          bank_select = pedal.get("@BankSelect"),
+          send_panic = bool(pedal.get("@SendPanic")),
+          note_off_action = None
+        )
+        bank_plan[NOTE_ON][note] = PedalAction(
+          messages = tuple(message_list.get(NOTE_ON, [])),
+          velocity_table = self._create_velocity_table(
+                             note_messages.get(NOTE_ON, []), compiled_values,
+                             pedal_name + ", NOTE ON"),
+          zero_velocity_messages = self._set_note_velocity(
+                                     note_messages.get(NOTE_ON, []), 0,
+                                     compiled_values, True)[0],
+          bank_select = None,
+          send_panic = False,
+          note_off_action = note_off_action
+        )
+        bank_plan[NOTE_OFF][note] = note_off_action
+      bank_plans.append(bank_plan)
+      bank_index += 1
+    self._xml_dict["@BankPlans"] = bank_plans
+    self._pool_messages(self._rebuilt_banks)
+    self.__log.debug("Banks were compiled")
+
+  def _pool_messages(self, bank_indexes = None):
+    """
+    Stores all the static output messages in a MidiMessagePool and replaces
+    them by their memoryview slices. This includes: the pedal and chord notes,
+    the General MIDI and SysEx messages of the pedals, the panic command, which
+    will be stored in "@PanicCommand", and the "@BanksSysEx" message.
+    Parameters:
+    * bank_indexes: indexes of the banks to pool. If None, then all banks will
+      be pooled. The other banks will keep their messages, ie: banks reused
+      from a previous configuration, which already point to its pool
+    """
+    self.__log.debug("Creating message pool")
+    if bank_indexes == None:
+      bank_plans = self._xml_dict["@BankPlans"]
+    else:
+      bank_plans = [self._xml_dict["@BankPlans"][bank_index]
+                    for bank_index in bank_indexes]
+    message_pool = MidiMessagePool()
+    for bank_plan in bank_plans:
+      for pedal_action in bank_plan[NOTE_ON] + bank_plan[NOTE_OFF]:
+        if pedal_action != None:
+          for message in pedal_action.messages + \
+                         pedal_action.zero_velocity_messages:
+            message_pool.add(message)
+          for note_messages in set(pedal_action.velocity_table):
+            for message in note_messages:
+              message_pool.add(message)
+    for message in self._panic_command:
+      message_pool.add(message)
+    message_pool.add(self._xml_dict["@BanksSysEx"])
+    message_pool.freeze()
+
+    pooled_values = {}
+    pooled_tables = {}
+    def get_pooled_messages(messages):
+      """Gets a tuple with the memoryviews of the entered messages"""
+      messages = tuple(tuple(message) for message in messages)
+      pooled_messages = pooled_values.get(messages)
+      if pooled_messages == None:
+        pooled_messages = tuple(message_pool.get(message) \
+                                for message in messages)
+        pooled_values[messages] = pooled_messages
+      return pooled_messages
+
+    def get_pooled_action(pedal_action, note_off_action = None):
+      """Gets a copy of the entered PedalAction using pooled messages"""
+      velocity_table = pooled_tables.get(pedal_action.velocity_table)
+      if velocity_table == None:
+        velocity_table = tuple(get_pooled_messages(note_messages) \
+                               for note_messages in pedal_action.velocity_table)
+        pooled_tables[pedal_action.velocity_table] = velocity_table
+      return pedal_action._replace(
+        messages = get_pooled_messages(pedal_action.messages),
+        velocity_table = velocity_table,
+        zero_velocity_messages = get_pooled_messages(
+                                   pedal_action.zero_velocity_messages),
+        note_off_action = note_off_action
+      )
+
+    for bank_plan in bank_plans:
+      for note in range(128):
+        note_off_action = bank_plan[NOTE_OFF][note]
+        if note_off_action != None:
+          note_off_action = get_pooled_action(note_off_action)
+          bank_plan[NOTE_OFF][note] = note_off_action
+          bank_plan[NOTE_ON][note] = get_pooled_action(bank_plan[NOTE_ON][note],
+                                                       note_off_action)
+    self._xml_dict["@PanicCommand"] = get_pooled_messages(self._panic_command)
+    self._xml_dict["@BanksSysEx"] = message_pool.get(
+                                      self._xml_dict["@BanksSysEx"])
+    self.__log.debug("Message pool was created. Size: %d bytes",
+                     len(message_pool))
+
+  def _create_velocity_table(self, note_messages, compiled_values,
+                             pedal_name):
+    """
+    Creates a table with the note messages for each possible incomming
+    velocity
+    Parameters:
+    * note_messages: parsed NOTE_ON or NOTE_OFF messages of a pedal. The
+      velocity may be either a number or a relative string, ie: "+10"
+    * compiled_values: dictionary used to share identical messages and
+      table entries
+    * pedal_name: name of the pedal used on the log messages
+    Returns:
+    * A tuple with 128 elements, where the index is the incomming velocity and
+      the value is a tuple with the resulting note messages
+    Remarks:
+    * If some velocities need to be adjusted, then a message will be logged
+      here once instead of on each incomming note
+    """
+    velocity_table = []
+    min_adjusted = None
+    max_adjusted = None
+    for current_velocity in range(128):
+      new_note_messages, adjusted_velocity = self._set_note_velocity(
+        note_messages, current_velocity, compiled_values)
+      if (adjusted_velocity == 1) and (current_velocity > 0):
+        #An incomming velocity of zero is normally used to release notes, so,
+        #it won't be reported
+        min_adjusted = current_velocity
+      elif (adjusted_velocity == 127) and (max_adjusted == None):
+        max_adjusted = current_velocity
+      velocity_table.append(new_note_messages)
+
+    if min_adjusted != None:
+      self.__log.info("%s - Pedal velocity will be adjusted to 1 for incomming "
+                      "velocities until %d. Please increase the relative "
+                      "velocity", pedal_name, min_adjusted)
+    if max_adjusted != None:
+      self.__log.info("%s - Pedal velocity will be adjusted to 127 for "
+                      "incomming velocities from %d. Please decrease the "
+                      "relative velocity", pedal_name, max_adjusted)
+    velocity_table = tuple(velocity_table)
+    return compiled_values.setdefault(velocity_table, velocity_table)
+
   def _parse_pedals(self, parent_bank, bank_index):
     """
      Parses the pedals from the current bank
@@ -501,154 +1024,243 @@ class MidiProcessor(MidiInputHandler):
   def _send_midi_message(self, message):
     """
     Overrides the _send_midi_message method from MidiInputHandler.
+    Remarks:
+    * In order to avoid allocating memory on each event, the messages are
+      directly sent instead of being collected in a list first
     """
-    self.__log.debug("Processing MIDI message: %s", PrettyFormat(message))
-    messages = []
-    status = message[0] & 0xF0
-    channel = message[0] & 0x0F
-    is_controller_message = True
-    note_messages = []
-    bank_select_messages = []
-    midi_and_sysex_messages = []
-    panic_message = []
-    bank_select = None
-    current_velocity = None
-    if (self._xml_dict['@InChannel'] == channel):
-      current_bank = self._xml_dict['Bank'][self._current_bank]
-      process_bank_select = False
-      current_pedal = None
-      if status in [NOTE_ON, NOTE_OFF]:
-        self.__log.debug("NOTE message was sent to controller, checking if "
-                        "there is a pedal")
+    self.__log.debug("Processing MIDI message: %s", message)
+    xml_dict = self._xml_dict
+    if (xml_dict['@InChannel'] == message[0] & 0x0F):
+      status = message[0] & 0xF0
+      if (status == NOTE_ON) or (status == NOTE_OFF):
         current_note = message[1]
-        current_pedal = current_bank["@PedalList"].get(current_note)
-        if current_pedal != None:
+        current_velocity = message[2]
+        swapped_note_message = (current_velocity == 0) and \
+                               xml_dict["@MinVelocityNoteOff"]
+        if swapped_note_message:
+          status = NOTE_OFF
+        pedal_action = \
+          xml_dict["@BankPlans"][self._current_bank][status][current_note]
+        if pedal_action != None:
           self.__log.debug("Registered NOTE message was found, processing "
                            "actions")
-          swapped_note_message = False
-          current_velocity = message[2]
-          if (current_velocity == 0) and self._xml_dict["@MinVelocityNoteOff"]:
-            self.__log.debug("Swapping NOTE ON message with a zero velocity "
-                             "to a NOTE OFF message")
-            status = NOTE_OFF
-            swapped_note_message = True
-
-          note_messages, midi_and_sysex_messages, panic_message, bank_select = \
-            self._process_note_message(status, current_velocity,
-                                       swapped_note_message, current_pedal,
-                                       current_note)
-          process_bank_select = (bank_select != None)
-        else:
-          is_controller_message = False
-          self.__log.debug("Unregistered NOTE message, going to check MIDI "
-                           "echo")
+          self._event_class = PEDAL_NOTE_EVENT
+          if self._reload_time != None:
+            self._log_first_note_time()
+          self._process_note_message(message, status, current_velocity,
+                                     swapped_note_message, pedal_action,
+                                     current_note)
+          return
+        self.__log.debug("Unregistered NOTE message, going to check MIDI "
+                         "echo")
       elif status == CONTROL_CHANGE:
-        controller = message[1]
-        if controller == self._xml_dict["@BankSelectController"]:
-          process_bank_select = True
-        else:
-          is_controller_message = False
-          self.__log.debug("CONTROL CHANGE message detected, going to check "
-                           "MIDI echo")
-      if process_bank_select:
-        self.__log.debug("SelectBank message was detected, processing "
-                         "actions")
-        bank_select_messages = self._process_bank_select(message, bank_select)
-
-      messages.extend(midi_and_sysex_messages + note_messages + 
-                      bank_select_messages + panic_message)
+        if message[1] == xml_dict["@BankSelectController"]:
+          self.__log.debug("SelectBank message was detected, processing "
+                           "actions")
+          self._event_class = BANK_SELECT_EVENT
+          self._send_messages(self._process_bank_select(message, None))
+          return
+        self.__log.debug("CONTROL CHANGE message detected, going to check "
+                         "MIDI echo")
+      else:
+        #Other messages comming through the controller channel are swallowed
+        return
     else:
       self.__log.debug("Non controller message was catched, going to check "
                        "MIDI echo")
-      is_controller_message = False
 
-    if not is_controller_message and self._xml_dict["@MidiEcho"]:
-      self.__log.debug("Midi echo was enabled")
-      messages = [message]
-    elif not self._xml_dict["@MidiEcho"]:
+    if xml_dict["@MidiEcho"]:
+      self.__log.debug("Midi echo was enabled. Sending MIDI message: %s",
+                       message)
+      self._event_class = ECHO_EVENT
+      self._send_echo_message(message)
+    else:
       self.__log.debug("Midi echo is disabled. Message won't be sent")
 
-    for message in messages:
-      self.__log.debug("Sending MIDI message: %s", PrettyFormat(message))
-      self._midi_out.send_message(message)
+  def _is_echo_message(self, message):
+    """
+    Overrides the _is_echo_message method from MidiInputHandler.
+    Remarks:
+    * Channel messages that aren't comming through the controller channel and
+      system messages, excepting SysEx, are considered as echo messages. SysEx
+      messages and their chunks are never considered as echo; otherwise,
+      incomplete messages could be reassembled
+    """
+    status = message[0]
+    if status < SYSTEM_EXCLUSIVE:
+      if status < NOTE_OFF:
+        #SysEx chunk
+        return False
+      return self._xml_dict['@InChannel'] != status & 0x0F
+    return (status != SYSTEM_EXCLUSIVE) and (status != END_OF_EXCLUSIVE)
+
+  def _send_messages(self, messages):
+    """
+    Sends the entered messages through the MIDI OUT interface
+    Parameters:
+    * messages: iterable with the messages to send
+    Remarks:
+    * If there are several output ports, then each message will be sent to
+      the ports of its route. See: _parse_routing
+    """
+    route_table = self._xml_dict["@RouteTable"]
+    if route_table != None:
+      self._send_routed_messages(messages, route_table)
+      return
+    midi_out = self._midi_out
+    #A for loop isn't used here because it would allocate an iterator on each
+    #call; this method is called several times per event
+    message_index = 0
+    num_messages = len(messages)
+    while message_index < num_messages:
+      message = messages[message_index]
+      self.__log.debug("Sending MIDI message: %s", message)
+      midi_out.send_message(message)
+      message_index += 1
+
+  def _send_routed_messages(self, messages, route_table):
+    """
+    Sends each of the entered messages to the output ports of its route
+    Parameters:
+    * messages: iterable with the messages to send
+    * route_table: list with the output indexes for each status byte
+    """
+    message_index = 0
+    num_messages = len(messages)
+    while message_index < num_messages:
+      message = messages[message_index]
+      self.__log.debug("Sending MIDI message: %s", message)
+      self._send_to_outputs(message, route_table[message[0]])
+      message_index += 1
+
+  def _send_to_outputs(self, message, route):
+    """
+    Sends a message to several output ports
+    Parameters:
+    * message: message to send
+    * route: tuple with the indexes of the output ports
+    """
+    midi_outs = self._midi_outs
+    output_counts = self._output_counts
+    output_index = 0
+    num_outputs = len(route)
+    while output_index < num_outputs:
+      midi_outs[route[output_index]].send_message(message)
+      output_counts[route[output_index]] += 1
+      output_index += 1
+
+  def _send_echo_message(self, message):
+    """
+    Sends a message that is being echoed, ie: a message that wasn't processed
+    by the controller
+    Parameters:
+    * message: message to send
+    Remarks:
+    * On the outputs with byte rate, the echo messages have the lowest
+      priority. See: MidiOutputScheduler
+    """
+    echo_senders = self._echo_senders
+    if self._xml_dict["@RouteTable"] == None:
+      echo_senders[0](message)
+      return
+    route = self._xml_dict["@EchoRoute"]
+    output_counts = self._output_counts
+    output_index = 0
+    num_outputs = len(route)
+    while output_index < num_outputs:
+      echo_senders[route[output_index]](message)
+      output_counts[route[output_index]] += 1
+      output_index += 1
+
+  def _send_panic_command(self):
+    """
+    Sends the panic command to all the output ports, so that no note gets
+    stuck, no matter where it was sent
+    Remarks:
+    * According to the "PanicMode" attribute, NOTE OFF messages will be sent
+      for the sounding notes, the messages of the "Panic" node, or both
+    * On the outputs with byte rate, the panic command has the highest
+      priority. See: MidiOutputScheduler
+    """
+    panic_mode = self._xml_dict.get("@PanicMode", "Both")
+    if panic_mode != "Command":
+      self.__log.debug("Stopping the sounding notes:\n%s",
+                       PrettyFormat(self.get_active_notes()))
+      self.send_notes_off()
+    if panic_mode == "Smart":
+      return
+    panic_command = self._xml_dict["@PanicCommand"]
+    urgent_senders = self._urgent_senders
+    num_outputs = len(urgent_senders)
+    if self._xml_dict["@RouteTable"] == None:
+      num_outputs = min(num_outputs, 1)
+    output_counts = self._output_counts
+    for message in panic_command:
+      self.__log.debug("Sending MIDI message: %s", message)
+      for output_index in range(num_outputs):
+        urgent_senders[output_index](message)
+        output_counts[output_index] += 1
 
-  def _process_note_message(self, status, current_velocity, swapped_note_message, 
-                            current_pedal, current_note):
+  def _process_note_message(self, message, status, current_velocity,
+                            swapped_note_message, pedal_action, current_note):
     """
-    Proceses the note messages for the current pedal
+    Proceses and sends the note messages for the current pedal
     Parameters:
+    * message: last message catched by the controller
     * status: current MIDI status; either NOTE ON or NOTE OFF
     * current_velocity: current velocity of the catched note
     * swapped_note_message: inidicated if this was a NOTE ON message with a
       velocity of zero, which was changed to NOTE OFF. On this case, the
       velocity won't be adjusted
-    * current_pedal: current catched pedal
+    * pedal_action: compiled PedalAction of the current pedal for the given
+      status
     * current_note: current MIDI note
-    Returns a tuple with the following elements:
-    * Note messages to send: bass pedal and chord notes.
-    * Other MIDI messages to send: it contains first the General MIDI and
-      SysEx messages, and the the bass and chord notes of other pedals.
-    * Panic message if SendPanic is True.
-    * The last element is the BankSelect message to excecute; it can be:
-      - None: no BankSelect was found or it is not a NOTE OFF message
-      - 'Next': select the next bank
-      - 'Previous': select previous bank
-      - 'Last': select the last bank
-      - 'Quit': quit the controller software
-      - 'Reload': restart the controller; here the whole xml
-      - 'Reboot': reboots the computer or microcontroller running the software
-      - 'Shutdown': shutdowns the system
-      - 'List': sends a SysEx back with the bank names.
-      Those messages are always processed during NOTE OFF and after all other
-      messages.
-    """
-    note_messages = self._set_note_velocity(current_pedal, status,
-                                            current_velocity,
-                                            swapped_note_message)
-    messages = []
-    midi_and_sysex = current_pedal.get("@MessageList")
-    if (midi_and_sysex != None) and status in midi_and_sysex:
-      messages = midi_and_sysex[status]
-
+    Remarks:
+    * The messages will be sent in the following order:
+      - The General MIDI and SysEx messages of the pedal.
+      - The NOTE OFF messages of other pedals if PedalMonophony is set.
+      - The bass pedal and chord notes.
+      - The messages resulting of processing the BankSelect action. Those
+        messages are always processed during NOTE OFF and after all other
+        messages.
+      - Panic message if SendPanic is True.
+    """
+    if swapped_note_message:
+      note_messages = pedal_action.zero_velocity_messages
+    else:
+      note_messages = pedal_action.velocity_table[current_velocity]
+    self._send_messages(pedal_action.messages)
     if (len(note_messages) > 0):
+      previous_pedals = self._previous_pedals
       if (status == NOTE_ON):
         if self._xml_dict["@PedalMonophony"]:
           self.__log.debug("Only one pedal is allowed at the time, so, notes for "
                            "previous pedals will be muted")
           self.__log.debug("Sending NOTE OFF for previous pedals and then "
-                           "remove them:\n%s",
-                           PrettyFormat(self._previous_pedals))
-          pedal_list = list(self._previous_pedals.keys())
-          for pedal_index in pedal_list:
-            pedal = self._previous_pedals[pedal_index]['pedal']
-            messages.extend(self._set_note_velocity(pedal, NOTE_OFF,
-                                                    current_velocity, False))
-            self._previous_pedals.pop(pedal_index)
+                           "remove them: %s", previous_pedals)
+          while len(previous_pedals) > 0:
+            previous_note = previous_pedals.first()
+            previous_pedal = previous_pedals[previous_note][0]
+            previous_pedals.remove(previous_note)
+            self._send_messages(previous_pedal.velocity_table[current_velocity])
         self.__log.debug("Adding pedal to previous pedal list")
-        self._previous_pedals[current_note] = {
-          'pedal': current_pedal,
-          'velocity': current_velocity
-        }
-      else:
-        if current_note in self._previous_pedals:
-          self.__log.debug("Removing pedal from previous pedal list")
-          self._previous_pedals.pop(current_note)
-
-    panic_message = []
-    if status == NOTE_OFF:
-      panic_message = current_pedal.get("@PanicMessage", [])
-      if panic_message != []:
-        self.__log.debug("Panic message will be sent after processing messages")
-
-    bank_select = None
-    if status == NOTE_OFF:
-      #The BANK SELECT messages will be processed only on NOTE OFF
-      bank_select = current_pedal.get("@BankSelect")
-
-    self.__log.debug("Previous pedals after processing:\n%s",
-                     PrettyFormat(self._previous_pedals))
+        previous_pedals.add(current_note, pedal_action.note_off_action,
+                            current_velocity)
+      elif current_note in previous_pedals:
+        self.__log.debug("Removing pedal from previous pedal list")
+        previous_pedals.remove(current_note)
+    self._send_messages(note_messages)
+
+    if pedal_action.bank_select != None:
+      self._send_messages(self._process_bank_select(message,
+                                              pedal_action.bank_select))
+
+    if pedal_action.send_panic:
+      self.__log.debug("Sending panic message after processing messages")
+      self._send_panic_command()
 
-    return note_messages, messages, panic_message, bank_select
+    self.__log.debug("Previous pedals after processing: %s",
+                     self._previous_pedals)
 
   def _process_bank_select(self, message, bank_select):
     """
@@ -678,8 +1290,7 @@ class MidiProcessor(MidiInputHandler):
       elif bank_select == "List":
         messages = [self._xml_dict["@BanksSysEx"]]
       else:
-        self._quit = True
-        self._status = bank_select
+        self._quit_controller(bank_select)
     else:
       select_value = message[2]
       if select_value < 119:
@@ -690,6 +1301,7 @@ class MidiProcessor(MidiInputHandler):
       else:
         send_panic = False
         send_bank_list = False
+        quit_command = False
         num_banks = len(self._xml_dict["Bank"])
         if select_value == 119:
           messages = [self._xml_dict["@BanksSysEx"]]
@@ -702,13 +1314,13 @@ class MidiProcessor(MidiInputHandler):
           self._current_bank = num_banks - 1
         elif select_value == 123:
           send_panic = True
-          messages = self._panic_command
+          self._send_panic_command()
           self.__log.debug("Sending software Panic:\n%s", \
                            PrettyFormat(self._panic_command))
         else:
-          self._quit = True
-          self._status = BANK_SELECT_FUNCTIONS[select_value]
-        if not self._quit and not send_bank_list:
+          quit_command = True
+          self._quit_controller(BANK_SELECT_FUNCTIONS[select_value])
+        if not quit_command and not send_bank_list:
           if self._current_bank < 0:
             self._current_bank = num_banks - 1
           elif self._current_bank >= num_banks:
@@ -718,8 +1330,7 @@ class MidiProcessor(MidiInputHandler):
     if previous_bank != self._current_bank:
       on_bank_change = self._xml_dict.get("@OnBankChange")
       if on_bank_change != "ContinuePlayback":
-        current_bank = self._xml_dict['Bank'][self._current_bank]
-        pedal_list = current_bank["@PedalList"]
+        bank_plan = self._xml_dict["@BankPlans"][self._current_bank]
         self.__log.debug("Processing previous pedals for OnBankChange = %s" % \
                          on_bank_change)
         pedal_operation = "Stopping previous pedals playback"
@@ -727,62 +1338,58 @@ class MidiProcessor(MidiInputHandler):
           pedal_operation = "Replacing previous pedals according to current" + \
                             " bank"
         self.__log.debug(pedal_operation)
-        previous_pedals = list(self._previous_pedals.keys())
+        previous_pedals = self._previous_pedals.notes()
         for pedal_index in previous_pedals:
-          note_messages = []
-          pedal = self._previous_pedals[pedal_index]['pedal']
-          current_velocity = self._previous_pedals[pedal_index]['velocity']
+          note_messages = ()
+          pedal, current_velocity = self._previous_pedals[pedal_index]
           remove_pedal = False
           if on_bank_change == "StopPlayback":
             remove_pedal = True
           else:
             #QuickChange
-            new_pedal = pedal_list.get(pedal_index)
+            new_pedal = bank_plan[NOTE_ON][pedal_index]
             if (new_pedal == None):
               remove_pedal = True
             else:
               #Replace this pedal
-              self._previous_pedals[pedal_index]['pedal'] = new_pedal
-              self._previous_pedals[pedal_index]['velocity'] = current_velocity
-              #First NOTE_OFF messages for previous pedal will be sent
-              note_messages = self._set_note_velocity(pedal, NOTE_OFF,
-                                                      current_velocity, False)
-              #Then the NOTE_ON messages for the new pedal will be sent
-              note_messages.extend(self._set_note_velocity(new_pedal, NOTE_ON,
-                                                           current_velocity,
-                                                           False))
+              self._previous_pedals.replace(pedal_index,
+                                            new_pedal.note_off_action,
+                                            current_velocity)
+              #First NOTE_OFF messages for previous pedal will be sent, then
+              #the NOTE_ON messages for the new pedal
+              note_messages = pedal.velocity_table[current_velocity] + \
+                              new_pedal.velocity_table[current_velocity]
           if remove_pedal:
-            self._previous_pedals.pop(pedal_index)
-            note_messages = self._set_note_velocity(pedal, NOTE_OFF,
-                                                    current_velocity, False)
+            self._previous_pedals.remove(pedal_index)
+            note_messages = pedal.velocity_table[current_velocity]
           messages.extend(note_messages)
       self.__log.debug("Previous pedals after processing Bank Select:\n%s",
                        PrettyFormat(self._previous_pedals))
     return messages
 
-  def _set_note_velocity(self, pedal, message_type, current_velocity,
-                         swapped_note_message = False):
+  def _set_note_velocity(self, note_messages, current_velocity,
+                         compiled_values, swapped_note_message = False):
     """
-    Returns a list of NOTE_ON or NOTE_OFF messages with a modified velocity
+    Returns the NOTE_ON or NOTE_OFF messages with a modified velocity
     according to the values of: BassPedalVelocity, ChordVelocity, and
     current_velocity
     Parameters
-    * Pedal: pedal for which the messages will be modified
-    * message_type: it can be either NOTE_ON or NOTE_OFF
+    * note_messages: parsed NOTE_ON or NOTE_OFF messages of a pedal. The
+      velocity may be either a number or a relative string, ie: "+10"
     * current_velocity: note velocity comming from the pedal controller.
+    * compiled_values: dictionary used to share identical messages
     * swapped_note_message: indicates whether or not this a NOTE ON with a
       velocity of zero, which was changed to NOTE OFF. This is the only case
       where the velocity won't be changed and will be let as zero. Please note
       that for normal NOTE OFF message the velocity won't be always zero; some
       MIDI devices support NOTE OFF messages with a velocity.
+    Returns a tuple with:
+    * A tuple with the resulting note messages
+    * Either 1 or 127 if a velocity was adjusted to one of those values
+      because it was out of range; otherwise None
     """
-    self.__log.debug("Setting note velocity for message: %s", message_type)
-    note_messages = pedal.get("@NoteMessages")
-    if note_messages == None:
-      return []
-    
-    note_messages = note_messages[message_type]
     new_note_messages = []
+    adjusted_velocity = None
     for note_message in note_messages:
       note_velocity = note_message[2]
       if swapped_note_message:
@@ -793,33 +1400,68 @@ class MidiProcessor(MidiInputHandler):
         
         if note_velocity <= 0:
           note_velocity = 1
-          self.__log.info("Pedal velocity was justed to 1. Please increase the "
-                          "relative velocity")
+          adjusted_velocity = note_velocity
         elif note_velocity > 127:
           note_velocity = 127
-          self.__log.info("Pedal velocity was justed to 127. Please decrease the "
-                          "relative velocity")
-      new_note_message = note_message[:]
-      new_note_message[2] = note_velocity
-      new_note_messages.append(new_note_message)
-    return new_note_messages
+          adjusted_velocity = note_velocity
+      new_note_message = (note_message[0], note_message[1], note_velocity)
+      new_note_messages.append(compiled_values.setdefault(new_note_message,
+                                                          new_note_message))
+    new_note_messages = tuple(new_note_messages)
+    return compiled_values.setdefault(new_note_messages, new_note_messages), \
+           adjusted_velocity
 
   def _send_system_exclusive(self, message):
     """
     Overrides the _send_system_exclusive method from MidiInputHandler.
     """
-    self.__log.debug("Sending SysEx message: %s", PrettyFormat(message))
-    if not self._receive_sysex(message) and self._xml_dict["@MidiEcho"]:
+    if self.__log.isEnabledFor(logging.DEBUG):
+      self.__log.debug("Sending SysEx message: %s", format_sysex(message))
+    self._event_class = SYSEX_EVENT
+    result = self._receive_sysex(message)
+    bank_list_decoder = self._bank_list_decoders[self._input_index]
+    bank_list_decoder.feed(message)
+    if bank_list_decoder.get_operation() == BANK_LIST_REQUEST_OPERATION:
+      #Bank list requests are answered instead of being echoed
+      if bank_list_decoder.is_complete():
+        self._send_bank_list_pages(*bank_list_decoder.get_request())
+      return
+    if not self._xml_dict["@MidiEcho"]:
+      return
+    if self._sysex.is_streaming():
+      #Each chunk is echoed as soon as it arrives, so that big dumps don't
+      #wait to be complete nor get kept on memory
+      self._stream_sysex_chunk(message, self._send_echo_message)
+    elif result == SYSEX_COMPLETE:
       #This means that the end of the SysEx message (0xF7) was detected,
       #so, no further bytes will be received. Here the SysEx buffer will
-      #be sent and afterwards cleared
-      self._midi_out.send_message(self._sysex_buffer)
-      #Clears SysEx buffer
-      self._sysex_buffer = []
-      #Resets SysEx count to zero
-      self._sysex_chunk = 0
+      #be sent
+      self._send_echo_message(self._sysex.get_message())
     self.__log.debug("SysEx was sent")
 
+  def _send_bank_list_pages(self, first_bank, num_banks):
+    """
+    Sends the pages of the bank list with the requested bank names
+    Parameters:
+    * first_bank: zero based index of the first requested bank
+    * num_banks: number of requested banks. If zero, then all the banks
+      starting at first_bank will be sent
+    Remarks:
+    * Each page has its own checksum and only a few names, so, the receiver
+      can decode each page as soon as it arrives and other messages can be
+      sent between the pages. See: ByteUtilities.build_bank_list_pages
+    """
+    banks = self._xml_dict["Bank"]
+    last_bank = len(banks)
+    if num_banks != 0:
+      last_bank = min(first_bank + num_banks, last_bank)
+    encoded_names = [(bank["@NameSysEx"], bank["@NameByteSum"])
+                     for bank in banks[first_bank:last_bank]]
+    pages = build_bank_list_pages(encoded_names, first_bank)
+    self.__log.info("Sending the names of %d banks starting at bank %d on %d "
+                    "pages", len(encoded_names), first_bank + 1, len(pages))
+    self._send_messages(pages)
+
   def _process_start_stop_messages(self, node_name):
     """
     Sends the messages from the specified node
@@ -840,6 +1482,185 @@ class MidiProcessor(MidiInputHandler):
             self._send_system_exclusive(message_list[i])
     self.__log.debug("Messages were processed")
 
+  def _quit_controller(self, status):
+    """
+    Processes the commands that end the controller
+    Parameters:
+    * status: either: "Quit", "Reload", "Reboot", or "Shutdown"
+    Remarks:
+    * If a reload handler was set, then "Reload" won't end the controller;
+      the handler will be called instead, so that the configuration gets
+      reloaded while processing the MIDI messages
+    """
+    self._quit_time = time.perf_counter_ns()
+    if (status == "Reload") and (self._reload_handler != None):
+      self.__log.info("Reloading configuration")
+      self._reload_handler(self._quit_time)
+    else:
+      self.quit(status)
+
+  def quit(self, status):
+    """
+    Ends the main loop of the controller
+    Parameters:
+    * status: status that read_midi will return; either: "Quit", "Reload",
+      "Reboot", or "Shutdown"
+    """
+    self._status = status
+    self._quit_event.set()
+
+  def send_control_command(self, select_value):
+    """
+    Processes a control command as if the BankSelect message with the entered
+    value was received on the InChannel. This way, the commands sent by other
+    means than a MIDI port, ie: the ControlServer, run through the same code
+    as the MIDI ones
+    Parameters:
+    * select_value: value of the BankSelect message: from 0 to 118 selects
+      the bank with that index; the others are the commands from 119 to 127,
+      ie: 123 sends the panic command and 124 quits the controller
+    Returns:
+    * False if the event was discarded; otherwise True
+    Remarks:
+    * The MidiProcessor must have been created with inject_events set to True
+    """
+    return self.inject_event([CONTROL_CHANGE | self._xml_dict['@InChannel'],
+                              self._xml_dict['@BankSelectController'],
+                              select_value])
+
+  def get_current_bank(self):
+    """
+    Returns the index of the current bank starting from zero
+    """
+    return self._current_bank
+
+  def set_reload_handler(self, reload_handler):
+    """
+    Sets the function that will be called when the "Reload" command is
+    received
+    Parameters:
+    * reload_handler: function receiving the time when the command was
+      received. It must not block; the new configuration should be compiled on
+      another thread and then passed to swap_compiled_config. If None, then
+      the controller will end with the "Reload" status
+    """
+    self._reload_handler = reload_handler
+
+  def swap_compiled_config(self, compiled_config, reload_time = None):
+    """
+    Replaces the configuration in use by a new one. The replacement will be
+    done between two MIDI events without waiting for the next one, so, no
+    message will be processed with a partially replaced configuration. See:
+    run_before_next_event
+    Parameters:
+    * compiled_config: dictionary returned by get_compiled_config of a
+      MidiProcessor, which parsed the new configuration
+    * reload_time: time when the reload command was received. See:
+      set_reload_time
+    """
+    self.run_before_next_event(lambda: self._apply_compiled_config(
+                                         compiled_config, reload_time))
+
+  def _apply_compiled_config(self, compiled_config, reload_time):
+    """
+    Replaces the configuration in use by a new one
+    Parameters:
+    * compiled_config: dictionary returned by get_compiled_config
+    * reload_time: time when the reload command was received
+    Remarks:
+    * The current bank is kept; if the new configuration has less banks, then
+      the last one will be selected
+    * Pressed pedals keep sounding if their NOTE OFF messages didn't change;
+      otherwise, their old NOTE OFF messages will be sent, so that no note
+      gets stuck. The other sounding notes, ie: the echoed ones, will be also
+      stopped
+    """
+    self.__log.debug("Applying compiled configuration")
+    xml_dict = compiled_config['xml_dict']
+    num_banks = len(xml_dict['Bank'])
+    if self._current_bank >= num_banks:
+      self._current_bank = num_banks - 1
+      self.__log.info("Bank changed to: %d", self._current_bank + 1)
+    bank_plan = xml_dict["@BankPlans"][self._current_bank]
+    previous_pedals = self._previous_pedals
+    for note in previous_pedals.notes():
+      pedal, current_velocity = previous_pedals[note]
+      new_pedal = bank_plan[NOTE_OFF][note]
+      note_messages = pedal.velocity_table[current_velocity]
+      if (new_pedal != None) and \
+         (new_pedal.velocity_table[current_velocity] == note_messages):
+        previous_pedals.replace(note, new_pedal, current_velocity)
+      else:
+        previous_pedals.remove(note)
+        self._send_messages(note_messages)
+    self.send_notes_off(self._get_pedal_notes())
+
+    start_node = self._xml_dict.get("Start")
+    self._panic_command = compiled_config['panic_command']
+    self._xml_dict = xml_dict
+    if xml_dict.get("Start") != start_node:
+      self._process_start_stop_messages("Start")
+    self.__log.info("Configuration was reloaded")
+    self.set_reload_time(reload_time)
+
+  def _get_pedal_notes(self):
+    """
+    Gets the notes started by the pushed pedals
+    Returns:
+    * A list with an ActiveNotes object for each output port. The notes are
+      taken from the NOTE OFF messages of the pedals; they are on the output
+      ports of the route of their NOTE ON messages
+    """
+    active_notes = [ActiveNotes() for midi_out in self._midi_outs]
+    route_table = self._xml_dict["@RouteTable"]
+    previous_pedals = self._previous_pedals
+    for note in previous_pedals.notes():
+      pedal, current_velocity = previous_pedals[note]
+      for message in pedal.velocity_table[current_velocity]:
+        status = message[0] & 0xF0
+        if ((status != NOTE_OFF) and (status != NOTE_ON)) or \
+           (len(message) < 3):
+          continue
+        channel = message[0] & 0x0F
+        route = (0,)
+        if route_table != None:
+          route = route_table[NOTE_ON | channel]
+        for output_index in route:
+          if output_index < len(active_notes):
+            active_notes[output_index].add(channel, message[1])
+    return active_notes
+
+  def get_quit_time(self):
+    """
+    Returns the time in nanoseconds, taken with time.perf_counter_ns, when the
+    quit, reload, reboot, or shutdown command was received or None if it
+    hasn't been received
+    """
+    return self._quit_time
+
+  def set_reload_time(self, reload_time):
+    """
+    Sets the time when the reload command was received, so that the time
+    until the controller is ready and until the first pedal is played gets
+    logged
+    Parameters:
+    * reload_time: time in nanoseconds, taken with time.perf_counter_ns. If
+      None, then nothing will be logged
+    """
+    self._reload_time = reload_time
+    if reload_time != None:
+      self.__log.info("Reload to ready time: %.1f ms",
+                      (time.perf_counter_ns() - reload_time) / 1e6)
+
+  def _log_first_note_time(self):
+    """
+    Logs the time since the reload command was received until the first pedal
+    was played
+    """
+    self.__log.info("Reload to first note time: %.1f ms",
+                    (time.perf_counter_ns() - self._reload_time) / 1e6)
+    self._reload_time = None
+
   def read_midi(self):
     """
     Main program loop.
@@ -848,8 +1669,11 @@ class MidiProcessor(MidiInputHandler):
     self.__log.info("Press CTRL+C to finish")
     try:
       self._process_start_stop_messages("Start")
-      while True and not self._quit:
-        time.sleep(1)
+      #The timeout only makes sure that the keyboard interrupts are received
+      #on the operating systems where waiting can't be interrupted; quit wakes
+      #up the loop immediately
+      while not self._quit_event.wait(KEYBOARD_INTERRUPT_INTERVAL):
+        pass
       self._process_start_stop_messages("Stop")
       return self._status
     except KeyboardInterrupt:
@@ -0,0 +1,46 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# JMMidiBassPedalController v3.0
+# File: src/SchemaRegistry.py
+# By:   Josef Meile <jmeile@hotmail.com> @ 28.10.2020
+# This project is licensed under the MIT License. Please see the LICENSE.md file
+# on the main folder of this code. An online version can be found here:
+# https://github.com/jmeile/JMMidiBassPedalController/blob/master/LICENSE.md
+#
+"""Process wide registry of the parsed XSD schemas."""
+
+import os
+import threading
+
+#Parsed schemas. The keys are the absolute paths of the XSD files and the
+#values are tuples with the modification time of the file and the schema
+_schemas = {}
+
+#Makes sure that a schema is only built once if several threads request it
+_schemas_lock = threading.Lock()
+
+def get_xml_schema(xsd_file):
+  """
+  Gets the XMLSchema11 object for the entered XSD file. Building it is the most
+  expensive step when parsing the configuration, so, it will be only built the
+  first time that it is requested and then reused, ie: when reloading the
+  configuration
+  Parameters:
+  * xsd_file: path to the XSD file
+  Returns:
+  * The XMLSchema11 object
+  Remarks:
+  * If the XSD file was modified after building the schema, then it will be
+    built again
+  * xmlschema is only imported when the schema is built for the first time
+  """
+  xsd_path = os.path.abspath(xsd_file)
+  modification_time = os.path.getmtime(xsd_path)
+  with _schemas_lock:
+    cached_schema = _schemas.get(xsd_path)
+    if (cached_schema == None) or (cached_schema[0] != modification_time):
+      import xmlschema
+      cached_schema = (modification_time, xmlschema.XMLSchema11(xsd_path))
+      _schemas[xsd_path] = cached_schema
+    return cached_schema[1]
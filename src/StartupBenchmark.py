@@ -0,0 +1,180 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# JMMidiBassPedalController v3.0
+# File: src/StartupBenchmark.py
+# By:   Josef Meile <jmeile@hotmail.com> @ 28.10.2020
+# This project is licensed under the MIT License. Please see the LICENSE.md file
+# on the main folder of this code. An online version can be found here:
+# https://github.com/jmeile/JMMidiBassPedalController/blob/master/LICENSE.md
+#
+"""
+Helper script to check that the cold start of the foot controller doesn't
+regress.
+
+The main module gets imported several times on a new python interpreter with
+the "-X importtime" option. The median of its cumulative import time is then
+compared with a budget. Besides, the modules that are only needed to compile
+the configuration or to process the MIDI messages, ie: xmlschema and
+MidiProcessor, mustn't be imported at startup, so that listing the MIDI ports
+stays fast.
+
+The script exits with status 1 if the budget is exceeded or if any of those
+modules was imported; otherwise, with status 0.
+
+Run the script as follows:
+python StartupBenchmark.py -h
+
+There you will see the diferent command-line options supported by the script.
+"""
+
+from __future__ import print_function
+import argparse
+from argparse import ArgumentParser
+from argparse import RawTextHelpFormatter
+import os
+import subprocess
+import sys
+
+#Modules that mustn't be loaded when importing the main module
+LAZY_MODULES = ['xmlschema', 'MidiProcessor', 'MidiInputHandler',
+                'ConfigCache', 'ConfigWatcher', 'SchemaRegistry',
+                'ControllerHost', 'ControlServer', 'SysExReassembler',
+                'MidiOutputScheduler',
+                'rtmidi.midiconstants']
+
+class StartupBenchmarkArgumentParser(ArgumentParser):
+  """
+  ArgumentParser for the startup benchmark application
+
+  Remarks:
+  - The startup benchmark application will accept the following command line
+    options:
+    * --module: module to import.
+    * --runs: number of times that the module will be imported.
+    * --budget: maximum import time in milliseconds.
+    * --top: number of slowest modules to show.
+  """
+
+  def __init__(self, description = "Measures the import time of the foot "
+               "controller and fails if it exceeds\na budget"):
+    """
+    Setups the ArgumentParser of the startup benchmark program
+
+    Parameters:
+    * description: description of what the program is doing
+    """
+    self._parser = ArgumentParser(description = description,
+      formatter_class = RawTextHelpFormatter, add_help = False)
+
+  def add_arguments(self,
+                    main_help = "Shows this help message and exits",
+                    module_help = "Module to import. It defaults to: "
+                    "FootController",
+                    runs_help = "Number of times that the module will be "
+                    "imported. It defaults to 7",
+                    budget_help = "Maximum median import time in "
+                    "milliseconds. It defaults to 80",
+                    top_help = "Number of modules with the biggest import "
+                    "time to show. It\ndefaults to 10"):
+    """
+    Adds the command line options and commands to the argument parser
+
+    Parameters:
+    * main_help: text of the -h, --help option
+    * module_help: help of the "--module" command line option
+    * runs_help: help of the "--runs" command line option
+    * budget_help: help of the "--budget" command line option
+    * top_help: help of the "--top" command line option
+    """
+    self._parser.add_argument("-h", "--help", action = "help",
+      default = argparse.SUPPRESS, help = main_help)
+
+    self._parser.add_argument("-m", "--module", default = "FootController",
+                              help = module_help)
+    self._parser.add_argument("-r", "--runs", type = int, default = 7,
+                              help = runs_help)
+    self._parser.add_argument("-b", "--budget", type = float, default = 80,
+                              help = budget_help)
+    self._parser.add_argument("-t", "--top", type = int, default = 10,
+                              help = top_help)
+
+  def parse_arguments(self):
+    """
+    Validates the supplied command line options. It will show an error
+    message if the vaildation failed and then it will exit
+    """
+    return self._parser.parse_args()
+
+def measure_import(module_name):
+  """
+  Imports a module on a new python interpreter with "-X importtime"
+  Parameters:
+  * module_name: name of the module to import
+  Returns:
+  * A dictionary with the names of the imported modules as keys and tuples
+    with their own and their cumulative import time in microseconds as values
+  Remarks:
+  * Modules that were already imported by the interpreter when starting, ie:
+    by the site module, won't be included
+  """
+  process = subprocess.run([sys.executable, "-X", "importtime", "-c",
+                            "import " + module_name],
+                           stdout = subprocess.PIPE, stderr = subprocess.PIPE,
+                           universal_newlines = True,
+                           cwd = os.path.dirname(os.path.abspath(__file__)))
+  if process.returncode != 0:
+    raise Exception("Error while importing %s:\n%s" % (module_name,
+                    process.stderr))
+  import_times = {}
+  for line in process.stderr.splitlines():
+    if not line.startswith("import time:"):
+      continue
+    fields = line[len("import time:"):].split('|')
+    if not fields[0].strip().isdigit():
+      #Header line
+      continue
+    import_times[fields[2].strip()] = (int(fields[0]), int(fields[1]))
+  return import_times
+
+def get_median(values):
+  """
+  Returns the median of the entered list of numbers
+  """
+  values = sorted(values)
+  middle = len(values) // 2
+  if len(values) % 2 == 1:
+    return values[middle]
+  return (values[middle - 1] + values[middle]) / 2.0
+
+if __name__ == "__main__":
+  parser = StartupBenchmarkArgumentParser()
+  parser.add_arguments()
+  args = parser.parse_arguments()
+
+  runs = [measure_import(args.module) for run in range(args.runs)]
+  median_time = get_median([import_times[args.module][1] for import_times
+                            in runs]) / 1000.0
+  print("Import time of %s: %.1f ms (median of %d runs), budget: %.1f ms" % \
+        (args.module, median_time, args.runs, args.budget))
+
+  print("Slowest modules (own time of the last run):")
+  slowest_modules = sorted(runs[-1].items(), key = lambda item: item[1][0],
+                           reverse = True)[:args.top]
+  for module_name, (own_time, cumulative_time) in slowest_modules:
+    print("  %-30s %8.1f ms" % (module_name, own_time / 1000.0))
+
+  failed = False
+  loaded_modules = [module_name for module_name in LAZY_MODULES
+                    if module_name in runs[-1]]
+  if loaded_modules != []:
+    print("FAILED: modules that should be imported lazily were loaded: %s" % \
+          ', '.join(loaded_modules))
+    failed = True
+  if median_time > args.budget:
+    print("FAILED: the import time exceeds the budget by %.1f ms" % \
+          (median_time - args.budget))
+    failed = True
+  if failed:
+    sys.exit(1)
+  print("OK")
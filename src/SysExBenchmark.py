@@ -0,0 +1,275 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# JMMidiBassPedalController v3.0
+# File: src/SysExBenchmark.py
+# By:   Josef Meile <jmeile@hotmail.com> @ 28.10.2020
+# This project is licensed under the MIT License. Please see the LICENSE.md file
+# on the main folder of this code. An online version can be found here:
+# https://github.com/jmeile/JMMidiBassPedalController/blob/master/LICENSE.md
+#
+"""
+Helper script to measure how fast the MidiProcessor echoes SysEx dumps.
+
+No MIDI port is needed: the chunks of each dump are sent directly to the
+MidiProcessor callback and the echoed bytes are counted by a fake MIDI OUT
+interface.
+
+Dumps from 1 KiB until 1 MiB will be echoed with the SysEx messages being:
+* buffered: the whole dump is joined before echoing it.
+* streamed: each chunk is echoed as soon as it arrives (SysExStreaming). The
+  continuation chunks are sent in pieces of three bytes, so, the throughput is
+  lower; only the time until the first byte and the memory improve. With real
+  MIDI ports, this mode is only used on macOS (CoreMIDI).
+
+For each size and mode, the throughput, the time until the first byte gets
+echoed, and the peak of the allocated memory will be shown.
+
+With the --json option, the results will be also written as JSON, so that they
+can be compared between different versions or machines.
+
+Run the script as follows:
+python SysExBenchmark.py -h
+
+There you will see the diferent command-line options supported by the script.
+"""
+
+from __future__ import print_function
+import argparse
+from argparse import ArgumentParser
+from argparse import RawTextHelpFormatter
+import copy
+import json
+import platform
+import sys
+import time
+import tracemalloc
+import xmlschema
+from rtmidi.midiconstants import SYSTEM_EXCLUSIVE, END_OF_EXCLUSIVE
+from MidiBenchmark import FakeMidiIn, silence_console, schema_name
+from MidiProcessor import MidiProcessor
+
+#Sizes in bytes of the echoed dumps
+SYSEX_SIZES = [1024, 4096, 16384, 65536, 262144, 1048576]
+
+#Modes of the benchmark and the value of the SysExStreaming attribute
+MODES = {
+  'buffered': False,
+  'streamed': True
+}
+
+class ByteCountingMidiOut:
+  """
+  Replaces rtmidi.MidiOut. It counts the sent messages and bytes, and stores
+  the time when the first message was sent
+  """
+  def __init__(self):
+    self.sent_messages = 0
+    self.sent_bytes = 0
+    self.first_message_time = None
+
+  def send_message(self, message):
+    if self.first_message_time == None:
+      self.first_message_time = time.perf_counter_ns()
+    self.sent_messages += 1
+    self.sent_bytes += len(message)
+
+class SysExBenchmarkArgumentParser(ArgumentParser):
+  """
+  ArgumentParser for the SysEx benchmark application
+
+  Remarks:
+  - The SysEx benchmark application will accept the following command line
+    options:
+    * --config: XML configuration file to use.
+    * --chunk-size: size of the chunks of each dump.
+    * --runs: number of times that each dump will be echoed.
+    * --json: writes the results to a JSON file.
+  """
+
+  def __init__(self, description = "Measures the throughput of the SysEx "
+               "echo of the foot controller"):
+    """
+    Setups the ArgumentParser of the SysEx benchmark program
+
+    Parameters:
+    * description: description of what the program is doing
+    """
+    self._parser = ArgumentParser(description = description,
+      formatter_class = RawTextHelpFormatter, add_help = False)
+
+  def add_arguments(self,
+                    main_help = "Shows this help message and exits",
+                    config_help = "XML file to use. It defaults to: "
+                    "conf/sample-config.xml",
+                    chunk_size_help = "Size in bytes of the chunks of each "
+                    "dump. It defaults to 256,\nwhich is the size used by the "
+                    "ALSA sequencer",
+                    runs_help = "Number of times that each dump will be "
+                    "echoed. It defaults to 5",
+                    json_help = "Writes the results as JSON to the given "
+                    "file. Use '-' to write\nthem to the console"):
+    """
+    Adds the command line options and commands to the argument parser
+
+    Parameters:
+    * main_help: text of the -h, --help option
+    * config_help: help of the "--config" command line option
+    * chunk_size_help: help of the "--chunk-size" command line option
+    * runs_help: help of the "--runs" command line option
+    * json_help: help of the "--json" command line option
+    """
+    self._parser.add_argument("-h", "--help", action = "help",
+      default = argparse.SUPPRESS, help = main_help)
+
+    self._parser.add_argument("-c", "--config",
+                              default = "conf/sample-config.xml",
+                              help = config_help)
+    self._parser.add_argument("-s", "--chunk-size", type = int, default = 256,
+                              help = chunk_size_help)
+    self._parser.add_argument("-r", "--runs", type = int, default = 5,
+                              help = runs_help)
+    self._parser.add_argument("-j", "--json", help = json_help)
+
+  def parse_arguments(self):
+    """
+    Validates the supplied command line options. It will show an error
+    message if the vaildation failed and then it will exit
+    """
+    return self._parser.parse_args()
+
+def create_sysex_events(sysex_size, chunk_size):
+  """
+  Creates the chunks of a SysEx dump
+  Parameters:
+  * sysex_size: size of the dump in bytes
+  * chunk_size: size of the chunks in bytes
+  Returns:
+  * A list with MIDI events
+  """
+  sysex_message = [SYSTEM_EXCLUSIVE, 0x43] + \
+                  [index % 128 for index in range(sysex_size - 3)] + \
+                  [END_OF_EXCLUSIVE]
+  events = []
+  for index in range(0, sysex_size, chunk_size):
+    events.append((sysex_message[index:index + chunk_size], 0.0))
+  return events
+
+def echo_dump(callback, midi_out, events):
+  """
+  Sends the chunks of a dump to the MIDI callback
+  Parameters:
+  * callback: MIDI callback of the MidiProcessor
+  * midi_out: ByteCountingMidiOut of the MidiProcessor
+  * events: chunks of the dump
+  Returns:
+  * A tuple with the elapsed time and the time until the first byte was
+    echoed, both in nanoseconds
+  """
+  midi_out.first_message_time = None
+  start_time = time.perf_counter_ns()
+  for event in events:
+    callback(event)
+  end_time = time.perf_counter_ns()
+  return end_time - start_time, midi_out.first_message_time - start_time
+
+def run_mode(xml_dict, mode, sysex_size, chunk_size, runs):
+  """
+  Echoes a dump with the entered mode
+  Parameters:
+  * xml_dict: dictionary with the parsed configuration file. It won't be
+    modified
+  * mode: either 'buffered' or 'streamed'. See: MODES
+  * sysex_size: size of the dump in bytes
+  * chunk_size: size of the chunks in bytes
+  * runs: number of times that the dump will be echoed
+  Returns:
+  * A dictionary with the results
+  """
+  xml_dict = copy.deepcopy(xml_dict)
+  xml_dict['@MidiEcho'] = True
+  xml_dict['@SysExStreaming'] = MODES[mode]
+  #The dumps of this benchmark must never be discarded
+  xml_dict['@MaxSysExSize'] = max(SYSEX_SIZES)
+  midi_in = FakeMidiIn()
+  midi_out = ByteCountingMidiOut()
+  midi_processor = MidiProcessor(xml_dict, midi_in, midi_out,
+                                 ignore_sysex = False, ignore_timing = False,
+                                 ignore_active_sense = False)
+  midi_processor.parse_xml()
+  events = create_sysex_events(sysex_size, chunk_size)
+  callback = midi_in.callback
+
+  elapsed_times = []
+  first_byte_times = []
+  for run in range(runs):
+    elapsed_time, first_byte_time = echo_dump(callback, midi_out, events)
+    elapsed_times.append(elapsed_time)
+    first_byte_times.append(first_byte_time)
+  if midi_out.sent_bytes != sysex_size * runs:
+    raise Exception("%d bytes were echoed instead of %d" % \
+                    (midi_out.sent_bytes, sysex_size * runs))
+
+  tracemalloc.start()
+  echo_dump(callback, midi_out, events)
+  peak_memory = tracemalloc.get_traced_memory()[1]
+  tracemalloc.stop()
+
+  best_time = min(elapsed_times)
+  return {
+    'mode': mode,
+    'size': sysex_size,
+    'chunks': len(events),
+    'sent_messages': midi_out.sent_messages // (runs + 1),
+    'mib_per_sec': sysex_size / 1048576.0 * 1e9 / best_time,
+    'ms_per_dump': best_time / 1e6,
+    'ms_to_first_byte': min(first_byte_times) / 1e6,
+    'peak_memory_kib': peak_memory / 1024.0
+  }
+
+def print_result(result):
+  """
+  Prints the results of a mode
+  Parameters:
+  * result: dictionary returned by run_mode
+  """
+  print("  %-8s %8d bytes: %7.2f MiB/s, %9.3f ms/dump, first byte after "
+        "%8.3f ms, peak memory: %8.1f KiB, %d sent messages" % \
+        (result['mode'], result['size'], result['mib_per_sec'],
+         result['ms_per_dump'], result['ms_to_first_byte'],
+         result['peak_memory_kib'], result['sent_messages']))
+
+if __name__ == "__main__":
+  parser = SysExBenchmarkArgumentParser()
+  parser.add_arguments()
+  args = parser.parse_arguments()
+
+  silence_console()
+  MidiProcessor.set_quiet_mode(True)
+  xsd_schema = xmlschema.XMLSchema11(schema_name)
+  xml_dict = xsd_schema.to_dict(args.config)
+  print("Config: %s, chunk size: %d bytes" % (args.config, args.chunk_size))
+  results = []
+  for sysex_size in SYSEX_SIZES:
+    for mode in MODES:
+      result = run_mode(xml_dict, mode, sysex_size, args.chunk_size,
+                        args.runs)
+      print_result(result)
+      results.append(result)
+
+  if args.json != None:
+    report = {
+      'python': platform.python_version(),
+      'platform': platform.platform(),
+      'machine': platform.machine(),
+      'config': args.config,
+      'chunk_size': args.chunk_size,
+      'runs': args.runs,
+      'results': results
+    }
+    if args.json == '-':
+      json.dump(report, sys.stdout, indent = 2)
+      print()
+    else:
+      with open(args.json, 'w') as json_file:
+        json.dump(report, json_file, indent = 2)
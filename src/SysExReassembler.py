@@ -0,0 +1,153 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#
+# JMMidiBassPedalController v3.0
+# File: src/SysExReassembler.py
+# By:   Josef Meile <jmeile@hotmail.com> @ 28.10.2020
+# This project is licensed under the MIT License. Please see the LICENSE.md file
+# on the main folder of this code. An online version can be found here:
+# https://github.com/jmeile/JMMidiBassPedalController/blob/master/LICENSE.md
+#
+"""Joins the chunks of the SysEx messages received by the MIDI callback."""
+
+from rtmidi.midiconstants import END_OF_EXCLUSIVE
+
+#Default maximum size in bytes of a reassembled SysEx message. Style and voice
+#dumps of arranger keyboards may have several hundred KiB
+DEFAULT_MAX_SYSEX_SIZE = 1048576
+
+#Number of bytes of a SysEx message shown on the debug messages
+SYSEX_PREVIEW_SIZE = 32
+
+#Results of SysExReassembler.add
+SYSEX_INCOMPLETE = 0
+SYSEX_COMPLETE = 1
+SYSEX_DISCARDED = 2
+
+def format_sysex(message, preview_size = SYSEX_PREVIEW_SIZE):
+  """
+  Formats a SysEx message as hexadecimal bytes for the log messages. Only its
+  first bytes are formatted; the time needed to format a whole dump would
+  delay the next MIDI events
+  Parameters:
+  * message: sequence with the bytes of the message
+  * preview_size: maximum number of bytes to format
+  Returns:
+  * A string like: "[F0 43 10 ... F7] (1024 bytes)"
+  """
+  preview = ' '.join('%02X' % byte for byte in message[:preview_size])
+  if len(message) > preview_size:
+    preview += ' ...'
+    if message[-1] == END_OF_EXCLUSIVE:
+      preview += ' F7'
+  return "[%s] (%d bytes)" % (preview, len(message))
+
+class SysExReassembler:
+  """
+  Joins the chunks of a SysEx message on a bytearray. The message can be
+  either kept, so that it is sent once it is complete, or only tracked, so
+  that each chunk is forwarded as soon as it arrives (streaming mode)
+  Remarks:
+  * Messages bigger than the maximum size are discarded, so that a huge or
+    never ending dump can't use all the memory. The remaining chunks of a
+    discarded message are ignored until its end (0xF7). On streaming mode,
+    the size isn't limited since the chunks aren't kept
+  """
+
+  def __init__(self, max_size = DEFAULT_MAX_SYSEX_SIZE, streaming = False):
+    """
+    Initializes the class attributes
+    Parameters:
+    * max_size: maximum size in bytes of a message
+    * streaming: if True, then the chunks won't be kept on the buffer; only
+      the message size will be tracked
+    """
+    self._max_size = max_size
+    self._streaming = streaming
+    self._buffer = bytearray()
+    self._size = 0
+    self._chunks = 0
+    self._receiving = False
+    self._discarding = False
+    self.completed_messages = 0
+    self.discarded_messages = 0
+
+  def is_receiving(self):
+    """
+    Returns True if the beginning of a message was received, but not its end
+    """
+    return self._receiving
+
+  def is_streaming(self):
+    """
+    Returns True if the chunks aren't kept on the buffer
+    """
+    return self._streaming
+
+  def get_message(self):
+    """
+    Gets the reassembled message after add returned SYSEX_COMPLETE. It stays
+    valid until the next chunk is added
+    Returns:
+    * A bytearray with the message. It is empty on streaming mode
+    """
+    return self._buffer
+
+  def get_size(self):
+    """
+    Returns the number of bytes received so far of the current message
+    """
+    return self._size
+
+  def get_chunks(self):
+    """
+    Returns the number of chunks received so far of the current message
+    """
+    return self._chunks
+
+  def add(self, chunk):
+    """
+    Adds a chunk of a SysEx message
+    Parameters:
+    * chunk: sequence with the bytes of the chunk. The first chunk of each
+      message must start with 0xF0 and its last one must end with 0xF7
+    Returns:
+    * SYSEX_INCOMPLETE if the end of the message wasn't received yet,
+      SYSEX_COMPLETE if it was, or SYSEX_DISCARDED if the message was too big.
+      The last value is returned once, when the end of the discarded message
+      gets received
+    """
+    if not self._receiving:
+      #A new message begins; the buffer of the previous one is reused
+      self._receiving = True
+      self._discarding = False
+      self._size = 0
+      self._chunks = 0
+      del self._buffer[:]
+    self._chunks += 1
+    self._size += len(chunk)
+    if self._streaming or self._discarding:
+      pass
+    elif self._size > self._max_size:
+      self._discarding = True
+      del self._buffer[:]
+    else:
+      self._buffer.extend(chunk)
+    if chunk[-1] != END_OF_EXCLUSIVE:
+      return SYSEX_INCOMPLETE
+    self._receiving = False
+    if self._discarding:
+      self.discarded_messages += 1
+      return SYSEX_DISCARDED
+    self.completed_messages += 1
+    return SYSEX_COMPLETE
+
+  def reset(self):
+    """
+    Discards the message that is being received
+    """
+    self._receiving = False
+    self._discarding = False
+    self._size = 0
+    self._chunks = 0
+    del self._buffer[:]